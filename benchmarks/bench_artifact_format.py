@@ -0,0 +1,79 @@
+"""
+bench_artifact_format.py
+
+This script compares the CSV and Parquet artifact formats on synthetic minute-level stock data.
+For each format it measures the time to save and load the data, and the size of the file.
+
+Usage:
+    python benchmarks/bench_artifact_format.py [--rows <number_of_rows>] [--repeat <repeat>]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.utils import save_data, load_data
+
+
+def make_stock_data(rows, seed=42):
+    """
+    Generate synthetic minute-level stock data in the layout written by the ingestion step.
+
+    Parameters:
+        rows (int): Number of bars.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame: OHLCV data indexed by date.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.05, rows))
+    index = pd.date_range(start='2018-01-01 09:30', periods=rows, freq='min', name='Date')
+    return pd.DataFrame({'Open': close + rng.normal(0, 0.01, rows),
+                         'High': close + 0.1,
+                         'Low': close - 0.1,
+                         'Close': close,
+                         'Adj Close': close,
+                         'Volume': rng.integers(100, 10000, rows)}, index=index)
+
+
+def benchmark(df, file_format, directory, repeat):
+    """
+    Measure the best save and load times of a format.
+
+    Returns:
+        dict: Save time, load time (seconds) and file size (MB) of the format.
+    """
+    save_times, load_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        path = save_data(df, os.path.join(directory, 'data'), file_format)
+        save_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        load_data(path)
+        load_times.append(time.perf_counter() - start)
+
+    return {'format': file_format,
+            'save_s': round(min(save_times), 3),
+            'load_s': round(min(load_times), 3),
+            'size_mb': round(os.path.getsize(path) / 1e6, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, help="number of bars", default=1_000_000)
+    parser.add_argument("--repeat", type=int, help="number of repetitions", default=3)
+    args = parser.parse_args()
+
+    df = make_stock_data(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        results = pd.DataFrame([benchmark(df, file_format, directory, args.repeat) for file_format in ('csv', 'parquet')])
+    print(results.to_string(index=False))
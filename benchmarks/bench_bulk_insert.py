@@ -0,0 +1,123 @@
+"""
+bench_bulk_insert.py
+
+This script compares the two ways of writing predictions to PostgreSQL: `insert_df`, which converts
+each row to a tuple and sends them with `execute_values`, and `copy_df`, which streams CSV chunks
+with COPY ... FROM STDIN, also measured as an upsert on (date, ticker, model_used) through a staging
+table. The predictions are synthetic backfills of several tickers.
+
+The client-side serialization of the rows (quoted tuples or CSV chunks) is always measured. The
+database loads are measured in a scratch table, dropped afterwards, when a database URL is given by
+argument or by the DB_URL environment variable.
+
+Usage:
+    python benchmarks/bench_bulk_insert.py [--tickers <number_of_tickers>] [--days <days_per_ticker>]
+                                           [--database_url <url>]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import adapt
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.db_utils import DEFAULT_COPY_CHUNK_ROWS, PREDICTION_KEY, get_pool, insert_df, copy_df
+
+TABLE = 'bench_stocks_predictions'
+
+
+def make_predictions(tickers, days, seed=42):
+    """
+    Generate synthetic predictions in the layout of the predictions table.
+
+    Returns:
+        pd.DataFrame: One prediction per ticker and business day.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2000-01-03', periods=days).date
+    df = pd.DataFrame({'date': np.tile(dates, tickers),
+                       'ticker': np.repeat([f"T{ticker:04d}" for ticker in range(tickers)], days),
+                       'prediction': rng.integers(0, 2, tickers * days)})
+    df['feedback'] = np.where(rng.random(len(df)) < 0.5, np.nan, rng.integers(0, 2, len(df)))
+    df['model_used'] = 'trained_model:v1'
+    return df
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def serialize_values(df):
+    # Tuples of insert_df, quoted value by value as execute_values does before sending them
+    return [b'(' + b','.join(adapt(value).getquoted() for value in row) + b')'
+            for row in [tuple(x) for x in df.to_numpy()]]
+
+
+def serialize_csv(df):
+    for start in range(0, len(df), DEFAULT_COPY_CHUNK_ROWS):
+        buffer = io.StringIO()
+        df.iloc[start:start + DEFAULT_COPY_CHUNK_ROWS].to_csv(buffer, header=False, index=False)
+
+
+def load(pool, name, function, df, **kwargs):
+    """
+    Measure the load of the predictions into an empty table.
+    """
+    with pool.connection() as connection, connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {TABLE}")
+        connection.commit()
+    seconds, error = timed(function, pool, df, TABLE, **kwargs)
+    if error:
+        raise RuntimeError(f"{name} failed")
+    return {'mode': name, 'seconds': round(seconds, 3), 'rows_per_s': round(len(df) / seconds)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, help="number of tickers", default=500)
+    parser.add_argument("--days", type=int, help="number of days per ticker", default=2520)
+    parser.add_argument("--database_url", type=str, help="database url", default=os.environ.get("DB_URL"))
+    args = parser.parse_args()
+
+    df = make_predictions(args.tickers, args.days)
+    print(f"{len(df)} predictions")
+
+    values_seconds, _ = timed(serialize_values, df)
+    csv_seconds, _ = timed(serialize_csv, df)
+    print(pd.DataFrame([{'serialization': 'execute_values', 'seconds': round(values_seconds, 3)},
+                        {'serialization': 'csv_chunks', 'seconds': round(csv_seconds, 3)}]).to_string(index=False))
+
+    if not args.database_url:
+        print("No database URL, the database loads are not measured.")
+        sys.exit(0)
+
+    pool = get_pool(args.database_url)
+    with pool.connection() as connection, connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (date DATE, ticker VARCHAR(16), prediction NUMERIC, "
+                       f"feedback NUMERIC, model_used VARCHAR(50))")
+        connection.commit()
+    try:
+        results = [load(pool, 'execute_values', insert_df, df),
+                   load(pool, 'copy', copy_df, df),
+                   load(pool, 'copy_upsert', copy_df, df, upsert_key=PREDICTION_KEY)]
+        # Upsert of the same predictions into the full table, every row is updated
+        seconds, _ = timed(copy_df, pool, df, TABLE, upsert_key=PREDICTION_KEY)
+        results.append({'mode': 'copy_upsert_existing', 'seconds': round(seconds, 3),
+                        'rows_per_s': round(len(df) / seconds)})
+    finally:
+        with pool.connection() as connection, connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {TABLE}")
+            connection.commit()
+        pool.close()
+
+    results = pd.DataFrame(results)
+    results['speedup'] = (results['seconds'].iloc[0] / results['seconds']).round(2)
+    print(results.to_string(index=False))
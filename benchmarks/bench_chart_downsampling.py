@@ -0,0 +1,77 @@
+"""
+bench_chart_downsampling.py
+
+This script compares the data sent to the historical chart of the dashboard before and after its
+downsampling stage (see `src.visualization.downsample`), on synthetic daily or minute bars.
+
+Before, the whole history was resampled to a daily frequency, forward filled and sent to the
+chart. After, about one point per pixel of the chart width is selected in the visible window from
+the precomputed zoom levels. For each visible window, the script measures the time to prepare the
+data of the chart, the number of points and the size of the JSON payload of the chart.
+
+Usage:
+    python benchmarks/bench_chart_downsampling.py [--years <years>] [--freq <D|min>] [--width <pixels>]
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from src.visualization.downsample import ChartDownsampler
+
+
+def make_bars(years, freq, seed=42):
+    """
+    Generate synthetic bars of the trading days (and trading hours for minute bars).
+    """
+    days = pd.bdate_range(end='2024-01-01', periods=years * 252)
+    if freq == 'min':
+        index = (days.repeat(390) + pd.to_timedelta(np.tile(np.arange(390), len(days)) + 570, unit='min'))
+    else:
+        index = days
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, len(index)))
+    return pd.DataFrame({'Open': close, 'High': close + 0.1, 'Low': close - 0.1, 'Close': close,
+                         'Adj Close': close, 'Volume': rng.integers(100, 10000, len(index))},
+                        index=pd.DatetimeIndex(index, name='Date'))
+
+
+def measure(name, prepare):
+    start = time.perf_counter()
+    chart_data = prepare()
+    seconds = time.perf_counter() - start
+    payload = chart_data.to_json(orient='records', date_format='iso')
+    return {'mode': name, 'prepare_ms': round(1000 * seconds, 1), 'points': len(chart_data),
+            'payload_kb': round(len(payload) / 1024, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, help="years of history", default=20)
+    parser.add_argument("--freq", type=str, help="frequency of the bars, D or min", default='min')
+    parser.add_argument("--width", type=int, help="width of the chart in pixels", default=800)
+    args = parser.parse_args()
+
+    data = make_bars(args.years, args.freq)
+    print(f"{len(data)} bars")
+
+    start = time.perf_counter()
+    downsampler = ChartDownsampler(data.index, data['Adj Close'])
+    print(f"Zoom levels of {[len(level) for level in downsampler.levels]} points built in "
+          f"{time.perf_counter() - start:.2f}s")
+
+    results = [measure('before_full', lambda: data.resample('D').ffill().reset_index())]
+    end = data.index[-1]
+    for label, offset in [('full', None), ('1y', pd.DateOffset(years=1)), ('1m', pd.DateOffset(months=1))]:
+        window_start = None if offset is None else end - offset
+        results.append(measure(f'after_{label}', lambda: data.iloc[
+            downsampler.window_indices(window_start, end, args.width)].reset_index()))
+    results.append(measure('after_1m_cached', lambda: data.iloc[
+        downsampler.window_indices(end - pd.DateOffset(months=1), end, args.width)].reset_index()))
+    print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,105 @@
+"""
+bench_dashboard_data.py
+
+This script measures the time spent retrieving market data by the page renders of the dashboard,
+before and after its cached data layer (see `src.visualization.market_data`).
+
+Before, a render downloaded the history of the ticker for the chart and downloaded it again for
+today's details, which were displayed in two tabs. After, the renders read the cached history of
+`MarketData`, which is refreshed once its TTL has expired, by fetching only the bars from the last
+cached day. The price source reads synthetic daily bars from CSV files and waits `--latency_ms`
+per request to stand for the network round trip of Yahoo Finance.
+
+Usage:
+    python benchmarks/bench_dashboard_data.py [--renders <renders>] [--years <years_of_history>]
+                                              [--latency_ms <ms>] [--ttl <seconds>]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from src.data_ingestion.price_sources import LocalPriceSource
+from src.visualization.market_data import MarketData
+
+
+class SlowPriceSource(LocalPriceSource):
+    """
+    Local price source waiting a fixed latency per request.
+    """
+
+    def __init__(self, directory, latency):
+        super().__init__(directory)
+        self.latency = latency
+
+    def fetch(self, stock_name, start_date, end_date):
+        time.sleep(self.latency)
+        return super().fetch(stock_name, start_date, end_date)
+
+
+def render_before(source, start_date, end_date):
+    # History of the chart, and today's details displayed in the Data and Global Performance tabs
+    history = source.fetch('AAPL', start_date, end_date)
+    for _ in range(2):
+        source.fetch('AAPL', '1900-01-01', end_date).iloc[-1]
+    return history
+
+
+def render_after(market_data):
+    history = market_data.history('AAPL')
+    market_data.latest('AAPL')
+    return history
+
+
+def benchmark(name, render, renders, clock, ttl):
+    """
+    Measure the data time of consecutive renders, spread over two TTL periods.
+
+    Returns:
+        dict: Mean and maximum data time of a render in milliseconds.
+    """
+    times = []
+    for index in range(renders):
+        # Half of the renders happen after the cache has expired
+        clock[0] = index * 2 * ttl / renders
+        start = time.perf_counter()
+        render()
+        times.append(time.perf_counter() - start)
+    return {'mode': name, 'mean_ms': round(1000 * np.mean(times), 1), 'max_ms': round(1000 * np.max(times), 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renders", type=int, help="number of page renders", default=20)
+    parser.add_argument("--years", type=int, help="years of daily history", default=20)
+    parser.add_argument("--latency_ms", type=float, help="latency of a price source request in ms", default=150)
+    parser.add_argument("--ttl", type=float, help="TTL of the cached bars in seconds", default=300)
+    args = parser.parse_args()
+
+    days = args.years * 252
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=days, name='Date')
+    close = 100 + np.cumsum(np.random.default_rng(42).normal(0, 1, days))
+    bars = pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close, 'Adj Close': close,
+                         'Volume': np.full(days, 1000)}, index=index)
+    start_date = index[0].strftime('%Y-%m-%d')
+    end_date = (index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+    with tempfile.TemporaryDirectory() as directory:
+        bars.to_csv(os.path.join(directory, 'AAPL.csv'))
+        source = SlowPriceSource(directory, args.latency_ms / 1000)
+        clock = [0.0]
+        market_data = MarketData(source, start_date=start_date, ttl=args.ttl, clock=lambda: clock[0])
+
+        results = pd.DataFrame([
+            benchmark('before', lambda: render_before(source, start_date, end_date), args.renders, clock, args.ttl),
+            benchmark('after', lambda: render_after(market_data), args.renders, clock, args.ttl)])
+    results['speedup'] = (results['mean_ms'].iloc[0] / results['mean_ms']).round(1)
+    print(results.to_string(index=False))
+    print(f"Requests to the price source after: {market_data.fetches} for {args.renders} renders")
@@ -0,0 +1,107 @@
+"""
+bench_data_cleaning.py
+
+This script compares the cleaning of a multi-ticker panel of synthetic daily bars before and after
+the single-pass cleaning engine (see `src.data_cleaning.cleaning_engine`).
+
+Before, `clean_data` interpolated each column of each ticker by position, one ticker at a time
+(as the backtest and the batch training did). After, one time-aware pass interpolates all the
+columns of all the tickers and checks the gaps, outliers and OHLC consistency of the bars, in
+memory, or streamed from a CSV file to the cleaned file by chunks of `--chunk_rows` rows
+(`clean_file`, the time includes reading and writing the files). The script measures the time and
+the peak memory of the cleaning in a child process per mode.
+
+Usage:
+    python benchmarks/bench_data_cleaning.py [--tickers <tickers>] [--years <years>] [--chunk_rows <rows>]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+COLUMNS = ['open', 'high', 'low', 'close', 'adj_close', 'volume']
+
+
+def make_panel(tickers, years, missing=0.02, seed=42):
+    """
+    Generate the bars of the trading days of several tickers, indexed by (symbol, date), with missing values.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2024-01-01', periods=years * 252)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (tickers, len(dates))), axis=1)).ravel()
+    panel = pd.DataFrame({'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close,
+                          'adj_close': close, 'volume': rng.integers(100, 10000, len(close)).astype(float)},
+                         index=pd.MultiIndex.from_product([[f'T{i}' for i in range(tickers)], dates],
+                                                          names=['symbol', 'date']))
+    values = panel.to_numpy()
+    values[rng.random(values.shape) < missing] = np.nan
+    return pd.DataFrame(values, index=panel.index, columns=panel.columns)
+
+
+def clean_before(df):
+    # Previous clean_data, per ticker
+    cleaned = []
+    for _, bars in df.groupby(level='symbol'):
+        for column in COLUMNS:
+            bars[column] = bars[column].interpolate(method='linear', limit_direction='both')
+        cleaned.append(bars)
+    return pd.concat(cleaned)
+
+
+def peak_rss_mb():
+    # High water mark of this process (ru_maxrss is inherited across exec on Linux)
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+
+def run_child(mode, args, csv_path):
+    output = subprocess.run([sys.executable, __file__, '--child', mode, '--tickers', str(args.tickers),
+                             '--years', str(args.years), '--chunk_rows', str(args.chunk_rows), '--csv_path', csv_path],
+                            check=True, capture_output=True, text=True).stdout
+    seconds, rss, issues = output.split()[-3:]
+    return {'mode': mode, 'seconds': float(seconds), 'peak_rss_mb': float(rss), 'issues': int(issues)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, help="number of tickers", default=200)
+    parser.add_argument("--years", type=int, help="years of daily bars per ticker", default=20)
+    parser.add_argument("--chunk_rows", type=int, help="rows per chunk of the chunked mode", default=100000)
+    parser.add_argument("--child", type=str, help=argparse.SUPPRESS, default=None)
+    parser.add_argument("--csv_path", type=str, help=argparse.SUPPRESS, default=None)
+    args = parser.parse_args()
+
+    if args.child == 'after_streamed':
+        from src.data_cleaning.data_cleaning import clean_file
+        start = time.perf_counter()
+        _, counts = clean_file(args.csv_path, args.csv_path + '.cleaned.csv', args.chunk_rows)
+        print(time.perf_counter() - start, peak_rss_mb(), counts.sum())
+    elif args.child:
+        from src.data_cleaning.data_cleaning import clean_data
+        panel = make_panel(args.tickers, args.years)
+        start = time.perf_counter()
+        if args.child == 'before':
+            clean_before(panel)
+            issues = 0
+        else:
+            _, report = clean_data(panel, return_report=True)
+            issues = len(report)
+        print(time.perf_counter() - start, peak_rss_mb(), issues)
+    else:
+        print(f"{args.tickers} tickers x {args.years * 252} bars")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Panel file with symbol and date columns, sorted by symbol and date
+            csv_path = os.path.join(tmp_dir, 'panel.csv')
+            make_panel(args.tickers, args.years).reset_index().to_csv(csv_path, index=False)
+            results = pd.DataFrame([run_child(mode, args, csv_path) for mode in ('before', 'after', 'after_streamed')])
+        print(results.to_string(index=False))
@@ -0,0 +1,59 @@
+"""
+bench_feature_engine.py
+
+This script compares the fused feature engine with the FeatureUnion of the per-indicator extractors
+on synthetic minute-level stock data. It measures the best transform time of each, and checks that
+they produce the same features.
+
+Usage:
+    python benchmarks/bench_feature_engine.py [--rows <number_of_rows>] [--repeat <repeat>]
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import FeatureUnion
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from benchmarks.bench_artifact_format import make_stock_data
+from src.feature_engineering.feature_engineering import (RSIFeatureExtractor, ADLFeatureExtractor, OBVFeatureExtractor,
+                                                         MACDFeatureExtractor, FusedFeatureExtractor)
+
+
+def benchmark(name, transformer, df, repeat):
+    """
+    Measure the best transform time of a transformer.
+
+    Returns:
+        tuple: The timing results and the transformed features.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        features = transformer.transform(df)
+        times.append(time.perf_counter() - start)
+    return {'transformer': name, 'transform_s': round(min(times), 3)}, features
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, help="number of bars", default=1_000_000)
+    parser.add_argument("--repeat", type=int, help="number of repetitions", default=3)
+    args = parser.parse_args()
+
+    # Same layout as the cleaned data
+    df = make_stock_data(args.rows).rename(columns=lambda column: column.lower().replace(' ', '_'))
+    feature_union = FeatureUnion([('rsi', RSIFeatureExtractor()), ('adl', ADLFeatureExtractor()),
+                                  ('obv', OBVFeatureExtractor()), ('macd', MACDFeatureExtractor())])
+
+    union_results, expected = benchmark('feature_union', feature_union, df, args.repeat)
+    fused_results, features = benchmark('fused', FusedFeatureExtractor(), df, args.repeat)
+    results = pd.DataFrame([union_results, fused_results])
+    results['speedup'] = (results['transform_s'].iloc[0] / results['transform_s']).round(1)
+    print(results.to_string(index=False))
+    print("Identical features (float32):", np.array_equal(features, expected.astype(np.float32), equal_nan=True))
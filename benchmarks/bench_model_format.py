@@ -0,0 +1,103 @@
+"""
+bench_model_format.py
+
+This script compares the MLflow model of a trained pipeline (pickle of the scikit-learn objects)
+with its export to the native XGBoost format and feature manifest (see `src.training.export`).
+Each format is loaded in a fresh interpreter, which measures the time to import the modules and
+load the model, the time of the first prediction, the peak memory of the process (Linux) and the
+modules it imported. The size of the files on disk is also reported.
+
+Usage:
+    python benchmarks/bench_model_format.py [--rows <training_rows>] [--n_estimators <trees>] [--repeat <repeat>]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import pandas as pd
+import mlflow
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from benchmarks.bench_artifact_format import make_stock_data
+from src.feature_engineering.feature_engineering import build_feature_pipeline
+from src.training.train import train_pipeline
+from src.training.export import export_pipeline
+
+# Code run in a fresh interpreter to load a model and predict the last 1000 bars of the data
+LOADERS = {
+    'mlflow': "import mlflow\nmodel = mlflow.sklearn.load_model(PATH)",
+    'native': "from src.prediction.lite_model import load_lite_pipeline\nmodel = load_lite_pipeline(PATH)",
+}
+SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+PATH = {path!r}
+{loader}
+load_seconds = time.perf_counter() - start
+import pandas as pd
+df = pd.read_parquet({data!r})
+start = time.perf_counter()
+model.predict(df)
+predict_seconds = time.perf_counter() - start
+# Peak resident memory of this process (ru_maxrss keeps the peak of the parent process across exec)
+with open('/proc/self/status') as fp:
+    peak_kb = int(next(line for line in fp if line.startswith('VmHWM')).split()[1])
+print(json.dumps({{'load_s': round(load_seconds, 3), 'first_predict_s': round(predict_seconds, 4),
+                  'peak_rss_mb': round(peak_kb / 1024, 1),
+                  'mlflow': 'mlflow' in sys.modules, 'wandb': 'wandb' in sys.modules,
+                  'pandas_ta': 'pandas_ta' in sys.modules}}))
+"""
+
+
+def directory_size(path):
+    """
+    Return the size of the files of a directory in KB.
+    """
+    return round(sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path)
+                     for name in names) / 1024, 1)
+
+
+def benchmark(name, path, data_path, repeat):
+    """
+    Measure the load of a model format in fresh interpreters, keeping the fastest run.
+
+    Returns:
+        dict: Load and first prediction times (seconds), peak memory (MB) and imported modules.
+    """
+    script = SCRIPT.format(path=path, data=data_path, loader=LOADERS[name])
+    runs = [json.loads(subprocess.run([sys.executable, '-c', script], cwd=parent_dir, capture_output=True,
+                                      text=True, check=True).stdout.strip().splitlines()[-1])
+            for _ in range(repeat)]
+    return dict(min(runs, key=lambda run: run['load_s']), format=name, size_kb=directory_size(path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, help="number of training bars", default=20000)
+    parser.add_argument("--n_estimators", type=int, help="number of trees", default=300)
+    parser.add_argument("--repeat", type=int, help="number of runs per format", default=3)
+    args = parser.parse_args()
+
+    # Same layout as the cleaned data
+    data = make_stock_data(args.rows).rename(columns=lambda column: column.lower().replace(' ', '_'))
+    data = data.reset_index(drop=True)
+    pipeline, _, _ = train_pipeline(data.copy(), build_feature_pipeline(), 0.8, {'n_estimators': args.n_estimators})
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = os.path.join(directory, 'data.parquet')
+        data.iloc[-1000:].to_parquet(data_path)
+        mlflow_path = os.path.join(directory, 'mlflow')
+        mlflow.sklearn.save_model(pipeline, mlflow_path)
+        native_path = os.path.join(directory, 'native')
+        export_pipeline(pipeline, native_path)
+
+        results = pd.DataFrame([benchmark('mlflow', mlflow_path, data_path, args.repeat),
+                                benchmark('native', native_path, data_path, args.repeat)])
+    results = results[['format', 'load_s', 'first_predict_s', 'peak_rss_mb', 'size_kb', 'mlflow', 'wandb', 'pandas_ta']]
+    results['load_speedup'] = (results['load_s'].iloc[0] / results['load_s']).round(2)
+    print(results.to_string(index=False))
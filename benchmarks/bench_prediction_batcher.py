@@ -0,0 +1,76 @@
+"""
+bench_prediction_batcher.py
+
+This script compares the throughput of next-day predictions requested concurrently for many tickers,
+when each request calls the full pipeline on its own and when the requests go through the
+micro-batcher of the prediction step. The pipeline is the feature engineering pipeline of the
+project followed by an XGBoost classifier trained on synthetic data.
+
+Usage:
+    python benchmarks/bench_prediction_batcher.py [--tickers <number_of_tickers>] [--rows <rows_per_ticker>]
+                                                  [--threads <client_threads>] [--max_batch_size <size>]
+                                                  [--max_wait_ms <ms>]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import xgboost as xgb
+from sklearn.pipeline import Pipeline
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from benchmarks.bench_artifact_format import make_stock_data
+from src.feature_engineering.feature_engineering import build_feature_pipeline
+from src.prediction.predict import PredictionBatcher
+
+
+def benchmark(name, predict, requests, threads):
+    """
+    Measure the throughput of concurrent prediction requests.
+
+    Returns:
+        tuple: The timing results and the predictions.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        predictions = list(pool.map(lambda df: predict(df), requests))
+    seconds = time.perf_counter() - start
+    return {'mode': name, 'seconds': round(seconds, 3), 'requests_per_s': round(len(requests) / seconds, 1)}, predictions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, help="number of tickers", default=500)
+    parser.add_argument("--rows", type=int, help="number of bars per ticker", default=300)
+    parser.add_argument("--threads", type=int, help="number of client threads", default=32)
+    parser.add_argument("--max_batch_size", type=int, help="maximum batch size", default=64)
+    parser.add_argument("--max_wait_ms", type=float, help="maximum wait of a request in ms", default=5)
+    args = parser.parse_args()
+
+    # Same layout as the cleaned data
+    data = make_stock_data(args.rows * args.tickers).rename(columns=lambda column: column.lower().replace(' ', '_'))
+    requests = [data.iloc[ticker * args.rows:(ticker + 1) * args.rows].reset_index(drop=True)
+                for ticker in range(args.tickers)]
+    feature_engineering = build_feature_pipeline()
+    train = requests[0]
+    model = xgb.XGBClassifier(n_estimators=100).fit(feature_engineering.transform(train),
+                                                    (train['close'].shift(-1) > train['close']).astype(int))
+    pipeline = Pipeline(feature_engineering.steps + [('model', model)])
+
+    single_results, expected = benchmark('per_request', lambda df: int(pipeline.predict(df)[-1]), requests,
+                                         args.threads)
+    batcher = PredictionBatcher(args.max_batch_size, args.max_wait_ms / 1000)
+    batched_results, predictions = benchmark('batched', lambda df: batcher.predict(pipeline, df), requests,
+                                             args.threads)
+    batcher.close()
+    batched_results['mean_batch_size'] = round(batcher.requests / batcher.batches, 1)
+
+    results = pd.DataFrame([single_results, batched_results])
+    results['speedup'] = (results['seconds'].iloc[0] / results['seconds']).round(2)
+    print(results.to_string(index=False))
+    print("Identical predictions:", predictions == expected)
@@ -1,24 +1,60 @@
 import os
 import streamlit as st
-import yfinance as yf
 import altair as alt
 import matplotlib.pyplot as plt
 import pandas as pd
-from src.utils.db_utils import connect_to_database , select_data
+from src.utils.db_utils import get_pool , select_predictions , clear_prediction_cache
+from src.utils.performance import select_performance
+from src.prediction.client import request_prediction
+from src.visualization.market_data import default_market_data
+from src.visualization.downsample import ChartDownsampler
+
+# Tickers of the prediction history, and its number of days
+TICKERS = ['AAPL']
+HISTORY_DAYS = 90
+# Rolling windows of the Local Performance tab in days (the Global Performance tab covers the whole history)
+LOCAL_WINDOWS = [7, 30, 90]
+PERFORMANCE_METRICS = ['accuracy', 'precision', 'hit_rate']
+# Width of the charts in pixels, about one point is drawn per pixel
+CHART_WIDTH = 800
+# URL of the resident prediction server (src/prediction/server.py), the saved predictions are shown without it
+PREDICTION_SERVER_URL = os.environ.get("PREDICTION_SERVER_URL")
+
+# Market data shared by the reruns and sessions, refreshed incrementally
+@st.cache_resource
+def get_market_data():
+    return default_market_data()
+
+# Zoom levels of a price series, rebuilt when its version (last date, rows and price) changes
+@st.cache_resource(max_entries=4)
+def get_downsampler(ticker, version, _data, column):
+    return ChartDownsampler(_data.index, _data[column])
+
+# Pool of the process, shared by the reruns and sessions. The dashboard only reads: the schema is migrated
+# by the writers (save_prediction, the executor or db_migrations.py), "No data found" is shown until then
+@st.cache_resource
+def get_database():
+    return get_pool(os.environ.get("DB_URL"))
+
+# Prediction of the resident server for the bars of the date, None if it is not configured, reachable or up to date
+def get_served_prediction(date):
+    if not PREDICTION_SERVER_URL:
+        return None
+    try:
+        result = request_prediction(PREDICTION_SERVER_URL, 'AAPL', timeout=5)
+    except (OSError, ValueError):
+        return None
+    return result['prediction'] if result.get('date') == date else None
 
 def get_latest_prediction(date) :
-    connection = connect_to_database(os.environ.get("DB_URL"))
-    result = select_data(connection,
-                         'stocks_predictions',
-                         columns=['date', 'prediction'],
-                         where_clause=f"date = '{date}'")
-    print(str(date))
-    connection.close()
+    prediction = get_served_prediction(date)
+    if prediction is None:
+        # Saved prediction, cached in the process until new predictions are written
+        result = select_predictions(get_database(), tickers=['AAPL'], start_date=date, end_date=date)
+        if result is not None and not result.empty:
+            prediction = result['prediction'].iloc[-1]
     # Check if there's any result
-    if result:
-        max_date, prediction = result[0]
-        # Get the maximum date and prediction from your data source
-
+    if prediction is not None:
         # Determine the prediction direction and color
         direction = "Down" if prediction == 0 else "Up"
         color = "red" if prediction == 0 else "green"
@@ -30,15 +66,14 @@ def get_latest_prediction(date) :
         
 # Function to get historical data
 def get_historical_data():
-    # Fetch historical data for AAPL stock
-    data = yf.download('AAPL', start='2023-01-01', progress=False)
+    # Historical data for AAPL stock since 2023-01-01, from the cache
+    data = get_market_data().history('AAPL')
     return data
 
 # Function to get today's details and display them in Streamlit columns
 def get_todays_details():
-    # Fetch today's details for AAPL stock
-    data = yf.download('AAPL', progress=False)
-    today_details = data.iloc[-1]  # Selecting the last row as today's details
+    # Today's details for AAPL stock, the last row of the cached history
+    today_details = get_market_data().latest('AAPL')
 
     # Display each piece of information in separate Streamlit columns
     col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
@@ -75,18 +110,26 @@ def get_todays_details():
 # Function to display historical data
 def display_historical_data():
     st.subheader('Historical Data for AAPL')
-    historical_data = get_historical_data()
-
-    # Resample data to daily frequency and reset index
-    historical_data = historical_data.resample('D').ffill().reset_index()
+    historical_data = get_historical_data().rename_axis('Date')
+    column = 'Adj Close' if 'Adj Close' in historical_data.columns else 'Close'
+
+    # Visible window, only about one point per pixel of the window is sent to the chart
+    start, end = st.slider("Visible window",
+                           min_value=historical_data.index[0].to_pydatetime(),
+                           max_value=historical_data.index[-1].to_pydatetime(),
+                           value=(historical_data.index[0].to_pydatetime(), historical_data.index[-1].to_pydatetime()),
+                           format="YYYY-MM-DD")
+    version = (historical_data.index[-1], len(historical_data), float(historical_data[column].iloc[-1]))
+    downsampler = get_downsampler('AAPL', version, historical_data, column)
+    chart_data = historical_data.iloc[downsampler.window_indices(start, end, CHART_WIDTH)].reset_index()
 
     # Create Altair chart with adjusted opacity
-    chart = alt.Chart(historical_data).mark_line(opacity=0.7).encode(
+    chart = alt.Chart(chart_data).mark_line(opacity=0.7).encode(
         x='Date:T',
-        y='Adj Close:Q',
-        tooltip=['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']
+        y=f'{column}:Q',
+        tooltip=['Date'] + list(historical_data.columns)
     ).properties(
-        width=800,
+        width=CHART_WIDTH,
         height=400
     ).interactive()
 
@@ -100,15 +143,67 @@ def display_todays_details( ):
     today_date = get_todays_details()
     get_latest_prediction(today_date)
 
-# Function to display price prediction
-def display_price_prediction():
-    st.subheader("Price Prediction")
-    st.write("Work in progress...")  # Placeholder for the price prediction section
-    
+# Function to display the prediction history of the tickers
+def display_prediction_history():
+    st.subheader(f"Predictions of the last {HISTORY_DAYS} days")
+    start_date = (pd.Timestamp.today() - pd.Timedelta(days=HISTORY_DAYS)).date()
+    history = select_predictions(get_database(), tickers=TICKERS, start_date=start_date)
+    if history is None or history.empty:
+        st.write("No data found.")
+        return
+    st.dataframe(history)
+
+# Function to get the performance summary, precomputed as the feedback arrives
+def get_performance(window_days):
+    performance = select_performance(get_database(), tickers=TICKERS, window_days=window_days)
+    if performance is None:
+        return None
+    return performance[performance['predictions'] > 0]
+
+# Function to display the performance of the models over the whole history
+def display_global_performance():
+    st.subheader("Global Performance")
+    performance = get_performance([0])
+    if performance is None or performance.empty:
+        st.write("No data found.")
+        return
+
+    chart_data = performance.melt(id_vars=['model_used', 'ticker'], value_vars=PERFORMANCE_METRICS,
+                                  var_name='metric', value_name='value')
+    chart = alt.Chart(chart_data).mark_bar().encode(
+        x='metric:N',
+        y=alt.Y('value:Q', scale=alt.Scale(domain=[0, 1])),
+        color='model_used:N',
+        xOffset='model_used:N',
+        tooltip=['model_used', 'ticker', 'metric', 'value']
+    ).properties(
+        width=CHART_WIDTH,
+        height=300
+    )
+    st.altair_chart(chart)
+    st.dataframe(performance.drop(columns=['window_days']))
+
+# Function to display the performance of the models over the recent rolling windows
+def display_local_performance():
+    st.subheader("Local Performance")
+    window_days = st.selectbox("Window (days)", LOCAL_WINDOWS, index=1)
+    performance = get_performance([window_days])
+    if performance is None or performance.empty:
+        st.write("No data found.")
+        return
+
+    columns = st.columns(len(PERFORMANCE_METRICS))
+    for column, metric in zip(columns, PERFORMANCE_METRICS):
+        with column:
+            st.write(metric.replace('_', ' ').capitalize())
+            st.write(performance.groupby('model_used')[metric].mean().round(4))
+    st.dataframe(performance)
+
 # Function to fetch data
 def fetch_data():
-    # Implement data fetching logic here
-    pass
+    # Fetch the newest bars on the next read instead of waiting for the cache to expire
+    get_market_data().invalidate()
+    clear_prediction_cache()
 
 # Main function to run the Streamlit app
 def main():
@@ -122,11 +217,13 @@ def main():
     with tab1:
        # get_latest_prediction()
         display_todays_details()
+        display_prediction_history()
         display_historical_data()
     with tab2:
-        display_todays_details()
+        # Today's details are displayed once, in the Data tab
+        display_global_performance()
     with tab3:
-        display_price_prediction()
+        display_local_performance()
 
 if __name__ == "__main__":
     main()
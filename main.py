@@ -9,7 +9,9 @@ and sets up Weights & Biases (W&B) experiment.
 
 The active steps are determined based on the configuration,
 and each step is executedusing MLflow's `run` method with
-specified parameters.
+specified parameters, or as Python functions in this process
+when `main.executor` is `inprocess`. The duration of each step
+is reported at the end.
 
 Usage:
     Run this script directly to execute the MLflow project.
@@ -21,10 +23,11 @@ Example:
 import os
 import mlflow
 import hydra
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 import json
 import uuid
 import wandb
+from src.pipeline.timing import step_timer, save_timings, load_timings, timing_report
 
 _steps = [
     "data_ingestion",
@@ -32,6 +35,8 @@ _steps = [
 #     "data_seggregation",
     # "feature_engineering",
 #    "training",
+#    "batch_training",
+#    "backtesting",
   # "prediction" , 
 #    "save_prediction"
 ]
@@ -53,139 +58,253 @@ def go(config: DictConfig):
     # Setup the wandb experiment. All runs will be grouped under this name
     os.environ["WANDB_PROJECT"] = config["main"]["project_name"]
     os.environ["WANDB_RUN_GROUP"] = config["main"]["experiment_name"]
-    wandb.login(key = os.environ.get("WANDB_API_KEY"))
+    if config["main"]["offline_store"]:
+        # Steps read and log their artifacts in a local store instead of W&B
+        os.environ["ARTIFACT_STORE_DIR"] = os.path.join(hydra.utils.get_original_cwd(),
+                                                        config["main"]["offline_store"])
+    else:
+        wandb.login(key = os.environ.get("WANDB_API_KEY"))
+    if config["main"]["feature_store"]:
+        # Training and prediction reuse the features computed for the same data and pipeline
+        os.environ["FEATURE_STORE_DIR"] = os.path.join(hydra.utils.get_original_cwd(),
+                                                       config["main"]["feature_store"])
 
     # Steps to execute
     steps_par = config['main']['steps']
     active_steps = steps_par.split(",") if steps_par != "all" else _steps
 
+    if config["main"]["executor"] == "inprocess":
+        # Run the steps in this process and pass the data between them in memory
+        from src.pipeline.executor import InProcessExecutor
+        executor = InProcessExecutor(config, log_artifacts=config["main"]["log_artifacts"],
+                                     max_workers=config["main"]["max_parallel_steps"],
+                                     skip_unchanged=config["main"]["skip_unchanged"])
+        timings = executor.run_steps(active_steps)
+        save_timings("inprocess", timings)
+        print(timing_report(timings, load_timings("subprocess")).to_string(index=False))
+        if executor.schedule is not None:
+            # Start and end of the steps run in parallel, with the critical path
+            print(executor.schedule.to_string(index=False))
+            print(executor.critical_path)
+        return
+
+    timings = {}
     if "data_ingestion" in active_steps:
-        # Download file and load in W&B
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "data_ingestion"),
-            "main",
-            env_manager="local",
-            parameters={
-                "stock_name": config["data_ingestion"]["stock_name"],
-                "start_date": config["data_ingestion"]["start_date"],
-                "end_date": config["data_ingestion"]["end_date"],
-                "output_artifact": config["data_ingestion"]["stock_name"],
-                "output_type": "raw_data",
-                "output_description": "Stock raw data"
-            },
-        )
-        
+        with step_timer(timings, "data_ingestion"):
+            # Download file and load in W&B
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "data_ingestion"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "stock_name": config["data_ingestion"]["stock_name"],
+                    "start_date": config["data_ingestion"]["start_date"],
+                    "end_date": config["data_ingestion"]["end_date"],
+                    "output_artifact": config["data_ingestion"]["stock_name"],
+                    "output_type": "raw_data",
+                    "output_description": "Stock raw data",
+                    "universe": config["data_ingestion"]["universe"],
+                    "max_workers": config["data_ingestion"]["max_workers"],
+                    "incremental": str(config["data_ingestion"]["incremental"]).lower(),
+                    "artifact_format": config["main"]["artifact_format"],
+                    "price_source_dir": config["data_ingestion"]["price_source_dir"]
+                },
+            )
+            
     if "data_cleaning" in active_steps:
-        # Download file and load in W&B
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "data_cleaning"),
-            "main",
-            env_manager="local",
-            parameters={
-                "input_artifact": config["data_ingestion"]["stock_name"]+":latest",
-                "output_artifact": "cleaned_data",
-                "output_type": "cleaned_data",
-                "output_description": "Stock data cleaned"
-            },
-        )
-        
+        with step_timer(timings, "data_cleaning"):
+            # Download file and load in W&B
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "data_cleaning"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "input_artifact": config["data_ingestion"]["stock_name"]+":latest",
+                    "output_artifact": "cleaned_data",
+                    "output_type": "cleaned_data",
+                    "output_description": "Stock data cleaned",
+                    "artifact_format": config["main"]["artifact_format"],
+                    "calendar": config["data_cleaning"]["calendar"],
+                    "zscore_window": config["data_cleaning"]["zscore_window"],
+                    "zscore_threshold": config["data_cleaning"]["zscore_threshold"],
+                    "repair": str(config["data_cleaning"]["repair"]).lower(),
+                    "chunk_rows": config["data_cleaning"]["chunk_rows"]
+                },
+            )
+            
     if "data_seggregation" in active_steps:
-        # Download file and load in W&B
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "data_seggregation"),
-            "main",
-            env_manager="local",
-            parameters={
-                "input_artifact": "cleaned_data:latest",
-                "train_val_pct": config["data_segregation"]["train_val_pct"],
-                "train_val_output_artifact": "train_val",
-                "train_val_output_type": "train_val",
-                "train_val_output_description": "train_val data for training and validation",
-                "test_output_artifact": "test",
-                "test_output_type": "test",
-                "test_output_description": "test data"
-            },
-        )
-        
+        with step_timer(timings, "data_seggregation"):
+            # Download file and load in W&B
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "data_seggregation"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "input_artifact": "cleaned_data:latest",
+                    "train_val_pct": config["data_segregation"]["train_val_pct"],
+                    "train_val_output_artifact": "train_val",
+                    "train_val_output_type": "train_val",
+                    "train_val_output_description": "train_val data for training and validation",
+                    "test_output_artifact": "test",
+                    "test_output_type": "test",
+                    "test_output_description": "test data",
+                    "artifact_format": config["main"]["artifact_format"]
+                },
+            )
+            
     if "feature_engineering" in active_steps:
-        # Extracts features for the model
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "feature_engineering"),
-            "main",
-            env_manager="local",
-            parameters={
-                "output_artifact": "feature_engineering_pipeline",
-                "output_type": "pipeline",
-                "output_description": "pipeline for feature engineering"
-            },
-        )
-        
+        with step_timer(timings, "feature_engineering"):
+            # Extracts features for the model
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "feature_engineering"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "output_artifact": "feature_engineering_pipeline",
+                    "output_type": "pipeline",
+                    "output_description": "pipeline for feature engineering"
+                },
+            )
+            
     if "training" in active_steps:
-        # NOTE: we need to serialize the random forest configuration into JSON
-        unique_id = uuid.uuid4()
-        unique_filename = f"config_{unique_id}.json"
-        xgboost_config = os.path.abspath(unique_filename)
-        with open(xgboost_config, "w+") as fp:
-            json.dump(dict(config["training"]["xgboost_classification"].items()), fp)  
-        # NOTE: use the xgboost_config we just created as the xgboost_config parameter for the training
-        # Extracts features for the model
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "training"),
-            "main",
-            env_manager="local",
-            parameters={
-                "input_data_artifact": "train_val:latest",
-                "input_feature_engineering_artifact": "feature_engineering_pipeline:latest",
-                "train_pct": config["training"]["train_size"],
-                "xgboost_config": xgboost_config,
-                "output_artifact": "trained_model",
-                "output_type": "trained_model",
-                "output_description": "model" 
-            },
-        )
-        
+        with step_timer(timings, "training"):
+            # NOTE: we need to serialize the random forest configuration into JSON
+            unique_id = uuid.uuid4()
+            unique_filename = f"config_{unique_id}.json"
+            xgboost_config = os.path.abspath(unique_filename)
+            with open(xgboost_config, "w+") as fp:
+                json.dump(dict(config["training"]["xgboost_classification"].items()), fp)  
+            # The hyperparameter search options are serialized the same way
+            search_config = os.path.abspath(f"search_{unique_id}.json")
+            with open(search_config, "w+") as fp:
+                json.dump(OmegaConf.to_container(config["training"]["search"]), fp)
+            # NOTE: use the xgboost_config we just created as the xgboost_config parameter for the training
+            # Extracts features for the model
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "training"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "input_data_artifact": "train_val:latest",
+                    "input_feature_engineering_artifact": "feature_engineering_pipeline:latest",
+                    "train_pct": config["training"]["train_size"],
+                    "xgboost_config": xgboost_config,
+                    "output_artifact": "trained_model",
+                    "output_type": "trained_model",
+                    "output_description": "model",
+                    "search_config": search_config,
+                    "early_stopping_rounds": config["training"]["early_stopping_rounds"]
+                },
+            )
+            
+    if "batch_training" in active_steps:
+        with step_timer(timings, "batch_training"):
+            # NOTE: the XGBoost configuration is serialized into JSON like for the training
+            xgboost_config = os.path.abspath(f"config_{uuid.uuid4()}.json")
+            with open(xgboost_config, "w+") as fp:
+                json.dump(dict(config["training"]["xgboost_classification"].items()), fp)
+            # One model per ticker of the universe, saved in the model registry
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "training"),
+                "batch",
+                env_manager="local",
+                parameters={
+                    "input_artifact": config["training"]["batch"]["input_artifact"],
+                    "input_feature_engineering_artifact": "feature_engineering_pipeline:latest",
+                    "train_pct": config["training"]["train_size"],
+                    "xgboost_config": xgboost_config,
+                    "output_artifact": "batch_training_summary",
+                    "output_type": "training_summary",
+                    "output_description": "accuracy and training time of the model of each ticker",
+                    "early_stopping_rounds": config["training"]["early_stopping_rounds"],
+                    "registry_dir": config["training"]["batch"]["registry_dir"] or os.path.join(
+                        hydra.utils.get_original_cwd(), "src", "models", "registry"),
+                    "max_workers": config["training"]["batch"]["max_workers"]
+                },
+            )
+
+    if "backtesting" in active_steps:
+        with step_timer(timings, "backtesting"):
+            # NOTE: the XGBoost configuration is serialized into JSON like for the training
+            xgboost_config = os.path.abspath(f"config_{uuid.uuid4()}.json")
+            with open(xgboost_config, "w+") as fp:
+                json.dump(dict(config["training"]["xgboost_classification"].items()), fp)
+            # Walk-forward evaluation of the model
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "backtesting"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "input_artifact": config["backtesting"]["input_artifact"],
+                    "input_feature_engineering_artifact": "feature_engineering_pipeline:latest",
+                    "xgboost_config": xgboost_config,
+                    "output_artifact": "backtest_report",
+                    "output_type": "backtest_report",
+                    "output_description": "walk-forward backtest metrics per fold",
+                    "mode": config["backtesting"]["mode"],
+                    "n_folds": config["backtesting"]["n_folds"],
+                    "test_size": config["backtesting"]["test_size"],
+                    "train_size": config["backtesting"]["train_size"],
+                    "max_workers": config["backtesting"]["max_workers"]
+                },
+            )
+
     if "prediction" in active_steps:
-        # Extracts features for the model
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "prediction"),
-            "main",
-            env_manager="local",
-            parameters={
-                "input_data_artifact": "test:latest",
-                "input_pipeline_artifact": "trained_model:production",
-                "output_artifact": "prediction",
-                "output_type": "preds",
-                "output_description": "data predictions" 
-            },
-        )
-        
+        with step_timer(timings, "prediction"):
+            # Extracts features for the model
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "prediction"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "input_data_artifact": "test:latest",
+                    "input_pipeline_artifact": "trained_model:production",
+                    "output_artifact": "prediction",
+                    "output_type": "preds",
+                    "output_description": "data predictions",
+                    "artifact_format": config["main"]["artifact_format"],
+                    "incremental": str(config["prediction"]["incremental"]).lower(),
+                    "latest": config["prediction"]["latest"],
+                    "ticker": config["data_ingestion"]["stock_name"]
+                },
+            )
+            
     if "save_prediction" in active_steps:
-        # Extracts features for the model
-        _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(),
-                         "src",
-                         "save_prediction"),
-            "main",
-            env_manager="local",
-            parameters={
-                "input_data_artifact": "prediction:latest",
-                "used_model_artifact": "trained_model:production",
-                "database_url" : os.environ.get("DB_URL"),
-                "table_name": "stocks_predictions"
-            },
-        )
+        with step_timer(timings, "save_prediction"):
+            # Extracts features for the model
+            _ = mlflow.run(
+                os.path.join(hydra.utils.get_original_cwd(),
+                             "src",
+                             "save_prediction"),
+                "main",
+                env_manager="local",
+                parameters={
+                    "input_data_artifact": "prediction:latest",
+                    "used_model_artifact": "trained_model:production",
+                    "database_url" : os.environ.get("DB_URL"),
+                    "table_name": "stocks_predictions",
+                    "ticker": config["data_ingestion"]["stock_name"]
+                },
+            )
+
+    save_timings("subprocess", timings)
+    print(timing_report(timings).to_string(index=False))
 
 if __name__ == "__main__":
     go()
@@ -0,0 +1,273 @@
+"""
+backtest.py
+
+This script evaluates the XGBoost pipeline with walk-forward backtesting. The data of each ticker is
+split into consecutive folds: each fold trains a model on the bars before its test window, in a
+rolling window of fixed size or an expanding window from the first bar, and predicts the direction
+of the close price of the next day over its test window.
+
+The features of each ticker are computed once over its whole history and stored in the feature store,
+the folds read their rows from the memory-mapped matrix. The folds are trained in a process pool.
+
+Usage:
+    python backtest.py --input_artifact <input_artifact> --input_feature_engineering_artifact <pipeline_artifact>
+                       --xgboost_config <xgboost_config_file> --output_artifact <output_report_name>
+                       --output_type <output_type> --output_description <output_description>
+                       [--mode expanding] [--n_folds <n_folds>] [--test_size <test_size>]
+                       [--train_size <train_size>] [--max_workers <max_workers>]
+
+Arguments:
+    --input_artifact (str): Raw data of the ingestion step, one data file per ticker (e.g. the output of
+      the universe mode), cleaned before the features are computed.
+    --input_feature_engineering_artifact (str): Name of the feature engineering pipeline artifact in wandb.
+    --xgboost_config (str): Path to the XGBoost configuration file.
+    --output_artifact (str): Name of the artifact for the backtest report.
+    --output_type (str): Type of the output artifact.
+    --output_description (str): Description of the output artifact.
+    --mode (str, optional): 'expanding' (default) or 'rolling' training windows.
+    --n_folds (int, optional): Number of folds per ticker (default: 24).
+    --test_size (int, optional): Number of bars of the test window of a fold (default: 21).
+    --train_size (int, optional): Number of bars of the rolling training window (default: 252).
+    --max_workers (int, optional): Number of processes training the folds (default: 1).
+
+Execution:
+    - Downloads the data and the feature engineering pipeline from wandb, and cleans the data.
+    - Computes the features of each ticker through the feature store.
+    - Trains and evaluates a model per fold and ticker.
+    - Prints the report and uploads it to wandb, with the mean metrics in the run summary.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import mlflow
+import wandb
+from sklearn.metrics import accuracy_score
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.artifacts import init_run, download_artifact
+from src.utils.utils import upload_data_to_wandb, read_tickers_from_wandb, save_data
+from src.data_cleaning.data_cleaning import clean_data
+from src.feature_engineering.feature_store import FeatureStore, get_feature_store, DEFAULT_MAX_MB
+from src.training.train import train_xgboost
+
+log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logging.basicConfig(filename='backtest.log', level=logging.INFO, format=log_fmt)
+
+MODES = ('expanding', 'rolling')
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--input_artifact", type=str, help="input data name in wandb", required=True)
+    parser.add_argument("--input_feature_engineering_artifact", type=str, help="input feature engineering pipeline in wandb", required=True)
+    parser.add_argument("--xgboost_config", type=str, help="Path to the XGBoost configuration file", required=True)
+    parser.add_argument("--output_artifact", type=str, help="Name of the artifact for the backtest report", required=True)
+    parser.add_argument("--output_type", type=str, help="Type of the output artifact", required=True)
+    parser.add_argument("--output_description", type=str, help="Description of the output artifact", required=True)
+    parser.add_argument("--mode", type=str, choices=MODES, help="Training windows of the folds", default="expanding")
+    parser.add_argument("--n_folds", type=int, help="Number of folds per ticker", default=24)
+    parser.add_argument("--test_size", type=int, help="Number of bars of the test window of a fold", default=21)
+    parser.add_argument("--train_size", type=int, help="Number of bars of the rolling training window", default=252)
+    parser.add_argument("--max_workers", type=int, help="Number of processes training the folds", default=1)
+    return parser.parse_args()
+
+
+def make_folds(n_rows, n_folds, test_size, mode='expanding', train_size=None):
+    """
+    Build the windows of walk-forward folds.
+
+    The test windows are consecutive and end with the last row. The training window of a fold ends
+    where its test window starts, and starts at the first row (expanding) or `train_size` rows
+    before (rolling).
+
+    Parameters:
+        n_rows (int): Number of rows of the data.
+        n_folds (int): Number of folds.
+        test_size (int): Number of rows of a test window.
+        mode (str): 'expanding' or 'rolling'.
+        train_size (int, optional): Number of rows of a rolling training window.
+
+    Returns:
+        list: (train_start, train_end, test_start, test_end) row bounds of each fold.
+    """
+    if mode not in MODES:
+        logging.error(f"Unsupported backtest mode '{mode}'")
+        raise ValueError(f"Unsupported backtest mode '{mode}', expected one of {MODES}")
+    if mode == 'rolling' and not train_size:
+        logging.error("A rolling backtest requires a train_size")
+        raise ValueError("A rolling backtest requires a train_size")
+
+    first_test = n_rows - n_folds * test_size
+    if first_test <= 0 or (mode == 'rolling' and first_test < train_size):
+        logging.error(f"Not enough rows ({n_rows}) for {n_folds} folds of {test_size} rows")
+        raise ValueError(f"Not enough rows ({n_rows}) for {n_folds} folds of {test_size} rows")
+
+    folds = []
+    for fold in range(n_folds):
+        test_start = first_test + fold * test_size
+        train_start = test_start - train_size if mode == 'rolling' else 0
+        folds.append((train_start, test_start, test_start, test_start + test_size))
+    return folds
+
+
+def prepare_ticker(df, feature_engineering, feature_store):
+    """
+    Compute the features, labels and next day returns of the data of a ticker.
+
+    The last bar, whose next day is unknown, is dropped. A stored matrix is pinned in the store until
+    it is unpinned, so the features of the next tickers do not evict it before its folds run.
+
+    Returns:
+        tuple: The feature matrix (the path of its stored file when it is memory-mapped), the labels
+        and the next day returns.
+    """
+    df = df.reset_index(drop=True)
+    next_return = (df['close'].shift(-1) / df['close'] - 1).to_numpy()[:-1]
+    labels = (next_return > 0).astype(int)
+    features = feature_store.transform(df.iloc[:-1].reset_index(drop=True), feature_engineering)
+    if isinstance(features, np.memmap):
+        # The processes of the pool read the matrix from the store instead of receiving a copy
+        features = features.filename
+        feature_store.pin(features)
+    return features, labels, next_return
+
+
+def run_fold(ticker, fold, window, features, labels, returns, xgboost_config):
+    """
+    Train a model on the training window of a fold and evaluate it on its test window.
+
+    Parameters:
+        ticker (str): Ticker of the data.
+        fold (int): Number of the fold.
+        window (tuple): (train_start, train_end, test_start, test_end) row bounds of the fold.
+        features (numpy.ndarray or str): Feature matrix of the ticker, or the path of its stored file.
+        labels (numpy.ndarray): Direction of the close price of the next day.
+        returns (numpy.ndarray): Return of the close price of the next day.
+        xgboost_config (dict): Configuration parameters for the XGBoost classifier.
+
+    Returns:
+        dict: Metrics of the fold.
+    """
+    start = time.perf_counter()
+    if isinstance(features, str):
+        features = np.load(features, mmap_mode='r')
+    train_start, train_end, test_start, test_end = window
+
+    train_df = pd.DataFrame(features[train_start:train_end])
+    train_df['label'] = labels[train_start:train_end]
+    model = train_xgboost(train_df.dropna(), 'label', xgboost_config)
+    if model is None:
+        logging.error(f"Training of the fold {fold} of {ticker} failed")
+        raise ValueError(f"Training of the fold {fold} of {ticker} failed")
+
+    predictions = model.predict(pd.DataFrame(features[test_start:test_end]))
+    test_returns = returns[test_start:test_end]
+    return {'ticker': ticker,
+            'fold': fold,
+            'train_start': train_start,
+            'train_end': train_end,
+            'test_start': test_start,
+            'test_end': test_end,
+            'train_rows': int(train_df['label'].count()),
+            'accuracy': accuracy_score(labels[test_start:test_end], predictions),
+            # Long the next day when the model predicts a rise, out of the market otherwise
+            'strategy_return': float(np.prod(1 + predictions * test_returns) - 1),
+            'buy_and_hold_return': float(np.prod(1 + test_returns) - 1),
+            'seconds': round(time.perf_counter() - start, 3)}
+
+
+def run_backtest(data, feature_engineering, xgboost_config, n_folds=24, test_size=21, mode='expanding',
+                 train_size=None, max_workers=1, feature_store=None):
+    """
+    Run a walk-forward backtest of the XGBoost pipeline over the data of several tickers.
+
+    Parameters:
+        data (dict): Cleaned data of each ticker, sorted by date.
+        feature_engineering (sklearn.pipeline.Pipeline): Feature engineering pipeline.
+        xgboost_config (dict): Configuration parameters for the XGBoost classifier.
+        n_folds (int): Number of folds per ticker.
+        test_size (int): Number of bars of a test window.
+        mode (str): 'expanding' or 'rolling' training windows.
+        train_size (int, optional): Number of bars of a rolling training window.
+        max_workers (int): Number of processes training the folds, 1 to train them in this process.
+        feature_store (FeatureStore, optional): Store of the feature matrices, a temporary store is used if None.
+
+    Returns:
+        pd.DataFrame: Metrics and duration of each fold.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        feature_store = feature_store or FeatureStore(tmp_dir, DEFAULT_MAX_MB * 1024 ** 2)
+        tasks = []
+        try:
+            for ticker, df in data.items():
+                features, labels, returns = prepare_ticker(df, feature_engineering, feature_store)
+                for fold, window in enumerate(make_folds(len(labels), n_folds, test_size, mode, train_size)):
+                    tasks.append((ticker, fold, window, features, labels, returns))
+            logging.info(f"Running {len(tasks)} folds over {len(data)} tickers with {max_workers} workers")
+
+            if max_workers <= 1:
+                results = [run_fold(*task, xgboost_config) for task in tasks]
+            else:
+                # Share the cores between the folds trained at the same time
+                xgboost_config = dict(xgboost_config, n_jobs=max(1, (os.cpu_count() or 1) // max_workers))
+                with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                    futures = [pool.submit(run_fold, *task, xgboost_config) for task in tasks]
+                    results = [future.result() for future in futures]
+        finally:
+            # The stored matrices of the tickers can be evicted once their folds ran
+            for features in {task[3] for task in tasks if isinstance(task[3], str)}:
+                feature_store.unpin(features)
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+
+    logging.info("Starting backtest ...")
+    args = parse_arguments()
+    with open(args.xgboost_config) as fp:
+        xgboost_config = json.load(fp)
+
+    run = init_run()
+
+    download_data_path = os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "backtesting")
+    data = {ticker: clean_data(df) for ticker, df in
+            read_tickers_from_wandb(run, args.input_artifact, download_data_path).items()}
+    logging.info(f"Data of {len(data)} tickers downloaded successfully.")
+
+    download_feature_engineering_path = os.path.join(os.path.dirname(__file__), "..", "models", "feature_engineering")
+    feature_engineering = mlflow.sklearn.load_model(
+        download_artifact(run.use_artifact(args.input_feature_engineering_artifact), download_feature_engineering_path))
+    logging.info("Feature engineering pipeline downloaded successfully.")
+
+    report = run_backtest(data, feature_engineering, xgboost_config, n_folds=args.n_folds, test_size=args.test_size,
+                          mode=args.mode, train_size=args.train_size, max_workers=args.max_workers,
+                          feature_store=get_feature_store())
+    print(report.to_string(index=False))
+    for metric in ('accuracy', 'strategy_return', 'buy_and_hold_return'):
+        run.summary[metric] = report[metric].mean()
+
+    os.makedirs(download_data_path, exist_ok=True)
+    report_path = save_data(report, os.path.join(download_data_path, "backtest_report.csv"))
+    upload_data_to_wandb(run, report_path, args.output_artifact, args.output_type, args.output_description,
+                         metadata={'mode': args.mode, 'n_folds': args.n_folds, 'test_size': args.test_size})
+    os.remove(args.xgboost_config)
+    wandb.finish()
+    logging.info("Backtest completed.")
@@ -0,0 +1,405 @@
+"""
+Cleaning Engine
+
+This module cleans daily bars in a single pass over a frame, vectorized over the rows of all its
+symbols. The bars are sorted by symbol and date, and each missing value is interpolated linearly in
+time between the previous and next values of its column for the same symbol (the first and last values are carried
+to the start and end of a symbol), so the interpolation never mixes the bars of different symbols.
+
+The pass also checks the bars, without modifying them unless `repair` is set:
+- Gaps: the sessions of the exchange trading calendar missing between two bars of a symbol, and the
+  bars dated on a day without session.
+- Outliers: the log returns of the close whose z-score against the previous `zscore_window`
+  returns of the symbol exceeds `zscore_threshold`. Real market moves look like outliers too, so
+  they are only reported.
+- OHLC consistency: a high below the open, low or close, a low above the open, high or close, a
+  non-positive price or a negative volume. With `repair`, the invalid prices and volumes are
+  interpolated, and the high and low are widened to the range of the bar.
+
+The checks are returned as a report with one row per issue. A frame is either a single series, with
+a `date` column or a DatetimeIndex, or a panel indexed by (symbol, date) as in `feature_engine`, or
+with `symbol` and `date` columns as in a file.
+
+Long histories can be cleaned by chunks with `clean_chunks`, e.g. from `pd.read_csv(chunksize=...)`.
+The bars at the end of a chunk are held back until a bar with all its values is read, and the last
+cleaned bars of a chunk are the context of the next one, so the result is the same as in one pass.
+
+Functions:
+- trading_sessions: Sessions of an exchange trading calendar.
+- frame_axes: Symbols and dates of the bars of a frame.
+- clean_frame: Clean the bars of a frame, sorted by symbol and date, and report their issues.
+- clean_chunks: Clean the bars of consecutive chunks of a frame sorted by symbol and date.
+"""
+
+import logging
+import functools
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, GoodFriday, USMemorialDay, USLaborDay,
+                                    USThanksgivingDay, USPresidentsDay, nearest_workday, sunday_to_monday)
+from pandas.tseries.offsets import DateOffset
+from dateutil.relativedelta import MO
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'adj_close']
+VALUE_COLUMNS = PRICE_COLUMNS + ['volume']
+REPORT_COLUMNS = ['symbol', 'date', 'check', 'detail']
+
+DEFAULT_CALENDAR = 'XNYS'
+DEFAULT_ZSCORE_WINDOW = 20
+DEFAULT_ZSCORE_THRESHOLD = 5.0
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """
+    Full-day holidays of the New York Stock Exchange since 1998 (one-off closures are not included).
+    """
+    rules = [
+        # A New Year's Day falling on a Saturday is not observed on the Friday before
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        Holiday('Martin Luther King Jr. Day', month=1, day=1, start_date='1998-01-01', offset=DateOffset(weekday=MO(3))),
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+# Holiday calendars of the exchanges, None for all the business days
+CALENDARS = {'XNYS': NYSEHolidayCalendar, 'B': None}
+
+
+def trading_sessions(calendar, start, end):
+    """
+    Return the sessions of an exchange trading calendar between two dates (inclusive).
+
+    Parameters:
+        calendar (str): Name of the calendar in CALENDARS, e.g. 'XNYS' (NYSE) or 'B' (business days).
+        start, end (str or pd.Timestamp): First and last dates.
+
+    Returns:
+        pd.DatetimeIndex: The dates of the sessions.
+    """
+    if calendar not in CALENDARS:
+        logger.error(f"Unknown trading calendar {calendar}, expected one of {list(CALENDARS)}")
+        raise ValueError(f"Unknown trading calendar {calendar}, expected one of {list(CALENDARS)}")
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    sessions = _sessions(calendar, start.year, end.year)
+    return sessions[(sessions >= start) & (sessions <= end)]
+
+
+@functools.lru_cache(maxsize=32)
+def _sessions(calendar, first_year, last_year):
+    # Sessions of whole years, computed once for the chunks of a history
+    days = pd.date_range(f'{first_year}-01-01', f'{last_year}-12-31', freq='D')
+    sessions = days[days.dayofweek < 5]
+    if CALENDARS[calendar] is not None:
+        sessions = sessions[~sessions.isin(CALENDARS[calendar]().holidays(days[0], days[-1]))]
+    return sessions
+
+
+def _to_dates(values):
+    # Dates of the bars, in the local time of their exchange when they have a time zone
+    dates = pd.to_datetime(values)
+    if not isinstance(dates, pd.DatetimeIndex):
+        dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates
+
+
+def frame_axes(df):
+    """
+    Return the symbols and dates of the bars of a frame, None when the frame has none.
+    """
+    if df.index.nlevels == 2:
+        return df.index.get_level_values(0).to_numpy(), _to_dates(df.index.get_level_values(1))
+    if 'symbol' in df.columns and 'date' in df.columns:
+        return df['symbol'].to_numpy(), _to_dates(df['date'])
+    if 'date' in df.columns:
+        return None, _to_dates(df['date'])
+    if isinstance(df.index, pd.DatetimeIndex):
+        return None, _to_dates(df.index)
+    return None, None
+
+
+def _group_bounds(symbols, n):
+    # First and last row of the symbol of each row, the symbols are contiguous groups
+    if symbols is None or n == 0:
+        return np.zeros(n, dtype=np.int64), np.full(n, n - 1, dtype=np.int64)
+    codes, _ = pd.factorize(symbols)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    return starts[group], ends[group]
+
+
+def _interpolate(values, times, first, last):
+    """
+    Interpolate the missing values of a column linearly in time, within the rows of each symbol.
+
+    The previous and next values of all the missing rows are found by a single search in the rows
+    with a value, and the values are filled in place.
+
+    Parameters:
+        values (np.ndarray): Values of the column, with NaN for the missing ones.
+        times (np.ndarray): Time of each row.
+        first, last (np.ndarray): First and last row of the symbol of each row.
+
+    Returns:
+        np.ndarray: The rows filled, the rows of a symbol without any value in the column stay missing.
+    """
+    valid = ~np.isnan(values)
+    missing = np.flatnonzero(~valid)
+    positions = np.flatnonzero(valid)
+    if not len(missing) or not len(positions):
+        return np.empty(0, dtype=np.int64)
+
+    # Previous and next values of the same symbol
+    found = np.searchsorted(positions, missing)
+    previous = positions[np.clip(found - 1, 0, None)]
+    following = positions[np.clip(found, None, len(positions) - 1)]
+    has_previous = (found > 0) & (previous >= first[missing])
+    has_following = (found < len(positions)) & (following <= last[missing])
+
+    span = times[following] - times[previous]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(span > 0, (times[missing] - times[previous]) / span, 0.0)
+    filled = np.where(has_previous, values[previous], values[following])
+    between = has_previous & has_following
+    filled[between] += (values[following[between]] - values[previous[between]]) * weight[between]
+
+    found = has_previous | has_following
+    values[missing[found]] = filled[found]
+    return missing[found]
+
+
+def _previous_sums(values, window):
+    # Sum of the `window` values before each row
+    sums = np.zeros(len(values))
+    np.cumsum(values[:-1], out=sums[1:])
+    if len(values) > window:
+        sums[window:] -= sums[:len(values) - window].copy()
+    return sums
+
+
+def _zscores(prices, first, window):
+    """
+    Z-scores of the log returns of a price against the previous `window` returns of their symbol.
+    """
+    # The arrays of the rows are computed in place, a long history holds a few of them at a time
+    n = len(prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_prices = np.log(np.where(prices > 0, prices, np.nan))
+    returns = np.empty_like(log_prices)
+    returns[0] = np.nan
+    np.subtract(log_prices[1:], log_prices[:-1], out=returns[1:])
+    del log_prices
+    returns[np.flatnonzero(np.diff(first)) + 1] = np.nan
+
+    # Sums of the `window` previous returns, from the cumulative sums, the missing returns count as 0
+    valid = ~np.isnan(returns)
+    returns[~valid] = 0.0
+    count = _previous_sums(valid.astype(np.float64), window)
+    mean = _previous_sums(returns, window)
+    variance = _previous_sums(returns * returns, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean /= count
+        spread = count * mean
+        spread *= mean
+        variance -= spread
+        del spread
+        variance /= count - 1
+        np.clip(variance, 0, None, out=variance)
+        np.sqrt(variance, out=variance)
+        zscores = returns
+        zscores -= mean
+        zscores /= variance
+    zscores[~valid] = np.nan
+    # Only the full windows of the same symbol
+    zscores[np.arange(n) - first <= window] = np.nan
+    zscores[count < window] = np.nan
+    return zscores
+
+
+def _report(symbols, dates, rows, check, details):
+    return pd.DataFrame({'symbol': None if symbols is None else symbols[rows],
+                         'date': None if dates is None else dates.values[rows],
+                         'check': check, 'detail': details}, index=range(len(rows)), columns=REPORT_COLUMNS)
+
+
+def _gap_reports(symbols, dates, first, calendar, context_rows):
+    # Missing sessions between the bars of a symbol, and bars dated on a day without session
+    n = len(dates)
+    days = dates.normalize()
+    sessions = trading_sessions(calendar, days.min(), days.max()).asi8
+    day_values = days.asi8
+    left, right = np.searchsorted(sessions, day_values, 'left'), np.searchsorted(sessions, day_values, 'right')
+    # Sessions strictly between a bar and the previous bar of its symbol
+    gaps = np.zeros(n, dtype=np.int64)
+    gaps[1:] = left[1:] - right[:-1]
+    gaps[np.arange(n) == first] = 0
+    gap_rows = np.flatnonzero(gaps[context_rows:] > 0) + context_rows
+    counts = gaps[gap_rows]
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    missing = pd.DataFrame({
+        'symbol': None if symbols is None else symbols[np.repeat(gap_rows, counts)],
+        'date': pd.DatetimeIndex(sessions[np.repeat(right[gap_rows - 1], counts) + offsets]),
+        'check': 'missing_session', 'detail': ''}, columns=REPORT_COLUMNS)
+    off_rows = np.flatnonzero(left[context_rows:] == right[context_rows:]) + context_rows
+    return [missing, _report(symbols, dates, off_rows, 'off_calendar', '')]
+
+
+def clean_frame(df, calendar=DEFAULT_CALENDAR, zscore_window=DEFAULT_ZSCORE_WINDOW,
+                zscore_threshold=DEFAULT_ZSCORE_THRESHOLD, repair=False, context_rows=0):
+    """
+    Clean the bars of a frame sorted by symbol and date, and report their issues.
+
+    Parameters:
+        df (pd.DataFrame): The bars, with lower case column names. Only the VALUE_COLUMNS are cleaned.
+        calendar (str): Trading calendar of the gap check (see CALENDARS), None to skip it.
+        zscore_window (int): Number of previous returns of the outlier z-scores.
+        zscore_threshold (float): Absolute z-score above which a return is an outlier, None to skip the check.
+        repair (bool): Interpolate the invalid prices and volumes, and widen the high and low to the range of the bar.
+        context_rows (int): Number of first rows already cleaned, used as context and not returned.
+
+    Returns:
+        tuple: The cleaned bars after the context rows, with the value columns as float64 (the
+            integer columns are kept as integers), and the report of their issues (REPORT_COLUMNS).
+    """
+    columns = [column for column in VALUE_COLUMNS if column in df.columns]
+    prices = [column for column in PRICE_COLUMNS if column in columns]
+    values = {column: df[column].to_numpy(dtype=np.float64, na_value=np.nan, copy=True) for column in columns}
+    n = len(df)
+    symbols, dates = frame_axes(df)
+    first, last = _group_bounds(symbols, n)
+    times = dates.asi8.astype(np.float64) if dates is not None else (np.arange(n) - first).astype(np.float64)
+    reports = []
+
+    # Invalid values, found before they are interpolated away
+    with np.errstate(invalid='ignore'):
+        nonpositive = np.zeros(n, dtype=bool)
+        for column in prices:
+            invalid = values[column] <= 0
+            nonpositive |= invalid
+            if repair:
+                values[column][invalid] = np.nan
+        negative_volume = values['volume'] < 0 if 'volume' in values else np.zeros(n, dtype=bool)
+    if repair and 'volume' in values:
+        values['volume'][negative_volume] = np.nan
+
+    # Bit mask of the interpolated columns of each row
+    interpolated = np.zeros(n, dtype=np.uint8)
+    for bit, column in enumerate(columns):
+        interpolated[_interpolate(values[column], times, first, last)] |= 1 << bit
+    del times, last
+
+    body = [values[column] for column in ('open', 'close') if column in values]
+    if 'high' in values and 'low' in values:
+        highest = np.fmax.reduce(body + [values['high'], values['low']])
+        lowest = np.fmin.reduce(body + [values['high'], values['low']])
+        with np.errstate(invalid='ignore'):
+            high_below = values['high'] < highest
+            low_above = values['low'] > lowest
+        if repair:
+            values['high'], values['low'] = highest, lowest
+        del highest, lowest
+    else:
+        high_below = low_above = np.zeros(n, dtype=bool)
+
+    if dates is not None and calendar and n:
+        reports.extend(_gap_reports(symbols, dates, first, calendar, context_rows))
+
+    close = next((column for column in ('close', 'adj_close') if column in columns), None)
+    if zscore_threshold and close:
+        zscores = _zscores(values[close], first, zscore_window)
+        with np.errstate(invalid='ignore'):
+            outliers = np.abs(zscores) > zscore_threshold
+        rows = np.flatnonzero(outliers[context_rows:]) + context_rows
+        reports.append(_report(symbols, dates, rows, 'outlier', [f"z={zscore:.1f}" for zscore in zscores[rows]]))
+
+    issues = {'high_below_body': high_below, 'low_above_body': low_above,
+              'nonpositive_price': nonpositive, 'negative_volume': negative_volume}
+    for detail, flags in issues.items():
+        rows = np.flatnonzero(flags[context_rows:]) + context_rows
+        reports.append(_report(symbols, dates, rows, 'ohlc', detail))
+
+    rows = np.flatnonzero(interpolated[context_rows:]) + context_rows
+    masks, codes = np.unique(interpolated[rows], return_inverse=True)
+    names = np.array([','.join(column for bit, column in enumerate(columns) if mask >> bit & 1) for mask in masks],
+                     dtype=object)
+    reports.append(_report(symbols, dates, rows, 'interpolated', names[codes]))
+
+    # The other columns are shared with the input, the value columns are the cleaned arrays, without copies
+    data = {}
+    for column in df.columns:
+        if column not in values:
+            data[column] = df[column].array[context_rows:]
+            continue
+        column_values = values[column][context_rows:]
+        if pd.api.types.is_integer_dtype(df[column].dtype) and not np.isnan(column_values).any():
+            column_values = np.round(column_values).astype(df[column].dtype)
+        data[column] = column_values
+    cleaned = pd.DataFrame(data, index=df.index[context_rows:], columns=df.columns, copy=False)
+
+    reports = [report for report in reports if len(report)]
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=REPORT_COLUMNS)
+    return cleaned, report
+
+
+def _complete_cut(block, columns, repair):
+    # Number of rows up to the last row with a value in each column, which is not repaired
+    complete = block[columns].notna().all(axis=1).to_numpy()
+    if repair:
+        prices = [column for column in columns if column in PRICE_COLUMNS]
+        complete &= (block[prices] > 0).all(axis=1).to_numpy()
+        if 'volume' in columns:
+            complete &= (block['volume'] >= 0).to_numpy()
+    return int(np.flatnonzero(complete)[-1]) + 1 if complete.any() else 0
+
+
+def clean_chunks(chunks, zscore_window=DEFAULT_ZSCORE_WINDOW, repair=False, **options):
+    """
+    Clean the bars of consecutive chunks of a frame sorted by symbol and date.
+
+    Parameters:
+        chunks (iterable): Consecutive chunks of the bars, with lower case column names.
+        zscore_window (int): Number of previous returns of the outlier z-scores.
+        repair (bool): Interpolate the invalid prices and volumes, and widen the high and low to the range of the bar.
+        options: The other options of `clean_frame`.
+
+    Yields:
+        tuple: The cleaned bars of a chunk and the report of their issues. The bars at the end of a
+            chunk are held back until a bar with all its values is read, or until more than a chunk
+            of bars is held back by a column without any value so far.
+    """
+    context, pending = None, None
+    # Columns with at least one value so far
+    seen = set()
+    chunks = iter(chunks)
+    chunk = next(chunks, None)
+    while chunk is not None:
+        following = next(chunks, None)
+        block = chunk if pending is None else pd.concat([pending, chunk])
+        columns = [column for column in VALUE_COLUMNS if column in block.columns]
+        seen.update(column for column in columns if block[column].notna().any())
+        cut = len(block) if following is None else _complete_cut(block, columns, repair)
+        if len(block) - cut > len(chunk):
+            # A column may have no value at all, it no longer holds the bars back
+            cut = _complete_cut(block, [column for column in columns if column in seen], repair)
+        pending, block = block.iloc[cut:], block.iloc[:cut]
+
+        if len(block):
+            context_rows = 0 if context is None else len(context)
+            frame = block if context is None else pd.concat([context, block])
+            cleaned, report = clean_frame(frame, zscore_window=zscore_window, repair=repair,
+                                          context_rows=context_rows, **options)
+            # The returns of the z-scores of the next bars need the `zscore_window + 1` previous prices
+            context = pd.concat([context, cleaned.iloc[-(zscore_window + 1):]]).iloc[-(zscore_window + 1):]
+            yield cleaned, report
+        chunk = following
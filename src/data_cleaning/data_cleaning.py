@@ -5,7 +5,8 @@ This script reads ingested data from Weights & Biases, applies data cleaning ste
 and uploads the cleaned data back to Weights & Biases.
 
 Usage:
-    python data_cleaning.py --input_artifact <input_artifact> --output_artifact <output_artifact> --output_type <output_type> --output_description <output_description>
+    python data_cleaning.py --input_artifact <input_artifact> --output_artifact <output_artifact> --output_type <output_type> --output_description <output_description> [--artifact_format <artifact_format>]
+                            [--calendar XNYS] [--zscore_window <window>] [--zscore_threshold <threshold>] [--repair true] [--chunk_rows <rows>]
 
 Author:
     Ahmed Nassar
@@ -15,6 +16,19 @@ Arguments:
     - output_artifact (str): The name of the artifact to be created for the cleaned data.
     - output_type (str): The type of the output data artifact.
     - output_description (str): Description of the output data artifact.
+    - artifact_format (str, optional): Format of the cleaned data, 'csv' (default) or 'parquet'.
+    - calendar (str, optional): Exchange trading calendar of the gap check, 'XNYS' (default) or 'B' (business days).
+    - zscore_window (int, optional): Number of previous returns of the outlier z-scores (default: 20).
+    - zscore_threshold (float, optional): Absolute z-score above which a return is an outlier (default: 5.0).
+    - repair (bool, optional): Repair the invalid values and the high and low of inconsistent bars (default: false).
+    - chunk_rows (int, optional): Number of rows read, cleaned and written at a time, 0 to load and clean all
+      the rows at once (default: 0).
+
+The missing values are interpolated in time and the gaps, outliers and inconsistent bars are
+reported in the log and in the run summary, see `cleaning_engine`. With `chunk_rows`, the data is
+streamed from the artifact file to the cleaned file (see `clean_file`), so the memory used by the
+step does not grow with the history. The rows must then be sorted by date (and grouped by symbol
+for a file with a `symbol` column).
 
 Example:
     $ python data_cleaning.py --input_artifact stock_data --output_artifact clean_stock_data --output_type cleaned_data --output_description "Data with interpolated missing values"
@@ -26,12 +40,18 @@ import sys
 import argparse
 import logging
 import wandb
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
 
-from src.utils.utils import read_data_from_wandb,upload_data_to_wandb
+from src.utils.artifacts import init_run
+from src.utils.utils import read_data_from_wandb,upload_data_to_wandb,save_data,to_columnar,download_data_file
+from src.data_cleaning.cleaning_engine import (clean_chunks, clean_frame, frame_axes, VALUE_COLUMNS, DEFAULT_CALENDAR,
+                                               DEFAULT_ZSCORE_WINDOW, DEFAULT_ZSCORE_THRESHOLD)
 
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(filename='data_cleaning.log' ,level=logging.INFO, format=log_fmt)
@@ -48,62 +68,204 @@ def parse_arguments():
     parser.add_argument("--output_artifact", type=str, help="Name of the artifact for the cleaned data", required=True)
     parser.add_argument("--output_type", type=str, help="Type of the output data artifact", required=True)
     parser.add_argument("--output_description", type=str, help="Description of the output data artifact", required=True)
+    parser.add_argument("--artifact_format", type=str, choices=["csv", "parquet"], help="Format of the output data", default="csv")
+    parser.add_argument("--calendar", type=str, help="Exchange trading calendar of the gap check", default=DEFAULT_CALENDAR)
+    parser.add_argument("--zscore_window", type=int, help="Number of previous returns of the outlier z-scores",
+                        default=DEFAULT_ZSCORE_WINDOW)
+    parser.add_argument("--zscore_threshold", type=float, help="Absolute z-score above which a return is an outlier",
+                        default=DEFAULT_ZSCORE_THRESHOLD)
+    parser.add_argument("--repair", type=lambda value: str(value).lower() == "true",
+                        help="Repair the invalid values and inconsistent bars (true or false)", default=False)
+    parser.add_argument("--chunk_rows", type=int, help="Number of rows read, cleaned and written at a time, 0 for all the rows",
+                        default=0)
     return parser.parse_args()
 
 
-def clean_data(df):
+def _pass_order(df):
+    # Order of the rows grouped by symbol, in the order of their first bar, and sorted by date, None if they already are
+    symbols, dates = frame_axes(df)
+    if dates is None or len(df) < 2:
+        return None
+    codes = np.zeros(len(df), dtype=np.int64) if symbols is None else pd.factorize(symbols)[0]
+    times = dates.asi8
+    same = codes[1:] == codes[:-1]
+    if np.all((codes[1:] > codes[:-1]) | (same & (times[1:] >= times[:-1]))):
+        return None
+    return np.lexsort([times, codes])
+
+
+def clean_data(df, calendar=DEFAULT_CALENDAR, zscore_window=DEFAULT_ZSCORE_WINDOW,
+               zscore_threshold=DEFAULT_ZSCORE_THRESHOLD, repair=False, return_report=False):
     """
     Apply data cleaning steps to the DataFrame.
 
+    The missing values of all the value columns are interpolated in time in a single pass, per symbol
+    for a panel indexed by (symbol, date), and the gaps, outliers and inconsistent bars are reported
+    (see `cleaning_engine`). The input DataFrame is not modified. Bars already grouped by symbol and
+    sorted by date are cleaned without reordering them, see `clean_file` to stream a file by chunks.
+
     Parameters:
-        df (pd.DataFrame): The DataFrame to be cleaned.
+        df (pd.DataFrame): The DataFrame to be cleaned, with a `Date` column or index, or a (symbol, date) index.
+        calendar (str): Trading calendar of the gap check, e.g. 'XNYS' or 'B' (business days), None to skip it.
+        zscore_window (int): Number of previous returns of the outlier z-scores.
+        zscore_threshold (float): Absolute z-score above which a return is an outlier, None to skip the check.
+        repair (bool): Interpolate the invalid prices and volumes, and widen the high and low to the range of the bar.
+        return_report (bool): Also return the report of the issues of the data.
 
     Returns:
-        pd.DataFrame: The cleaned DataFrame.
+        pd.DataFrame: The cleaned DataFrame, with lower case column names, in the order of the input.
+        pd.DataFrame: The report of the issues (symbol, date, check, detail), if `return_report` is set.
     """
     try:
         logging.info("Cleaning data...")
-        #df.set_index('Date')
+        # The value columns are replaced, the input is not modified
+        df = df.copy(deep=False)
         df.columns = df.columns.str.lower().str.replace(' ', '_')
 
-        df['open'] = df['open'].interpolate(method='linear' , limit_direction = 'both')
-        df['high'] = df['high'].interpolate(method='linear', limit_direction = 'both')
-        df['low'] = df['low'].interpolate(method='linear', limit_direction = 'both')
-        df['close'] = df['close'].interpolate(method='linear', limit_direction = 'both')
-        df['adj_close'] = df['adj_close'].interpolate(method='linear', limit_direction = 'both')
-        df['volume'] = df['volume'].interpolate(method='linear', limit_direction = 'both')
+        order = _pass_order(df)
+        cleaned, report = clean_frame(df if order is None else df.iloc[order], calendar=calendar,
+                                      zscore_window=zscore_window, zscore_threshold=zscore_threshold, repair=repair)
+        if order is None:
+            df = cleaned
+        else:
+            # Restored in the order of the input
+            for column in [column for column in VALUE_COLUMNS if column in df.columns]:
+                values = np.empty(len(df), dtype=cleaned[column].dtype)
+                values[order] = cleaned[column].to_numpy()
+                df[column] = values
+        report = report.sort_values(['symbol', 'date'], kind='stable', ignore_index=True)
+
+        for check, count in report['check'].value_counts().items():
+            logging.info(f"{check}: {count}")
         logging.info("Data cleaned successfully")
-        return df
+        return (df, report) if return_report else df
     except Exception as e:
         logging.error(f"Error occurred while cleaning data: {str(e)}")
         raise ValueError(f"Failed to clean data: {str(e)}")
 
+
+def _read_chunks(path, chunk_rows):
+    # Chunks of a file saved with `save_data`, the date index of a columnar file is returned as a column
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            chunk = pa.Table.from_batches([batch]).to_pandas()
+            yield chunk.reset_index() if isinstance(chunk.index, pd.DatetimeIndex) else chunk
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def _sorted_chunks(chunks):
+    # Lower case column names, and check that the bars are grouped by symbol and sorted by date across the chunks
+    seen, last = set(), None
+    for chunk in chunks:
+        chunk.columns = chunk.columns.str.lower().str.replace(' ', '_')
+        symbols, dates = frame_axes(chunk)
+        if dates is not None and len(chunk):
+            symbols = np.zeros(len(chunk)) if symbols is None else symbols
+            dates = dates.asi8
+            if last is None:
+                seen.add(symbols[0])
+            else:
+                symbols, dates = np.concatenate([[last[0]], symbols]), np.concatenate([[last[1]], dates])
+            same = symbols[1:] == symbols[:-1]
+            starts = set(symbols[1:][~same])
+            if (same & (dates[1:] < dates[:-1])).any() or len(starts) < (~same).sum() or starts & seen:
+                logging.error("The rows of the file are not grouped by symbol and sorted by date")
+                raise ValueError("The rows of the file are not grouped by symbol and sorted by date, use clean_data")
+            seen |= starts
+            last = symbols[-1], dates[-1]
+        yield chunk
+
+
+def clean_file(input_path, output_path, chunk_rows, calendar=DEFAULT_CALENDAR, zscore_window=DEFAULT_ZSCORE_WINDOW,
+               zscore_threshold=DEFAULT_ZSCORE_THRESHOLD, repair=False, file_format='csv'):
+    """
+    Clean a data file by chunks, streaming the cleaned chunks to the output file.
+
+    Only a chunk of rows and the context of the next chunk are held in memory, and the output is the
+    same as the file saved from `clean_data`. The rows must be sorted by date, and grouped by symbol
+    for a file with a `symbol` column.
+
+    Parameters:
+        input_path (str): Path of the data file, saved with `save_data` (csv or parquet).
+        output_path (str): Path of the cleaned file, its extension is replaced by the one of the format.
+        chunk_rows (int): Number of rows read, cleaned and written at a time.
+        calendar (str): Trading calendar of the gap check, e.g. 'XNYS' or 'B' (business days), None to skip it.
+        zscore_window (int): Number of previous returns of the outlier z-scores.
+        zscore_threshold (float): Absolute z-score above which a return is an outlier, None to skip the check.
+        repair (bool): Interpolate the invalid prices and volumes, and widen the high and low to the range of the bar.
+        file_format (str): 'parquet' for the typed columnar format, or 'csv'.
+
+    Returns:
+        str: The path of the cleaned file.
+        pd.Series: The number of issues of each check.
+    """
+    try:
+        logging.info(f"Cleaning {input_path} by chunks of {chunk_rows} rows...")
+        output_path = os.path.splitext(output_path)[0] + '.' + file_format
+        counts = pd.Series(dtype=np.int64)
+        writer, written = None, False
+        try:
+            chunks = _sorted_chunks(_read_chunks(input_path, chunk_rows))
+            for cleaned, report in clean_chunks(chunks, zscore_window=zscore_window, calendar=calendar,
+                                                zscore_threshold=zscore_threshold, repair=repair):
+                counts = counts.add(report['check'].value_counts(), fill_value=0)
+                if file_format == 'parquet':
+                    table = pa.Table.from_pandas(to_columnar(cleaned), preserve_index=True)
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                else:
+                    cleaned.to_csv(output_path, mode='a' if written else 'w', header=not written)
+                written = True
+        finally:
+            if writer is not None:
+                writer.close()
+        counts = counts.astype(np.int64)
+        for check, count in counts.items():
+            logging.info(f"{check}: {count}")
+        logging.info(f"Data cleaned successfully into {output_path}")
+        return output_path, counts
+    except Exception as e:
+        logging.error(f"Error occurred while cleaning data: {str(e)}")
+        raise ValueError(f"Failed to clean data: {str(e)}")
+
+
 if __name__ == "__main__":
     try:
         
-        run = wandb.init()
+        run = init_run()
         
         # Parse command-line arguments
         args = parse_arguments()
 
-        # Read data from W&B
-        data = read_data_from_wandb(run ,
-                                    args.input_artifact ,
-                                    os.path.join(os.path.dirname(__file__),
+        download_path = os.path.join(os.path.dirname(__file__),
                                                  "..",
                                                  ".." ,
                                                  "artifacts" ,
-                                                 "data_ingestion"))
-        data.set_index('Date')
-        # Clean the data
-        cleaned_data = clean_data(data)
+                                                 "data_ingestion")
         cleaned_data_path = os.path.join(os.path.dirname(__file__),
                                                  "..",
                                                  ".." ,
                                                  "artifacts" ,
                                                  "data_cleaning",
                                                  "cleaned_data.csv")
-        cleaned_data.to_csv(cleaned_data_path)
+        options = dict(calendar=args.calendar, zscore_window=args.zscore_window,
+                       zscore_threshold=args.zscore_threshold, repair=args.repair)
+        # The dates of the `Date` column are the time axis of the interpolation
+        if args.chunk_rows:
+            # Stream the chunks of the artifact file to the cleaned file
+            input_path = download_data_file(run, args.input_artifact, download_path)
+            cleaned_data_path, counts = clean_file(input_path, cleaned_data_path, args.chunk_rows,
+                                                   file_format=args.artifact_format, **options)
+        else:
+            # Read data from W&B
+            data = read_data_from_wandb(run, args.input_artifact, download_path)
+            cleaned_data, report = clean_data(data, return_report=True, **options)
+            counts = report['check'].value_counts()
+            cleaned_data_path = save_data(cleaned_data, cleaned_data_path, args.artifact_format)
+        for check, count in counts.items():
+            run.summary[check] = count
 
         upload_data_to_wandb(run , cleaned_data_path , args.output_artifact, args.output_type, args.output_description)
 
@@ -2,9 +2,11 @@
 Stock Data Retrieval Script
 
 This script retrieves historical stock data for a specified stock using the yfinance library.
+When a universe of tickers is given, the data of every ticker is retrieved concurrently and
+saved to one CSV file per ticker.
 
 Usage:
-python data_ingestion.py --stock_name <stock_name> --start_date <start_date> --end_date <end_date> --output_artifact <output_artifact> --output_type <output_type> --output_description <output_description>
+python data_ingestion.py --stock_name <stock_name> --start_date <start_date> --end_date <end_date> --output_artifact <output_artifact> --output_type <output_type> --output_description <output_description> [--universe <tickers or file>] [--max_workers <max_workers>] [--incremental true] [--artifact_format parquet] [--price_source_dir <directory>]
 
 Author:
 Ahmed Nassar
@@ -16,6 +18,15 @@ Arguments:
 - output_artifact (str): The name of the output data in Weights & Biases.
 - output_type (str): The type of output data.
 - output_description (str): Description of the output data.
+- universe (str, optional): Comma-separated list of tickers, or path to a file with one ticker per line.
+  When given, every ticker of the universe is downloaded instead of stock_name.
+- max_workers (int, optional): Maximum number of tickers downloaded at the same time in universe mode.
+- incremental (bool, optional): Only download the bars newer than the ones already stored and merge them
+  into the existing files instead of downloading the full history.
+- artifact_format (str, optional): Format of the uploaded data, 'csv' (default) or 'parquet'.
+  The incremental store and the universe files are always kept as CSV.
+- price_source_dir (str, optional): Directory of `<stock_name>.csv` files read instead of Yahoo Finance,
+  to run the pipeline without network.
 
 Example:
 $ python data_ingestion.py --stock_name AAPL --start_date 2022-01-01 --end_date 2022-12-31 --output_artifact clean_stock_data --output_type cleaned_data --output_description "Data with outliers and null values removed"
@@ -27,19 +38,29 @@ Notes:
 
 import sys
 import os
+import json
+import time
 import logging
-import yfinance as yf
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import wandb
 
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
 
-from src.utils.utils import upload_data_to_wandb
+from src.utils.utils import upload_data_to_wandb, save_data, load_data
+from src.utils.artifacts import init_run
+from src.data_ingestion.price_sources import YahooPriceSource, LocalPriceSource
 
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(filename='data_ingestion.log' ,level=logging.INFO, format=log_fmt)
+
+WATERMARK_FILE = '_watermarks.json'
+_watermark_lock = threading.Lock()
+
 def parse_arguments():
     """
     Parse command-line arguments.
@@ -54,18 +75,26 @@ def parse_arguments():
     parser.add_argument("--output_artifact", type=str, help="output data name in wandb", required=True)
     parser.add_argument("--output_type", type=str, help="type of output data", required=True)
     parser.add_argument("--output_description", type=str, help="data cleaning is applied to the input data", required=True)
+    parser.add_argument("--universe", type=str, help="comma-separated tickers or path to a file of tickers", default="")
+    parser.add_argument("--max_workers", type=int, help="maximum number of concurrent downloads", default=8)
+    parser.add_argument("--incremental", type=lambda value: str(value).lower() == "true",
+                        help="only download bars newer than the stored ones", default=False)
+    parser.add_argument("--artifact_format", type=str, choices=["csv", "parquet"], help="format of the output data", default="csv")
+    parser.add_argument("--price_source_dir", type=str, help="directory of stock files read instead of Yahoo Finance", default="")
     return parser.parse_args()
 
 
-def download_stock_data(stock_name, start_date, end_date, output_path):
+def download_stock_data(stock_name, start_date, end_date, output_path, price_source=None):
     """
-    Download stock data from Yahoo Finance and save it to a CSV file.
+    Download stock data from Yahoo Finance and save it to a CSV file, or a Parquet file
+    when output_path has a `.parquet` extension.
 
     Parameters:
         stock_name (str): The name of the stock.
         start_date (str): The start date for the historical data (YYYY-MM-DD).
         end_date (str): The end date for the historical data (YYYY-MM-DD).
         output_path (str): The path where the downloaded data will be saved.
+        price_source (PriceSource, optional): Source of the stock data. Defaults to Yahoo Finance.
 
     Raises:
         ValueError: If no data is available for the specified stock.
@@ -74,17 +103,18 @@ def download_stock_data(stock_name, start_date, end_date, output_path):
         None
     """
     logging.info(f"Downloading data for {stock_name} stock")
+    price_source = price_source or YahooPriceSource()
 
     try:
-        # Retrieve stock data using yfinance
-        stock_data = yf.download(stock_name, start=start_date, end=end_date)
+        # Retrieve stock data
+        stock_data = price_source.fetch(stock_name, start_date, end_date)
 
         # Check if data is retrieved successfully
         if stock_data.empty:
             raise ValueError(f"No data available for the stock '{stock_name}'")
 
         # Save stock data
-        stock_data.to_csv(output_path, index=True)
+        save_data(stock_data, output_path, 'parquet' if output_path.endswith('.parquet') else 'csv')
 
         logging.info(f"Stock data downloaded and saved to {output_path}")
 
@@ -92,24 +122,314 @@ def download_stock_data(stock_name, start_date, end_date, output_path):
         logging.error(f"An error occurred while downloading stock data: {str(e)}")
 
 
+def read_universe(universe):
+    """
+    Read the tickers of a universe.
+
+    Parameters:
+        universe (str): Comma-separated list of tickers, or path to a file containing
+        tickers separated by new lines or commas. Lines starting with '#' are ignored.
+
+    Returns:
+        list: The tickers of the universe, without duplicates and in their original order.
+    """
+    if os.path.isfile(universe):
+        with open(universe) as fp:
+            lines = [line.split('#')[0] for line in fp]
+        universe = ','.join(lines)
+
+    tickers = [ticker.strip() for ticker in universe.split(',')]
+    return list(dict.fromkeys(ticker for ticker in tickers if ticker))
+
+
+def fetch_with_retry(price_source, stock_name, start_date, end_date, retries=3, backoff=1.0, allow_empty=False):
+    """
+    Retrieve stock data, retrying with exponential backoff when the source fails.
+
+    Parameters:
+        price_source (PriceSource): Source of the stock data.
+        stock_name (str): The name of the stock.
+        start_date (str): The start date for the historical data (YYYY-MM-DD).
+        end_date (str): The end date for the historical data (YYYY-MM-DD).
+        retries (int): Number of retries after the first failed attempt.
+        backoff (float): Waiting time in seconds before the first retry, doubled after each retry.
+        allow_empty (bool): Return an empty DataFrame instead of retrying when the source has no
+            data for the dates, e.g. when no session closed since the last stored bar.
+
+    Raises:
+        ValueError: If no data could be retrieved after all the attempts.
+
+    Returns:
+        tuple: The retrieved DataFrame and the number of attempts made.
+    """
+    for attempt in range(retries + 1):
+        try:
+            stock_data = price_source.fetch(stock_name, start_date, end_date)
+            if stock_data.empty and not allow_empty:
+                raise ValueError(f"No data available for the stock '{stock_name}'")
+            return stock_data, attempt + 1
+        except Exception as e:
+            if attempt == retries:
+                raise ValueError(f"Failed to download '{stock_name}' after {attempt + 1} attempts: {str(e)}")
+            logging.warning(f"Attempt {attempt + 1} to download '{stock_name}' failed: {str(e)}")
+            time.sleep(backoff * 2 ** attempt)
+
+
+def read_watermarks(watermark_path):
+    """
+    Read the watermark file of a store.
+
+    Parameters:
+        watermark_path (str): Path of the watermark file.
+
+    Returns:
+        dict: The last stored timestamp (ISO format) of each stock, empty if the file does not exist.
+    """
+    if not os.path.isfile(watermark_path):
+        return {}
+    with open(watermark_path) as fp:
+        return json.load(fp)
+
+
+def update_watermark(watermark_path, stock_name, timestamp):
+    """
+    Record the last stored timestamp of a stock in the watermark file.
+
+    The file is replaced atomically so a crash never leaves a partially written watermark.
+
+    Parameters:
+        watermark_path (str): Path of the watermark file.
+        stock_name (str): The name of the stock.
+        timestamp (pd.Timestamp): The last stored timestamp of the stock.
+    """
+    with _watermark_lock:
+        watermarks = read_watermarks(watermark_path)
+        watermarks[stock_name] = pd.Timestamp(timestamp).isoformat()
+        tmp_path = watermark_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(watermarks, fp, indent=2, sort_keys=True)
+        os.replace(tmp_path, watermark_path)
+
+
+def read_last_timestamp(path):
+    """
+    Read the timestamp of the last row of a stored CSV file without parsing the whole file.
+
+    Parameters:
+        path (str): Path of the CSV file, with the timestamps in the first column.
+
+    Returns:
+        pd.Timestamp: The last stored timestamp, or None if the file does not exist or has no rows.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'rb') as fp:
+        fp.seek(0, os.SEEK_END)
+        position = fp.tell()
+        block = b''
+        # Read backwards until the last complete line is in the block
+        while position > 0 and block.rstrip(b'\r\n').count(b'\n') < 1:
+            step = min(4096, position)
+            position -= step
+            fp.seek(position)
+            block = fp.read(step) + block
+
+    last_line = block.rstrip(b'\r\n').split(b'\n')[-1].decode()
+    try:
+        return pd.Timestamp(last_line.split(',')[0])
+    except ValueError:
+        # Only the header is stored
+        return None
+
+
+def incremental_download(stock_name, end_date, output_path, price_source=None, start_date=None,
+                         watermark_path=None, retries=3, backoff=1.0):
+    """
+    Download only the bars of a stock newer than the ones already stored, and merge them into the store.
+
+    The last stored timestamp is read from the watermark file. When the store matches the watermark,
+    the new bars are appended to it, otherwise (missing watermark, or a run that crashed between the
+    store and the watermark updates) the store is read, merged with the new bars and deduplicated.
+
+    Parameters:
+        stock_name (str): The name of the stock.
+        end_date (str): The end date for the historical data (YYYY-MM-DD).
+        output_path (str): Path of the stored CSV file of the stock.
+        price_source (PriceSource, optional): Source of the stock data. Defaults to Yahoo Finance.
+        start_date (str, optional): Start date used when nothing is stored yet for the stock.
+        watermark_path (str, optional): Path of the watermark file.
+            Defaults to `_watermarks.json` next to the stored file.
+        retries (int): Number of retries of a failed download.
+        backoff (float): Waiting time in seconds before the first retry.
+
+    Raises:
+        ValueError: If nothing is stored and no start_date is given, or the download fails.
+
+    Returns:
+        tuple: The number of new rows stored and the number of download attempts.
+    """
+    price_source = price_source or YahooPriceSource()
+    watermark_path = watermark_path or os.path.join(os.path.dirname(output_path), WATERMARK_FILE)
+
+    watermark = read_watermarks(watermark_path).get(stock_name)
+    watermark = pd.Timestamp(watermark) if watermark else None
+    last_stored = read_last_timestamp(output_path)
+
+    if last_stored is None:
+        if start_date is None:
+            raise ValueError(f"Nothing stored for the stock '{stock_name}' and no start date given")
+        fetch_start = pd.Timestamp(start_date)
+    else:
+        fetch_start = last_stored.normalize() + pd.Timedelta(days=1)
+
+    if fetch_start >= pd.Timestamp(end_date):
+        logging.info(f"{stock_name} is up to date ({last_stored})")
+        if last_stored is not None and last_stored != watermark:
+            update_watermark(watermark_path, stock_name, last_stored)
+        return 0, 0
+
+    logging.info(f"Downloading data for {stock_name} stock from {fetch_start.date()}")
+    # An up to date store gets no bars on weekends, holidays or before the close
+    new_data, attempts = fetch_with_retry(price_source, stock_name, fetch_start.strftime('%Y-%m-%d'), end_date,
+                                          retries=retries, backoff=backoff, allow_empty=last_stored is not None)
+    if new_data.empty:
+        logging.info(f"No new bars for {stock_name} since {last_stored}")
+        return 0, attempts
+    new_data.index = pd.to_datetime(new_data.index)
+    if last_stored is not None:
+        new_data = new_data[new_data.index > last_stored]
+    if new_data.empty:
+        return 0, attempts
+
+    if last_stored is not None and last_stored == watermark:
+        # The store is consistent with the watermark: append the new bars
+        columns = pd.read_csv(output_path, index_col=0, nrows=0).columns
+        new_data.reindex(columns=columns).to_csv(output_path, mode='a', header=False)
+        new_rows = len(new_data)
+    else:
+        stored = pd.read_csv(output_path, index_col=0, parse_dates=True) if last_stored is not None else None
+        merged = pd.concat([stored, new_data]) if stored is not None else new_data
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        new_rows = len(merged) - (len(stored) if stored is not None else 0)
+        tmp_path = output_path + '.tmp'
+        merged.to_csv(tmp_path, index=True)
+        os.replace(tmp_path, output_path)
+
+    update_watermark(watermark_path, stock_name, new_data.index.max())
+    logging.info(f"{new_rows} new rows stored for {stock_name} in {output_path}")
+    return new_rows, attempts
+
+
+def download_universe(stock_names, start_date, end_date, output_dir, price_source=None,
+                      max_workers=8, retries=3, backoff=1.0, incremental=False):
+    """
+    Download the data of several stocks concurrently and save one CSV file per stock.
+
+    Parameters:
+        stock_names (list): The names of the stocks.
+        start_date (str): The start date for the historical data (YYYY-MM-DD).
+        end_date (str): The end date for the historical data (YYYY-MM-DD).
+        output_dir (str): Directory where `<stock_name>.csv` files will be saved.
+        price_source (PriceSource, optional): Source of the stock data. Defaults to Yahoo Finance.
+        max_workers (int): Maximum number of stocks downloaded at the same time.
+        retries (int): Number of retries of a failed download.
+        backoff (float): Waiting time in seconds before the first retry.
+        incremental (bool): Only download the bars newer than the stored ones, see `incremental_download`.
+
+    Returns:
+        pd.DataFrame: Report with the status, number of new rows, attempts and duration of each stock.
+    """
+    price_source = price_source or YahooPriceSource()
+    os.makedirs(output_dir, exist_ok=True)
+
+    def download(stock_name):
+        start = time.perf_counter()
+        record = {"stock_name": stock_name, "status": "ok", "rows": 0, "attempts": 0, "error": None}
+        output_path = os.path.join(output_dir, stock_name + '.csv')
+        try:
+            if incremental:
+                record["rows"], record["attempts"] = incremental_download(stock_name, end_date, output_path,
+                                                                          price_source=price_source,
+                                                                          start_date=start_date,
+                                                                          retries=retries, backoff=backoff)
+            else:
+                stock_data, record["attempts"] = fetch_with_retry(price_source, stock_name, start_date, end_date,
+                                                                  retries=retries, backoff=backoff)
+                stock_data.to_csv(output_path, index=True)
+                record["rows"] = len(stock_data)
+        except Exception as e:
+            record["status"] = "failed"
+            record["attempts"] = retries + 1
+            record["error"] = str(e)
+            logging.error(f"An error occurred while downloading stock data: {str(e)}")
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        logging.info(f"{stock_name}: {record['status']} - {record['rows']} rows in {record['seconds']}s")
+        return record
+
+    logging.info(f"Downloading data for {len(stock_names)} stocks with {max_workers} workers")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        report = pd.DataFrame(list(executor.map(download, stock_names)),
+                              columns=["stock_name", "status", "rows", "attempts", "seconds", "error"])
+
+    logging.info(f"Universe downloaded: {int((report['status'] == 'ok').sum())}/{len(report)} stocks succeeded")
+    return report
+
+
 if __name__ == '__main__':
     
 
     logging.info("Starting data_ingestion ...")
     args = parse_arguments()
+    price_source = LocalPriceSource(args.price_source_dir) if args.price_source_dir else YahooPriceSource()
     
-    download_path = os.path.join(os.path.dirname(__file__),
+    if args.universe:
+        download_path = os.path.join(os.path.dirname(__file__),
+                                     "..",
+                                     ".." ,
+                                     "artifacts" ,
+                                     "data_ingestion",
+                                     args.output_artifact)
+
+        report = download_universe(read_universe(args.universe),
+                                   args.start_date,
+                                   args.end_date,
+                                   download_path,
+                                   price_source=price_source,
+                                   max_workers=args.max_workers,
+                                   incremental=args.incremental)
+        print(report.to_string(index=False))
+        metadata = {"stocks": int((report["status"] == "ok").sum()),
+                    "failed": report.loc[report["status"] == "failed", "stock_name"].tolist()}
+
+        run = init_run()
+        upload_data_to_wandb(run, download_path, args.output_artifact, args.output_type, args.output_description,
+                             metadata=metadata, file_flag=False)
+        wandb.finish()
+    else:
+        download_path = os.path.join(os.path.dirname(__file__),
                                      "..",
                                      ".." ,
                                      "artifacts" ,
                                      "data_ingestion",
                                      args.stock_name + '.csv')
 
-    download_stock_data(args.stock_name,
-                        args.start_date,
-                        args.end_date,
-                        download_path)
-        
-    run = wandb.init()
-    upload_data_to_wandb(run ,download_path, args.output_artifact, args.output_type, args.output_description )
-    wandb.finish()
\ No newline at end of file
+        if args.incremental:
+            incremental_download(args.stock_name,
+                                 args.end_date,
+                                 download_path,
+                                 price_source=price_source,
+                                 start_date=args.start_date)
+            if args.artifact_format != 'csv':
+                download_path = save_data(load_data(download_path), download_path, args.artifact_format)
+        else:
+            download_path = os.path.splitext(download_path)[0] + '.' + args.artifact_format
+            download_stock_data(args.stock_name,
+                                args.start_date,
+                                args.end_date,
+                                download_path,
+                                price_source=price_source)
+
+        run = init_run()
+        upload_data_to_wandb(run ,download_path, args.output_artifact, args.output_type, args.output_description )
+        wandb.finish()
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Price Sources
+
+This module defines the interface used by the ingestion step to retrieve historical
+stock prices, together with the implementations shipped with the project.
+
+Classes:
+- PriceSource: Base interface, a source only needs to implement `fetch`.
+- YahooPriceSource: Retrieves prices from the Yahoo Finance API using yfinance.
+- LocalPriceSource: Reads prices from `<stock_name>.csv` files stored in a local directory.
+  It is used as a stand-in for Yahoo Finance in tests and offline runs.
+"""
+
+import os
+import pandas as pd
+import yfinance as yf
+
+
+class PriceSource:
+    """
+    Interface of a historical price source.
+
+    Methods:
+        fetch(self, stock_name, start_date, end_date): Return the daily bars of a stock
+        between start_date (inclusive) and end_date (exclusive) indexed by date.
+    """
+
+    def fetch(self, stock_name, start_date, end_date):
+        """
+        Retrieve historical data of a stock.
+
+        Parameters:
+            stock_name (str): The name or ticker symbol of the stock.
+            start_date (str): The start date for the historical data (YYYY-MM-DD).
+            end_date (str): The end date for the historical data (YYYY-MM-DD).
+
+        Returns:
+            pd.DataFrame: The stock data indexed by date.
+        """
+        raise NotImplementedError
+
+
+class YahooPriceSource(PriceSource):
+    """
+    Price source backed by the Yahoo Finance API.
+    """
+
+    def fetch(self, stock_name, start_date, end_date):
+        return yf.download(stock_name, start=start_date, end=end_date, progress=False)
+
+
+class LocalPriceSource(PriceSource):
+    """
+    Price source reading `<stock_name>.csv` files from a local directory.
+
+    Attributes:
+        directory (str): Directory containing one CSV file per stock, with a date column
+        as the first column (the format written by the ingestion step).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, stock_name, start_date, end_date):
+        path = os.path.join(self.directory, stock_name + '.csv')
+        if not os.path.isfile(path):
+            return pd.DataFrame()
+
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+        mask = (data.index >= pd.Timestamp(start_date)) & (data.index < pd.Timestamp(end_date))
+        return data.loc[mask]
@@ -11,6 +11,7 @@ Usage:
                                 --test_output_artifact <test_output_data_name>
                                 --test_output_type <test_output_data_type>
                                 --test_output_description <test_output_data_description>
+                                [--artifact_format <artifact_format>]
 
 Arguments:
     --input_artifact (str): Name of the input data artifact in Weights & Biases (wandb).
@@ -21,13 +22,14 @@ Arguments:
     --test_output_artifact (str): Name of the artifact for the testing data output in wandb.
     --test_output_type (str): Type of output data for testing data.
     --test_output_description (str): Description of the output data for testing data.
+    --artifact_format (str, optional): Format of the segregated data, 'csv' (default) or 'parquet'.
 
     
 Execution:
     - The script should be executed with required command-line arguments.
     - It reads data from the specified input artifact in wandb.
     - Segregates the data into training and testing datasets based on the specified percentage split.
-    - Saves the segregated datasets into CSV files.
+    - Saves the segregated datasets into CSV (or Parquet) files.
     - Uploads the segregated data to wandb with specified artifact names, types, and descriptions.
 
 Execution command example :
@@ -56,7 +58,8 @@ import wandb
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
 
-from src.utils.utils import read_data_from_wandb,upload_data_to_wandb
+from src.utils.artifacts import init_run
+from src.utils.utils import read_data_from_wandb,upload_data_to_wandb,save_data
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(filename='data_seggregation.log' ,level=logging.INFO, format=log_fmt)
 def parse_arguments():
@@ -76,6 +79,7 @@ def parse_arguments():
     parser.add_argument("--test_output_artifact", type=str, help="output data name in wandb", required=True)
     parser.add_argument("--test_output_type", type=str, help="type of output data", required=True)
     parser.add_argument("--test_output_description", type=str, help="description of the output data", required=True)
+    parser.add_argument("--artifact_format", type=str, choices=["csv", "parquet"], help="format of the output data", default="csv")
 
     return parser.parse_args()
 
@@ -112,7 +116,7 @@ if __name__ == '__main__':
     logging.info("Starting data_seggregation ...")
     args = parse_arguments()
     
-    run = wandb.init()
+    run = init_run()
         
     download_path = os.path.join(os.path.dirname(__file__),
                                                  "..",
@@ -130,7 +134,7 @@ if __name__ == '__main__':
                                                  "artifacts" ,
                                                  "data_seggregation",
                                                  "train_val.csv")
-    train_val_data.to_csv(train_val_data_path)
+    train_val_data_path = save_data(train_val_data, train_val_data_path, args.artifact_format)
     
     test_data_path = os.path.join(os.path.dirname(__file__),
                                                  "..",
@@ -138,7 +142,7 @@ if __name__ == '__main__':
                                                  "artifacts" ,
                                                  "data_seggregation",
                                                  "test.csv")
-    test_data.to_csv(test_data_path)
+    test_data_path = save_data(test_data, test_data_path, args.artifact_format)
     
     upload_data_to_wandb(run ,
                          train_val_data_path ,
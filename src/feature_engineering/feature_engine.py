@@ -0,0 +1,283 @@
+"""
+Feature Engine
+
+This module computes the technical analysis features of the feature engineering pipeline
+(RSI, ADL, OBV and MACD) directly from the price and volume arrays. The price differences are
+computed once and shared by the indicators, the exponential moving averages are computed by a
+linear filter, and the features are written into a single preallocated float32 matrix.
+
+The features are the same as the ones of `RSIFeatureExtractor`, `ADLFeatureExtractor`,
+`OBVFeatureExtractor` and `MACDFeatureExtractor` (pandas_ta RSI and MACD), in the order of
+their FeatureUnion. The input data is expected to have no missing values, as produced by the
+cleaning step.
+
+A multi-ticker panel is computed per symbol in one call: the symbols are laid out as the rows
+of a grid, so their indicators are computed by the same vectorized operations.
+
+The features of the last bars only need a warm-up window of history: the exponential averages
+forget the older bars geometrically, and the cumulative indicators (ADL, OBV) only need the sums
+of the bars before the window.
+
+Functions:
+- compute_features: Compute the feature matrix of price and volume arrays.
+- compute_panel_features: Compute the features of each symbol of a (symbol, date) indexed panel.
+- compute_tail_features: Compute the features of the last bars from a warm-up window.
+- warmup_rows: Number of bars of history needed by the exponential averages.
+- ema / rma: Exponential moving averages used by the indicators.
+"""
+
+import math
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+logger = logging.getLogger(__name__)
+
+# Columns of the feature matrix
+FEATURE_NAMES = ['rsi_14', 'adl', 'obv', 'macd', 'macd_hist', 'macd_signal']
+
+RSI_LENGTH = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+
+# Weight of the bars before the warm-up window in the exponential averages
+WARMUP_TOLERANCE = 1e-10
+
+
+def rma(values, length):
+    """
+    Wilder's moving average, the `ewm(alpha=1 / length, min_periods=length).mean()` of pandas_ta.
+
+    The first value is expected to be missing (e.g. a price difference) and is skipped.
+
+    Parameters:
+        values (np.ndarray): Input values, one series per row, the first value of each missing.
+        length (int): Period of the average.
+
+    Returns:
+        np.ndarray: The average, missing for the first `length` values.
+    """
+    out = np.full(values.shape, np.nan)
+    steps = values.shape[-1]
+    if steps <= length:
+        return out
+    decay = 1 - 1 / length
+    # Average weighted by the decayed weights of all the previous values (adjust=True)
+    weighted_sum = lfilter([1.0], [1.0, -decay], values[..., 1:])
+    weights = lfilter([1.0], [1.0, -decay], np.ones(steps - 1))
+    out[..., length:] = weighted_sum[..., length - 1:] / weights[length - 1:]
+    return out
+
+
+def ema(values, length, start=0):
+    """
+    Exponential moving average seeded with the simple average of its first period, as pandas_ta `ema`.
+
+    Parameters:
+        values (np.ndarray): Input values, one series per row.
+        length (int): Period of the average.
+        start (int): Position of the first valid value, the previous ones are ignored.
+
+    Returns:
+        np.ndarray: The average, missing before the position `start + length - 1`.
+    """
+    out = np.full(values.shape, np.nan)
+    first = start + length - 1
+    if values.shape[-1] <= first:
+        return out
+    alpha = 2 / (length + 1)
+    out[..., first] = values[..., start:first + 1].mean(axis=-1)
+    out[..., first + 1:], _ = lfilter([alpha], [1.0, alpha - 1], values[..., first + 1:],
+                                      zi=(1 - alpha) * out[..., first:first + 1])
+    return out
+
+
+def _indicators(close, high, low, volume):
+    """
+    Compute the features of series of bars stored as rows, a missing price ending its series.
+
+    Returns:
+        list: One float64 array per feature of FEATURE_NAMES, with the shape of the inputs.
+    """
+    # Differences shared by the indicators, missing for the first row
+    close_diff = np.full(close.shape, np.nan)
+    np.subtract(close[..., 1:], close[..., :-1], out=close_diff[..., 1:])
+    volume_diff = np.zeros(volume.shape)
+    np.subtract(volume[..., 1:], volume[..., :-1], out=volume_diff[..., 1:])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # RSI
+        gains = rma(np.where(close_diff > 0, close_diff, 0.0), RSI_LENGTH)
+        losses = np.abs(rma(np.where(close_diff < 0, close_diff, 0.0), RSI_LENGTH))
+        rsi = 100 * gains / (gains + losses)
+
+        # ADL
+        money_flow = close_diff / (high - low) * volume
+        money_flow[np.isnan(money_flow)] = 0
+        adl = np.cumsum(money_flow, axis=-1)
+
+    # OBV
+    obv = (close_diff > 0) * np.cumsum(volume_diff, axis=-1)
+
+    # MACD
+    macd = ema(close, MACD_FAST) - ema(close, MACD_SLOW)
+    signal = ema(macd, MACD_SIGNAL, start=MACD_SLOW - 1)
+    return [rsi, adl, obv, macd, macd - signal, signal]
+
+
+def compute_features(close, high, low, volume, out=None):
+    """
+    Compute the RSI, ADL, OBV and MACD features of price and volume arrays.
+
+    Parameters:
+        close (array-like): Close prices.
+        high (array-like): High prices.
+        low (array-like): Low prices.
+        volume (array-like): Traded volumes.
+        out (np.ndarray, optional): Preallocated float32 matrix of shape (rows, 6) to write the features to.
+
+    Returns:
+        np.ndarray: Float32 matrix with one column per feature of FEATURE_NAMES.
+    """
+    arrays = [np.asarray(values, dtype=np.float64) for values in (close, high, low, volume)]
+    rows = len(arrays[0])
+    if out is None:
+        out = np.empty((rows, len(FEATURE_NAMES)), dtype=np.float32)
+    if rows == 0:
+        return out
+
+    for column, feature in enumerate(_indicators(*arrays)):
+        out[:, column] = feature
+    return out
+
+
+def warmup_rows(tolerance=WARMUP_TOLERANCE):
+    """
+    Number of bars of history before a bar after which its exponential averages (RSI, MACD and its
+    signal) no longer depend on the older bars, up to a relative weight of `tolerance`.
+
+    Returns:
+        int: The number of bars of the warm-up window.
+    """
+    def forget(decay):
+        return math.ceil(math.log(tolerance) / math.log(decay))
+
+    rsi = 1 + forget(1 - 1 / RSI_LENGTH)
+    macd = forget(1 - 2 / (MACD_SLOW + 1))
+    # The signal is seeded once the slow average is defined
+    signal = MACD_SLOW + MACD_SIGNAL - 2 + forget(1 - 2 / (MACD_SIGNAL + 1))
+    return max(rsi, macd, signal)
+
+
+def compute_tail_features(close, high, low, volume, rows, warmup=None):
+    """
+    Compute the features of the last bars, as `compute_features(...)[-rows:]` does.
+
+    The RSI and MACD are computed over the last `rows` bars and their warm-up window only, and the
+    ADL and OBV from the sums of the money flows and volume changes of the bars before the window.
+
+    Parameters:
+        close, high, low, volume (array-like): Prices and volumes of the whole history.
+        rows (int): Number of last bars.
+        warmup (int, optional): Number of bars of history before the last bars, `warmup_rows()` if None.
+
+    Returns:
+        np.ndarray: Float32 matrix of the last bars, with one column per feature of FEATURE_NAMES.
+    """
+    arrays = [np.asarray(values, dtype=np.float64) for values in (close, high, low, volume)]
+    rows = min(rows, len(arrays[0]))
+    start = max(0, len(arrays[0]) - rows - (warmup_rows() if warmup is None else warmup))
+    if start == 0:
+        return compute_features(*arrays)[len(arrays[0]) - rows:]
+
+    close, high, low, volume = arrays
+    # ADL and OBV of the first bar of the window, accumulated from the first bar of the history
+    with np.errstate(divide='ignore', invalid='ignore'):
+        money_flow = np.diff(close[:start + 1]) / (high[1:start + 1] - low[1:start + 1]) * volume[1:start + 1]
+    money_flow[np.isnan(money_flow)] = 0
+    volume_change = np.sum(np.diff(volume[:start + 1]))
+
+    features = _indicators(*[values[start:] for values in arrays])
+    close_diff = np.diff(close[start - 1:])
+    features[1] = features[1] + np.sum(money_flow)
+    features[2] = features[2] + (close_diff > 0) * volume_change
+
+    out = np.empty((rows, len(FEATURE_NAMES)), dtype=np.float32)
+    for column, feature in enumerate(features):
+        out[:, column] = feature[-rows:]
+    return out
+
+
+def _grouped_features(close, high, low, volume, starts):
+    """
+    Compute the features of consecutive groups of bars, each group being the history of one symbol.
+
+    The groups are scattered into the rows of a (groups, longest group) grid, aligned on their
+    first bar, so the indicators of all the groups are computed by the same vectorized operations.
+
+    Parameters:
+        close, high, low, volume (np.ndarray): Bars sorted by symbol and date.
+        starts (np.ndarray): Row of the first bar of each group.
+
+    Returns:
+        np.ndarray: Float32 matrix with one column per feature of FEATURE_NAMES.
+    """
+    lengths = np.diff(np.append(starts, len(close)))
+    width = lengths.max()
+    # Position of each bar in the flattened grid
+    cells = np.arange(len(close)) + np.repeat(np.arange(len(lengths)) * width - starts, lengths)
+
+    grids = []
+    for values in (close, high, low, volume):
+        # The missing prices after the end of the shorter groups do not affect their features
+        grid = np.full((len(lengths), width), np.nan)
+        grid.ravel()[cells] = values
+        grids.append(grid)
+
+    out = np.empty((len(close), len(FEATURE_NAMES)), dtype=np.float32)
+    for column, feature in enumerate(_indicators(*grids)):
+        out[:, column] = feature.ravel()[cells]
+    return out
+
+
+def compute_panel_features(panel, max_workers=1):
+    """
+    Compute the features of each symbol of a multi-ticker panel.
+
+    The indicators never mix the bars of different symbols. The symbols can be split in chunks of
+    similar sizes computed in a process pool.
+
+    Parameters:
+        panel (pd.DataFrame): Bars indexed by (symbol, date), with `close`, `high`, `low` and `volume` columns.
+        max_workers (int): Number of processes computing chunks of symbols, 1 to compute them in this process.
+
+    Returns:
+        pd.DataFrame: Float32 features of FEATURE_NAMES, with the index of the panel.
+    """
+    if panel.index.nlevels != 2:
+        logger.error("The panel must be indexed by (symbol, date)")
+        raise ValueError("The panel must be indexed by (symbol, date)")
+
+    # Sort the bars by symbol and date, each symbol is a contiguous group
+    codes, _ = pd.factorize(panel.index.get_level_values(0))
+    order = np.lexsort((panel.index.get_level_values(1), codes))
+    codes = codes[order]
+    arrays = [panel[column].to_numpy(dtype=np.float64)[order] for column in ('close', 'high', 'low', 'volume')]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+    features = np.empty((len(panel), len(FEATURE_NAMES)), dtype=np.float32)
+    if len(panel) and (max_workers <= 1 or len(starts) == 1):
+        features[order] = _grouped_features(*arrays, starts)
+    elif len(panel):
+        # Chunks of whole symbols with about the same number of bars
+        cuts = np.searchsorted(starts, np.linspace(0, len(panel), max_workers + 1)[1:-1])
+        bounds = np.unique(np.r_[starts[cuts[cuts < len(starts)]], 0, len(panel)])
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_grouped_features, *[values[begin:end] for values in arrays],
+                                   starts[(starts >= begin) & (starts < end)] - begin)
+                       for begin, end in zip(bounds[:-1], bounds[1:])]
+            features[order] = np.concatenate([future.result() for future in futures])
+    return pd.DataFrame(features, index=panel.index, columns=FEATURE_NAMES)
@@ -2,6 +2,8 @@
 feature_engineering_pipeline.py
 
 This script defines a feature engineering pipeline using scikit-learn's Pipeline and custom feature extractor transformers. The pipeline extracts various technical analysis features such as RSI, ADL, OBV, and MACD from input data.
+The pipeline computes all the features in a single pass with `FusedFeatureExtractor`. The per-indicator extractors
+are kept to load the pipelines saved before it.
 
 Usage:
     python feature_engineering.py --output_artifact <output_data_name> --output_type <output_data_type>
@@ -32,11 +34,13 @@ import shutil
 import mlflow
 import pandas_ta as ta
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.pipeline import Pipeline
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
 
+from src.utils.artifacts import init_run
+from src.feature_engineering.feature_engine import compute_features, compute_tail_features
 from src.utils.utils import read_data_from_wandb,upload_data_to_wandb
 
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -219,6 +223,67 @@ class MACDFeatureExtractor(BaseEstimator, TransformerMixin):
         df['macd_signal'] = macd.iloc[:, 2]
         return df[['macd', 'macd_hist', 'macd_signal']]
 
+class FusedFeatureExtractor(BaseEstimator, TransformerMixin):
+    """
+    Custom transformer to extract the RSI, ADL, OBV and MACD features from input DataFrame in a single pass.
+
+    It produces the features of the FeatureUnion of RSIFeatureExtractor, ADLFeatureExtractor,
+    OBVFeatureExtractor and MACDFeatureExtractor, in the same order, as a float32 matrix.
+
+    Attributes:
+        None
+
+    Methods:
+        fit(self, X, y=None): Fit method required for scikit-learn transformers.
+        transform(self, X): Transform method to extract the features from input DataFrame.
+        transform_tail(self, X, rows): Extract the features of the last rows only.
+
+    """
+
+    def fit(self, X, y=None):
+        """
+        Fit method required for scikit-learn transformers.
+
+        Parameters:
+            X (pandas.DataFrame): Input DataFrame containing the data.
+            y (array-like): Target values (unused).
+
+        Returns:
+            self: Returns the instance itself.
+
+        """
+        return self
+
+    def transform(self, X):
+        """
+        Transform method to extract the features from input DataFrame.
+
+        Parameters:
+            X (pandas.DataFrame): Input DataFrame containing the data.
+
+        Returns:
+            numpy.ndarray: Float32 matrix with the rsi_14, adl, obv, macd, macd_hist and macd_signal features.
+
+        """
+        return compute_features(X['close'].to_numpy(), X['high'].to_numpy(),
+                                X['low'].to_numpy(), X['volume'].to_numpy())
+
+    def transform_tail(self, X, rows):
+        """
+        Extract the features of the last rows of the input DataFrame from a warm-up window of its history.
+
+        Parameters:
+            X (pandas.DataFrame): Input DataFrame containing the data.
+            rows (int): Number of last rows.
+
+        Returns:
+            numpy.ndarray: Float32 matrix of the last rows, as the last rows of `transform(X)`.
+
+        """
+        return compute_tail_features(X['close'].to_numpy(), X['high'].to_numpy(),
+                                     X['low'].to_numpy(), X['volume'].to_numpy(), rows)
+
+
 def parse_arguments():
     """
     Parse command-line arguments.
@@ -232,6 +297,19 @@ def parse_arguments():
     parser.add_argument("--output_type", type=str, help="Type of the output data artifact", required=True)
     parser.add_argument("--output_description", type=str, help="Description of the output data artifact", required=True)
     return parser.parse_args()
+
+
+def build_feature_pipeline():
+    """
+    Build the feature engineering pipeline.
+
+    Returns:
+        sklearn.pipeline.Pipeline: Pipeline extracting the RSI, ADL, OBV and MACD features.
+    """
+    return Pipeline([
+        ('feature_engine', FusedFeatureExtractor())
+    ])
+
     
 if __name__ == '__main__':
     
@@ -239,17 +317,10 @@ if __name__ == '__main__':
     logging.info("Saving feature engineering pipeline ...")
     args = parse_arguments()
 
-    run = wandb.init()
+    run = init_run()
     
     #Creating pipeline
-    feature_pipeline = Pipeline([
-        ('feature_union', FeatureUnion([
-            ('rsi', RSIFeatureExtractor()),
-            ('adl', ADLFeatureExtractor()),
-            ('obv', OBVFeatureExtractor()),
-            ('macd', MACDFeatureExtractor())
-        ]))
-    ])
+    feature_pipeline = build_feature_pipeline()
     
     #Saving pipeline
     pipeline_path = os.path.join(os.path.dirname(__file__),
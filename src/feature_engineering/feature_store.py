@@ -0,0 +1,155 @@
+"""
+Feature Store
+
+This module keeps the feature matrices computed by the feature engineering pipeline on disk, so
+training and prediction runs on unchanged data with an unchanged pipeline reuse them instead of
+transforming the data again (e.g. during hyperparameter sweeps).
+
+A matrix is keyed by a hash of the input data (values, index and columns), a hash of the pickled
+pipeline and the hash of the source code of the feature engineering package (see
+`scheduler.code_hash`), so the matrices computed by a previous version of the feature code are not
+served. It is saved as a `.npy` file and read back memory-mapped. The least recently
+used matrices are evicted when the store exceeds its maximum size, except the matrices pinned
+while they are still read (e.g. by the folds of a backtest).
+
+Classes:
+- FeatureStore: Persistent store of feature matrices.
+
+Functions:
+- feature_code_hash: Hash of the source code of the feature engineering package.
+- get_feature_store: Return the feature store configured by the environment.
+
+Environment variables:
+- FEATURE_STORE_DIR: Directory of the feature store. The store is disabled when it is not set.
+- FEATURE_STORE_MAX_MB: Maximum size of the feature store in MB (default: 4096).
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+import functools
+import numpy as np
+import pandas as pd
+
+import src.feature_engineering
+from src.pipeline.scheduler import code_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MB = 4096
+
+
+@functools.lru_cache(maxsize=1)
+def feature_code_hash():
+    # Hash of the source of the feature engineering package, read once per process
+    return code_hash(src.feature_engineering)
+
+
+class FeatureStore:
+    """
+    Persistent store of feature matrices keyed by the hash of the input data and the pipeline.
+
+    Attributes:
+        root (str): Directory of the store, one `<key>.npy` file per matrix.
+        max_bytes (int): Maximum size of the store in bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Number of pins of the matrices that cannot be evicted, by path
+        self._pinned = {}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(df, pipeline):
+        """
+        Compute the key of the features of a DataFrame transformed by a pipeline.
+
+        Returns:
+            str: Hexadecimal SHA-256 digest of the data, the pipeline and the feature code.
+        """
+        digest = hashlib.sha256(feature_code_hash().encode())
+        digest.update(pickle.dumps(pipeline))
+        digest.update(pickle.dumps(list(df.columns)))
+        digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        return digest.hexdigest()
+
+    def transform(self, df, pipeline):
+        """
+        Return the features of a DataFrame, read from the store or computed by the pipeline and saved.
+
+        Parameters:
+            df (pandas.DataFrame): Input DataFrame containing the data.
+            pipeline (sklearn.pipeline.Pipeline): Feature engineering pipeline.
+
+        Returns:
+            numpy.ndarray: The feature matrix, memory-mapped read-only when it is stored.
+        """
+        key = self.key(df, pipeline)
+        path = os.path.join(self.root, key + '.npy')
+        if os.path.isfile(path):
+            logger.info(f"Feature store hit: {key}")
+            # Mark the matrix as recently used
+            os.utime(path)
+            return np.load(path, mmap_mode='r')
+
+        logger.info(f"Feature store miss: {key}")
+        features = np.asarray(pipeline.transform(df))
+        if features.dtype == object or features.nbytes > self.max_bytes:
+            # Only numeric matrices fitting in the store are kept
+            return features
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            np.save(fp, features)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def pin(self, path):
+        """
+        Keep a stored matrix from being evicted by this store until it is unpinned.
+        """
+        path = os.path.abspath(path)
+        self._pinned[path] = self._pinned.get(path, 0) + 1
+
+    def unpin(self, path):
+        """
+        Release a matrix pinned by `pin`.
+        """
+        path = os.path.abspath(path)
+        if self._pinned.get(path, 0) > 1:
+            self._pinned[path] -= 1
+        else:
+            self._pinned.pop(path, None)
+
+    def _evict(self, keep):
+        # Remove the least recently used matrices until the store fits in its maximum size
+        paths = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith('.npy')]
+        total = sum(os.path.getsize(path) for path in paths)
+        for path in sorted(paths, key=os.path.getmtime):
+            if total <= self.max_bytes:
+                break
+            if path == keep or os.path.abspath(path) in self._pinned:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
+            logger.info(f"Evicted {os.path.basename(path)} from the feature store")
+
+
+def get_feature_store():
+    """
+    Return the feature store configured by the FEATURE_STORE_DIR and FEATURE_STORE_MAX_MB
+    environment variables.
+
+    Returns:
+        FeatureStore: The feature store, or None if it is disabled.
+    """
+    root = os.environ.get('FEATURE_STORE_DIR')
+    max_bytes = int(float(os.environ.get('FEATURE_STORE_MAX_MB', DEFAULT_MAX_MB)) * 1024 ** 2)
+    if not root or max_bytes <= 0:
+        return None
+    return FeatureStore(root, max_bytes)
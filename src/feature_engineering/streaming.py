@@ -0,0 +1,185 @@
+"""
+Streaming Indicators
+
+This module keeps the state of the RSI, ADL, OBV and MACD indicators of a stock, so the features
+of a new bar are computed in constant time from the state left by the previous bars instead of
+transforming the whole history again. The state can be saved as a JSON snapshot and restored
+in a later run.
+
+The features of each bar are the ones the batch transform (`compute_features`) produces for the
+same sequence of bars.
+
+Classes:
+- IndicatorState: State of the indicators, updated one bar at a time.
+"""
+
+import json
+import math
+import numpy as np
+
+from src.feature_engineering.feature_engine import FEATURE_NAMES, RSI_LENGTH, MACD_FAST, MACD_SLOW, MACD_SIGNAL
+
+
+class _Ema:
+    """
+    Exponential moving average seeded with the simple average of its first period.
+    """
+
+    def __init__(self, length, count=0, total=0.0, value=None):
+        self.length = length
+        self.count = count
+        self.total = total
+        self.value = value
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.length:
+            self.total += x
+        elif self.count == self.length:
+            self.value = (self.total + x) / self.length
+        else:
+            alpha = 2 / (self.length + 1)
+            self.value = (1 - alpha) * self.value + alpha * x
+        return self.value if self.value is not None else math.nan
+
+    def to_dict(self):
+        return {'length': self.length, 'count': self.count, 'total': self.total, 'value': self.value}
+
+
+class IndicatorState:
+    """
+    State of the RSI (Wilder smoothing), ADL, OBV and MACD (fast, slow and signal EMAs) indicators.
+
+    Attributes:
+        bars (int): Number of bars seen.
+        last_date (str): Date of the last bar seen, if given.
+        prev_close (float): Close price of the last bar.
+        prev_volume (float): Volume of the last bar.
+        gain_sum / loss_sum / rsi_weight (float): Decayed sums of the gains, losses and weights of the RSI averages.
+        adl (float): Accumulation Distribution Line of the last bar.
+        volume_change (float): Cumulative volume change since the first bar, used by the OBV.
+
+    Methods:
+        update(self, close, high, low, volume, date=None): Add a bar and return its features.
+        from_frame(cls, df): Build the state of the bars of a DataFrame.
+        to_dict / from_dict / save / load: Snapshot of the state.
+    """
+
+    def __init__(self):
+        self.bars = 0
+        self.last_date = None
+        self.prev_close = None
+        self.prev_volume = None
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.rsi_weight = 0.0
+        self.adl = 0.0
+        self.volume_change = 0.0
+        self.fast = _Ema(MACD_FAST)
+        self.slow = _Ema(MACD_SLOW)
+        self.signal = _Ema(MACD_SIGNAL)
+
+    def update(self, close, high, low, volume, date=None):
+        """
+        Add a bar to the state and return its features.
+
+        Parameters:
+            close (float): Close price of the bar.
+            high (float): High price of the bar.
+            low (float): Low price of the bar.
+            volume (float): Volume of the bar.
+            date (str, optional): Date of the bar.
+
+        Returns:
+            np.ndarray: Float32 features of the bar, in the order of FEATURE_NAMES.
+        """
+        close, high, low, volume = float(close), float(high), float(low), float(volume)
+        features = np.full(len(FEATURE_NAMES), np.nan, dtype=np.float32)
+        self.bars += 1
+
+        if self.prev_close is not None:
+            change = close - self.prev_close
+
+            # RSI, Wilder's averages of the gains and losses
+            decay = 1 - 1 / RSI_LENGTH
+            self.gain_sum = decay * self.gain_sum + max(change, 0.0)
+            self.loss_sum = decay * self.loss_sum + min(change, 0.0)
+            self.rsi_weight = decay * self.rsi_weight + 1
+            if self.bars > RSI_LENGTH:
+                gain = self.gain_sum / self.rsi_weight
+                loss = abs(self.loss_sum / self.rsi_weight)
+                features[0] = 100 * gain / (gain + loss) if gain + loss else math.nan
+
+            # ADL, like the batch transform a bar without range moves it only if its close changed
+            range_ = high - low
+            if range_:
+                self.adl += change / range_ * volume
+            elif change and volume:
+                self.adl += math.copysign(math.inf, change * volume)
+
+            # OBV
+            self.volume_change += volume - self.prev_volume
+        features[1] = self.adl
+        features[2] = self.volume_change if self.prev_close is not None and close > self.prev_close else 0.0
+
+        # MACD, the signal starts with the first MACD value
+        macd = self.fast.update(close) - self.slow.update(close)
+        if not math.isnan(macd):
+            signal = self.signal.update(macd)
+            features[3] = macd
+            features[4] = macd - signal
+            features[5] = signal
+
+        self.prev_close = close
+        self.prev_volume = volume
+        if date is not None:
+            self.last_date = str(date)
+        return features
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the state of the bars of a DataFrame with `close`, `high`, `low` and `volume` columns,
+        and an optional `date` column.
+
+        Returns:
+            IndicatorState: The state after the last bar.
+        """
+        state = cls()
+        dates = df['date'] if 'date' in df.columns else [None] * len(df)
+        for close, high, low, volume, date in zip(df['close'], df['high'], df['low'], df['volume'], dates):
+            state.update(close, high, low, volume, date)
+        return state
+
+    def to_dict(self):
+        """
+        Return a JSON serializable snapshot of the state.
+        """
+        snapshot = {key: value for key, value in vars(self).items() if not isinstance(value, _Ema)}
+        snapshot.update({name: getattr(self, name).to_dict() for name in ('fast', 'slow', 'signal')})
+        return snapshot
+
+    @classmethod
+    def from_dict(cls, snapshot):
+        """
+        Restore a state from its snapshot.
+        """
+        state = cls()
+        for key, value in snapshot.items():
+            setattr(state, key, _Ema(**value) if key in ('fast', 'slow', 'signal') else value)
+        return state
+
+    def save(self, path):
+        """
+        Save the snapshot of the state to a JSON file.
+        """
+        with open(path, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a state from a JSON snapshot file.
+        """
+        with open(path) as fp:
+            return cls.from_dict(json.load(fp))
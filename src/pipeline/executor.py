@@ -0,0 +1,341 @@
+"""
+In-Process Pipeline Executor
+
+This module runs the steps of the pipeline as Python functions in a single process,
+instead of one `mlflow.run` process per step. The data produced by a step is passed to
+the next steps in memory, and logging the artifacts to W&B is optional and done in a
+background thread so it does not delay the next steps.
+
+The inputs and outputs of each step are declared in `step_specs`. With `max_workers` above 1
+the independent steps run at the same time (e.g. feature_engineering alongside the data
+steps), and with `skip_unchanged` the steps whose inputs are unchanged since their last run
+are skipped.
+
+Classes:
+- InProcessExecutor: Runs the pipeline steps in the current process.
+
+Usage:
+    Set `main.executor` to `inprocess` in config.yaml, or override it on the command line:
+    python main.py main.executor=inprocess main.max_parallel_steps=4 main.skip_unchanged=true
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import mlflow
+import wandb
+from omegaconf import OmegaConf
+
+from src.pipeline.timing import step_timer
+import src.feature_engineering
+from src.pipeline.scheduler import (StepSpec, StepCache, DagScheduler, content_hash, code_hash, critical_path,
+                                    schedule_report)
+from src.utils.artifacts import init_run, download_artifact
+from src.utils.utils import read_data_from_wandb, upload_data_to_wandb, save_data
+from src.data_ingestion.data_ingestion import fetch_with_retry, incremental_download
+from src.data_ingestion.price_sources import YahooPriceSource, LocalPriceSource
+from src.data_cleaning.data_cleaning import clean_data
+from src.data_seggregation.data_seggregation import segregate_data
+from src.feature_engineering.feature_engineering import build_feature_pipeline
+from src.training.train import train_pipeline
+from src.training.export import exportable, export_pipeline, INFERENCE_DIR
+from src.prediction.predict import predict_data, predict_incremental, predict_latest, indicator_state_path
+from src.feature_engineering.streaming import IndicatorState
+from src.feature_engineering.feature_store import get_feature_store
+from src.save_prediction.save_prediction import prepare_prediction
+from src.utils.db_utils import get_pool, copy_df, PREDICTION_KEY
+from src.utils.db_migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+class InProcessExecutor:
+    """
+    Run the pipeline steps as Python functions in the current process.
+
+    The outputs of the steps are kept in memory under the name of their artifact. When the input
+    of a step was not produced in this process, it is read from its artifact.
+
+    Attributes:
+        config (DictConfig): Hydra configuration of the project.
+        log_artifacts (bool): Whether the step outputs are logged as artifacts.
+        max_workers (int): Maximum number of steps running at the same time.
+        skip_unchanged (bool): Whether the steps whose inputs are unchanged are skipped.
+        data (dict): Outputs of the steps, by artifact name.
+        hashes (dict): Content hashes of the step outputs, by artifact name.
+        timings (dict): Durations of the steps in seconds.
+        schedule (pd.DataFrame): Start and end of the steps when they were run by the scheduler.
+        critical_path (str): Summary of the critical path of the steps run by the scheduler.
+    """
+
+    # Steps in their execution order
+    STEPS = ["data_ingestion", "data_cleaning", "data_seggregation", "feature_engineering",
+             "training", "prediction", "save_prediction"]
+
+    # Inputs read from artifacts that no step of this pipeline produces
+    EXTERNAL_MODELS = {"production_model": "trained_model:production"}
+
+    def __init__(self, config, log_artifacts=True, max_workers=1, skip_unchanged=False):
+        self.config = config
+        self.log_artifacts = log_artifacts
+        self.max_workers = max_workers
+        self.skip_unchanged = skip_unchanged
+        self.data = {}
+        self.hashes = {}
+        self.schedule = None
+        self.critical_path = None
+        self.timings = {}
+        self._run = None
+        self._uploader = ThreadPoolExecutor(max_workers=1)
+        self._uploads = []
+
+    @property
+    def run(self):
+        # A single run is shared by all the steps
+        if self._run is None:
+            self._run = init_run(job_type="inprocess_pipeline")
+        return self._run
+
+    def get(self, name, artifact_name, download_dir):
+        """
+        Return a step output, read from its artifact if it was not produced in this process.
+        """
+        if name not in self.data:
+            self.data[name] = read_data_from_wandb(self.run, artifact_name, os.path.join(ROOT_DIR, 'artifacts', download_dir))
+        return self.data[name]
+
+    def get_model(self, name, artifact_name):
+        """
+        Return a model output, loaded from its artifact if it was not produced in this process.
+        """
+        if name not in self.data:
+            artifact = self.run.use_artifact(artifact_name)
+            self.data[name] = mlflow.sklearn.load_model(download_artifact(artifact, os.path.join(ROOT_DIR, 'src', 'models', name)))
+            self.data[name + '_version'] = artifact.name.split(':')[0] + ':' + artifact.version
+        return self.data[name]
+
+    def put(self, name, value, output_type, description, output_dir, metadata=None):
+        """
+        Keep a step output in memory and log it as an artifact in the background.
+        """
+        self.data[name] = value
+        if not self.log_artifacts:
+            return
+
+        if isinstance(value, pd.DataFrame):
+            # Snapshot the data, the next steps may modify it while it is uploaded
+            value = value.copy()
+        self._uploads.append(self._uploader.submit(self._upload, name, value, output_type, description,
+                                                   output_dir, metadata))
+
+    def _upload(self, name, value, output_type, description, output_dir, metadata):
+        if isinstance(value, pd.DataFrame):
+            os.makedirs(os.path.join(ROOT_DIR, 'artifacts', output_dir), exist_ok=True)
+            path = save_data(value, os.path.join(ROOT_DIR, 'artifacts', output_dir, name),
+                             self.config["main"]["artifact_format"])
+            upload_data_to_wandb(self.run, path, name, output_type, description, metadata=metadata)
+        else:
+            path = tempfile.mkdtemp()
+            try:
+                model_path = os.path.join(path, name)
+                mlflow.sklearn.save_model(value, model_path)
+                if exportable(value):
+                    export_pipeline(value, os.path.join(model_path, INFERENCE_DIR))
+                upload_data_to_wandb(self.run, model_path, name, output_type, description,
+                                     metadata=metadata, file_flag=False)
+            finally:
+                shutil.rmtree(path)
+
+    def step_specs(self):
+        """
+        Declare the inputs, outputs and parameters of the steps.
+
+        Returns:
+            list: StepSpec of each step.
+        """
+        stock_name = self.config["data_ingestion"]["stock_name"]
+        return [
+            # Prices are downloaded from outside the pipeline, the step always runs
+            StepSpec("data_ingestion", [], [stock_name], dict(self.config["data_ingestion"]), cacheable=False),
+            StepSpec("data_cleaning", [stock_name], ["cleaned_data"], dict(self.config["data_cleaning"])),
+            StepSpec("data_seggregation", ["cleaned_data"], ["train_val", "test"], dict(self.config["data_segregation"])),
+            # The pipeline only depends on the feature code
+            StepSpec("feature_engineering", [], ["feature_engineering_pipeline"],
+                     {"code": code_hash(src.feature_engineering)}),
+            StepSpec("training", ["train_val", "feature_engineering_pipeline"], ["trained_model"],
+                     {"train_size": self.config["training"]["train_size"],
+                      "xgboost_classification": dict(self.config["training"]["xgboost_classification"]),
+                      "search": OmegaConf.to_container(self.config["training"]["search"]),
+                      "early_stopping_rounds": self.config["training"]["early_stopping_rounds"]}),
+            # The incremental prediction depends on the indicator state saved by the previous runs
+            StepSpec("prediction", ["test", "production_model"], ["prediction"],
+                     {"latest": self.config["prediction"]["latest"]},
+                     cacheable=not self.config["prediction"]["incremental"]),
+            # Writes to the database, the step always runs
+            StepSpec("save_prediction", ["prediction", "production_model"], [], cacheable=False),
+        ]
+
+    def input_hash(self, name):
+        """
+        Return the content hash of a step input, or None if it is not known before running the step.
+
+        The hash of an output of this process is computed from its value, the hash of a production
+        model is the digest of its artifact.
+        """
+        if name not in self.hashes:
+            if name in self.data:
+                self.hashes[name] = content_hash(self.data[name])
+            elif name in self.EXTERNAL_MODELS:
+                self.hashes[name] = self.run.use_artifact(self.EXTERNAL_MODELS[name]).digest
+            else:
+                return None
+        return self.hashes[name]
+
+    def restore_outputs(self, values, hashes):
+        """
+        Restore the cached outputs of a skipped step.
+        """
+        self.data.update(values)
+        self.hashes.update(hashes)
+
+    def step_outputs(self, step):
+        """
+        Return the output values of a step that ran and their content hashes.
+        """
+        outputs = [spec for spec in self.step_specs() if spec.name == step][0].outputs
+        return ({name: self.data[name] for name in outputs},
+                {name: self.input_hash(name) for name in outputs})
+
+    def data_ingestion(self):
+        config = self.config["data_ingestion"]
+        if config["universe"]:
+            raise ValueError("The universe mode of data_ingestion is only supported by the subprocess executor")
+
+        price_source = LocalPriceSource(config["price_source_dir"]) if config["price_source_dir"] else YahooPriceSource()
+        if config["incremental"]:
+            store_path = os.path.join(ROOT_DIR, 'artifacts', 'data_ingestion', config["stock_name"] + '.csv')
+            incremental_download(config["stock_name"], str(config["end_date"]), store_path,
+                                 price_source=price_source, start_date=str(config["start_date"]))
+            raw_data = pd.read_csv(store_path)
+        else:
+            raw_data, _ = fetch_with_retry(price_source, config["stock_name"],
+                                           str(config["start_date"]), str(config["end_date"]))
+            # Same layout as the data read back from the ingested file
+            raw_data = raw_data.reset_index()
+        self.put(config["stock_name"], raw_data, "raw_data", "Stock raw data", 'data_ingestion')
+
+    def data_cleaning(self):
+        stock_name = self.config["data_ingestion"]["stock_name"]
+        raw_data = self.get(stock_name, stock_name + ":latest", 'data_ingestion')
+        config = self.config["data_cleaning"]
+        # The steps exchange their data in memory, it is cleaned in one pass (chunk_rows streams the files of the step)
+        cleaned_data = clean_data(raw_data, calendar=config["calendar"], zscore_window=config["zscore_window"],
+                                  zscore_threshold=config["zscore_threshold"], repair=config["repair"])
+        self.put("cleaned_data", cleaned_data, "cleaned_data", "Stock data cleaned", 'data_cleaning')
+
+    def data_seggregation(self):
+        cleaned_data = self.get("cleaned_data", "cleaned_data:latest", 'data_cleaning')
+        train_val_data, test_data = segregate_data(cleaned_data, self.config["data_segregation"]["train_val_pct"])
+        self.put("train_val", train_val_data, "train_val", "train_val data for training and validation", 'data_seggregation')
+        self.put("test", test_data, "test", "test data", 'data_seggregation')
+
+    def feature_engineering(self):
+        self.put("feature_engineering_pipeline", build_feature_pipeline(), "pipeline",
+                 "pipeline for feature engineering", 'feature_engineering')
+
+    def training(self):
+        train_val_data = self.get("train_val", "train_val:latest", 'feature_engineering')
+        feature_engineering = self.get_model("feature_engineering_pipeline", "feature_engineering_pipeline:latest")
+        xgboost_config = dict(self.config["training"]["xgboost_classification"].items())
+
+        full_pipeline, accuracy, xgboost_config = train_pipeline(
+            train_val_data.copy(), feature_engineering, self.config["training"]["train_size"], xgboost_config,
+            feature_store=get_feature_store(), search=OmegaConf.to_container(self.config["training"]["search"]),
+            early_stopping_rounds=self.config["training"]["early_stopping_rounds"])
+        if self.log_artifacts:
+            self.run.summary['accuracy'] = accuracy
+        self.put("trained_model", full_pipeline, "trained_model", "model", 'training', metadata=xgboost_config)
+
+    def prediction(self):
+        test_data = self.get("test", "test:latest", 'prediction')
+        # Like the subprocess mode, predictions are made by the production model
+        pipeline = self.get_model("production_model", "trained_model:production")
+        if self.config["prediction"]["incremental"]:
+            state_path = indicator_state_path(os.path.join(ROOT_DIR, 'artifacts', 'prediction'),
+                                              self.config["data_ingestion"]["stock_name"], "test:latest")
+            state = IndicatorState.load(state_path) if os.path.isfile(state_path) else None
+            predictions, state = predict_incremental(test_data, pipeline, state, get_feature_store())
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+            state.save(state_path)
+        elif self.config["prediction"]["latest"] > 0:
+            predictions = predict_latest(test_data, pipeline, self.config["prediction"]["latest"])
+        else:
+            predictions = predict_data(test_data, pipeline, get_feature_store())
+        self.put("prediction", predictions, "preds", "data predictions", 'prediction')
+
+    def save_prediction(self):
+        predictions = self.get("prediction", "prediction:latest", 'prediction')
+        self.get_model("production_model", "trained_model:production")
+        df = prepare_prediction(predictions, self.data["production_model_version"],
+                                self.config["data_ingestion"]["stock_name"])
+
+        pool = get_pool(os.environ.get("DB_URL"))
+        migrate(pool)
+        if copy_df(pool, df, "stocks_predictions", upsert_key=PREDICTION_KEY):
+            logging.error("Error saving the prediction into the database")
+            raise ValueError("Error saving the prediction into the database")
+
+    def run_steps(self, steps):
+        """
+        Run steps of the pipeline, then wait for the artifact uploads to finish.
+
+        The steps run in their execution order, unless parallel steps or skipping unchanged
+        steps are enabled, in which case they run as soon as their inputs are ready.
+
+        Parameters:
+            steps (list): Names of the steps to run.
+
+        Returns:
+            dict: Durations of the steps in seconds, including the remaining upload time.
+        """
+        try:
+            if self.log_artifacts or self.skip_unchanged:
+                # Start the run in the main thread, before the steps and uploads need it
+                self.run
+            steps = [step for step in self.STEPS if step in steps]
+            if self.max_workers > 1 or self.skip_unchanged:
+                self._run_schedule(steps)
+            else:
+                for step in steps:
+                    with step_timer(self.timings, step):
+                        getattr(self, step)()
+        finally:
+            with step_timer(self.timings, "artifact_upload_wait"):
+                for upload in self._uploads:
+                    upload.result()
+                self._uploader.shutdown()
+            if self._run is not None:
+                wandb.finish()
+        return self.timings
+
+    def _run_schedule(self, steps):
+        scheduler = DagScheduler(self.step_specs(), lambda step: getattr(self, step)(),
+                                 max_workers=self.max_workers,
+                                 cache=StepCache() if self.skip_unchanged else None,
+                                 input_hash=self.input_hash, restore=self.restore_outputs,
+                                 outputs=self.step_outputs)
+        try:
+            scheduler.run(steps)
+        finally:
+            self.timings.update({step: record['seconds'] for step, record in scheduler.records.items()})
+            self.schedule = schedule_report(scheduler.specs, scheduler.records)
+            path, seconds = critical_path(scheduler.specs, scheduler.records)
+            if scheduler.records:
+                wall_time = max(record['end'] for record in scheduler.records.values())
+                self.critical_path = f"Critical path: {' -> '.join(path)} ({seconds}s), wall time {wall_time}s"
+                logger.info(self.critical_path)
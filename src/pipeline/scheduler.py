@@ -0,0 +1,329 @@
+"""
+Pipeline Step Scheduler
+
+This module runs the pipeline steps as a graph built from the inputs and outputs declared by
+each step: a step starts as soon as the steps producing its inputs are done, so independent
+steps run at the same time. A step whose inputs and parameters have the same content hash as
+in its last run is skipped, and its outputs are restored from the step cache.
+
+Classes:
+- StepSpec: Inputs, outputs and parameters of a step.
+- StepCache: Persists the input hash and the outputs of the last run of each step.
+- DagScheduler: Runs the steps in dependency order, with independent steps in parallel.
+
+Functions:
+- content_hash: Hash of the content of a step input or output.
+- code_hash: Hash of the source code of a step.
+- critical_path: Longest chain of dependent steps of a run.
+- schedule_report: Start, end and duration of the steps of a run.
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'artifacts', 'step_cache'))
+
+
+def content_hash(value):
+    """
+    Compute the hash of the content of a step input or output.
+
+    Data frames are hashed by their values, index and columns, other objects by their pickled bytes.
+
+    Parameters:
+        value (object): The value to hash.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        digest.update(pickle.dumps(list(value.columns)))
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    else:
+        digest.update(pickle.dumps(value))
+    return digest.hexdigest()
+
+
+def code_hash(*modules):
+    """
+    Compute the hash of the source code of a step, to invalidate its cache when the code changes.
+
+    Parameters:
+        modules (module): The modules of the step. The files of a package are all hashed.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for module in modules:
+        if hasattr(module, '__path__'):
+            directory = list(module.__path__)[0]
+            paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.py'))
+        else:
+            paths = [module.__file__]
+        for path in paths:
+            digest.update(os.path.basename(path).encode())
+            with open(path, 'rb') as fp:
+                digest.update(fp.read())
+    return digest.hexdigest()
+
+
+class StepSpec:
+    """
+    Declaration of a pipeline step.
+
+    Attributes:
+        name (str): Name of the step.
+        inputs (list): Names of the values read by the step.
+        outputs (list): Names of the values produced by the step.
+        params (dict): Parameters of the step, part of its input hash.
+        cacheable (bool): Whether the step can be skipped when its inputs are unchanged. Steps
+        reading from outside the pipeline (e.g. downloading prices) are not cacheable.
+    """
+
+    def __init__(self, name, inputs=(), outputs=(), params=None, cacheable=True):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.cacheable = cacheable
+
+
+class StepCache:
+    """
+    Store of the input hash and the outputs of the last run of each step.
+
+    The state is kept in `state.json` and each output is pickled to `<output>.pkl` in the
+    cache directory. The steps running in parallel share the cache, the state is read and
+    written under a lock.
+
+    Attributes:
+        directory (str): Directory of the cache.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._state_path = os.path.join(directory, 'state.json')
+        self._lock = threading.Lock()
+        if os.path.isfile(self._state_path):
+            with open(self._state_path) as fp:
+                self.state = json.load(fp)
+        else:
+            self.state = {}
+
+    def lookup(self, step, input_hash):
+        """
+        Return the outputs of the last run of a step if it had the same input hash, else None.
+
+        Returns:
+            dict: Output values by name, with their content hashes under `hashes`.
+        """
+        with self._lock:
+            entry = self.state.get(step)
+        if entry is None or entry['input_hash'] != input_hash:
+            return None
+
+        outputs = {}
+        for name in entry['outputs']:
+            path = os.path.join(self.directory, name + '.pkl')
+            if not os.path.isfile(path):
+                return None
+            with open(path, 'rb') as fp:
+                outputs[name] = pickle.load(fp)
+        return {'values': outputs, 'hashes': entry['outputs']}
+
+    def store(self, step, input_hash, outputs, output_hashes):
+        """
+        Save the input hash and the outputs of a step run.
+        """
+        for name, value in outputs.items():
+            with open(os.path.join(self.directory, name + '.pkl'), 'wb') as fp:
+                pickle.dump(value, fp)
+        with self._lock:
+            self.state[step] = {'input_hash': input_hash, 'outputs': output_hashes}
+
+            # Replace the state atomically, a failed write keeps the previous state
+            tmp_path = self._state_path + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(self.state, fp, indent=2)
+            os.replace(tmp_path, self._state_path)
+
+
+def critical_path(specs, records):
+    """
+    Find the longest chain of dependent steps of a run, which bounds its wall time.
+
+    Parameters:
+        specs (dict): StepSpec of the steps, by name.
+        records (dict): Run record (with `seconds`) of each step that ran, by name.
+
+    Returns:
+        tuple: Names of the steps on the path, and its duration in seconds.
+    """
+    producers = {output: name for name, spec in specs.items() if name in records for output in spec.outputs}
+    # Duration of the longest chain ending with each step, computed in the order the steps ran
+    longest, previous = {}, {}
+    for name in sorted(records, key=lambda step: records[step]['end']):
+        parents = {producers[value] for value in specs[name].inputs if value in producers}
+        parent = max(parents, key=lambda step: longest[step], default=None)
+        previous[name] = parent
+        longest[name] = records[name]['seconds'] + (longest[parent] if parent else 0)
+
+    if not longest:
+        return [], 0.0
+    step = max(longest, key=longest.get)
+    total = longest[step]
+    path = []
+    while step is not None:
+        path.append(step)
+        step = previous[step]
+    return path[::-1], round(total, 3)
+
+
+def schedule_report(specs, records):
+    """
+    Build a report of the start, end and duration of the steps of a run.
+
+    Returns:
+        pd.DataFrame: One row per step in start order, flagging the skipped steps and the
+        steps on the critical path.
+    """
+    path, _ = critical_path(specs, records)
+    report = pd.DataFrame([{'step': name, 'start': record['start'], 'end': record['end'],
+                            'seconds': record['seconds'], 'skipped': record['skipped'],
+                            'critical': name in path}
+                           for name, record in records.items()])
+    if report.empty:
+        return report
+    return report.sort_values('start', ignore_index=True)
+
+
+class DagScheduler:
+    """
+    Run pipeline steps in the order of their data dependencies.
+
+    A step depends on the steps producing its inputs. Inputs not produced by any of the
+    scheduled steps are read from outside the run (e.g. from the artifacts of a previous run).
+
+    Attributes:
+        specs (dict): StepSpec of the steps, by name.
+        run_step (callable): Runs a step given its name.
+        max_workers (int): Maximum number of steps running at the same time.
+        cache (StepCache, optional): Step cache used to skip the steps whose inputs are unchanged.
+        input_hash (callable, optional): Returns the content hash of an input given its name, or
+        None when it is unknown. Required with a cache.
+        restore (callable, optional): Called with the cached outputs of a skipped step and their hashes.
+        outputs (callable, optional): Returns the output values and their hashes of a step that
+        ran, to store them in the cache.
+        records (dict): Start, end (seconds since the start of the run), duration and skipped
+        flag of each step of the last run.
+    """
+
+    def __init__(self, specs, run_step, max_workers=4, cache=None, input_hash=None, restore=None, outputs=None):
+        self.specs = {spec.name: spec for spec in specs}
+        self.run_step = run_step
+        self.max_workers = max_workers
+        self.cache = cache
+        self.input_hash = input_hash
+        self.restore = restore
+        self.outputs = outputs
+        self.records = {}
+
+    def dependencies(self, steps):
+        """
+        Return the scheduled steps each step depends on.
+
+        Parameters:
+            steps (list): Names of the scheduled steps.
+
+        Returns:
+            dict: Set of the step names each step waits for.
+        """
+        producers = {}
+        for name in steps:
+            for output in self.specs[name].outputs:
+                producers[output] = name
+        return {name: {producers[value] for value in self.specs[name].inputs
+                       if value in producers and producers[value] != name}
+                for name in steps}
+
+    def _step_hash(self, name):
+        spec = self.specs[name]
+        if not spec.cacheable:
+            return None
+        hashes = [self.input_hash(value) for value in spec.inputs]
+        if None in hashes:
+            return None
+        key = json.dumps({'step': name, 'params': spec.params, 'inputs': hashes}, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _execute(self, name, start):
+        # Runs in a worker thread
+        step_start = time.perf_counter()
+        input_hash = self._step_hash(name) if self.cache is not None else None
+        cached = self.cache.lookup(name, input_hash) if input_hash is not None else None
+        if cached is not None:
+            logger.info(f"Step {name} skipped, its inputs are unchanged")
+            self.restore(cached['values'], cached['hashes'])
+        else:
+            self.run_step(name)
+            if input_hash is not None:
+                values, hashes = self.outputs(name)
+                self.cache.store(name, input_hash, values, hashes)
+
+        end = time.perf_counter()
+        self.records[name] = {'start': round(step_start - start, 3), 'end': round(end - start, 3),
+                              'seconds': round(end - step_start, 3), 'skipped': cached is not None}
+
+    def run(self, steps):
+        """
+        Run steps, each one as soon as the steps it depends on are done.
+
+        When a step fails, no other step is started and the error is raised once the running
+        steps are done.
+
+        Parameters:
+            steps (list): Names of the steps to run.
+
+        Returns:
+            dict: Run record of each step.
+        """
+        unknown = [name for name in steps if name not in self.specs]
+        if unknown:
+            logger.error(f"Unknown steps: {unknown}")
+            raise ValueError(f"Unknown steps: {unknown}")
+
+        waiting = self.dependencies(steps)
+        done = set()
+        self.records = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while waiting or running:
+                for name in [name for name, deps in waiting.items() if deps <= done]:
+                    del waiting[name]
+                    running[pool.submit(self._execute, name, start)] = name
+                if not running:
+                    logger.error(f"Steps with circular dependencies: {list(waiting)}")
+                    raise ValueError(f"Steps with circular dependencies: {list(waiting)}")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        # Let the running steps finish, do not start new ones
+                        wait(running)
+                        raise future.exception()
+                    done.add(name)
+        return self.records
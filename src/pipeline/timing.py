@@ -0,0 +1,84 @@
+"""
+Pipeline Timing
+
+This module records the duration of the pipeline steps, so the executor modes can be compared.
+
+Functions:
+- step_timer: Context manager recording the duration of a step.
+- save_timings / load_timings: Persist the step durations of an executor mode.
+- timing_report: Compare the step durations of two executor modes.
+"""
+
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'artifacts', 'timings'))
+
+
+@contextmanager
+def step_timer(timings, step):
+    """
+    Record the duration of a step in seconds.
+
+    Parameters:
+        timings (dict): Durations of the steps, updated with the duration of this step.
+        step (str): Name of the step.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = round(time.perf_counter() - start, 3)
+        logger.info(f"Step {step} took {timings[step]}s")
+
+
+def save_timings(mode, timings):
+    """
+    Save the step durations of an executor mode to `artifacts/timings/<mode>.json`.
+    """
+    os.makedirs(TIMINGS_DIR, exist_ok=True)
+    with open(os.path.join(TIMINGS_DIR, mode + '.json'), 'w') as fp:
+        json.dump(timings, fp, indent=2)
+
+
+def load_timings(mode):
+    """
+    Load the step durations saved for an executor mode.
+
+    Returns:
+        dict: The durations of the steps, empty if none were saved.
+    """
+    path = os.path.join(TIMINGS_DIR, mode + '.json')
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def timing_report(timings, baseline_timings=None):
+    """
+    Build a report of the step durations, compared with the durations of a baseline run.
+
+    Parameters:
+        timings (dict): Durations of the steps in seconds.
+        baseline_timings (dict, optional): Durations of the same steps in the baseline run.
+
+    Returns:
+        pd.DataFrame: Duration of each step, its baseline duration and the speedup, with a total row.
+    """
+    baseline_timings = baseline_timings or {}
+    report = pd.DataFrame({'step': list(timings),
+                           'seconds': list(timings.values()),
+                           'baseline_seconds': [baseline_timings.get(step) for step in timings]})
+    total = {'step': 'total', 'seconds': report['seconds'].sum(),
+             'baseline_seconds': report['baseline_seconds'].sum(min_count=len(report))}
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report['baseline_seconds'] = report['baseline_seconds'].astype(float)
+    report['speedup'] = (report['baseline_seconds'] / report['seconds']).round(2)
+    return report
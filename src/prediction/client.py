@@ -0,0 +1,30 @@
+"""
+client.py
+
+This module requests predictions from a running prediction server (see `server.py`). It only uses
+the standard library, so the clients of the service, e.g. the dashboard, do not load the pipelines,
+mlflow or wandb.
+
+Functions:
+- request_prediction: Request the prediction of a ticker from a running server.
+"""
+
+import json
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+
+def request_prediction(url, ticker, timeout=10):
+    """
+    Request the next-day prediction of a ticker from a running prediction server.
+
+    Parameters:
+        url (str): Base URL of the server, e.g. `http://localhost:8000`.
+        ticker (str): Ticker of the stock.
+        timeout (float): Timeout of the request in seconds.
+
+    Returns:
+        dict: The prediction returned by the server.
+    """
+    with urlopen(f"{url.rstrip('/')}/predict?{urlencode({'ticker': ticker})}", timeout=timeout) as response:
+        return json.loads(response.read())
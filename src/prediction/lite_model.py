@@ -0,0 +1,128 @@
+"""
+Lite Model
+
+This module loads a trained pipeline exported in the inference format of `src.training.export`:
+
+    <directory>/model.ubj        XGBoost booster in its native format (UBJSON, or model.json)
+    <directory>/manifest.json    Feature specification: input columns, feature extractor and names,
+                                 warm-up window, objective, classes and iteration range of the model
+
+The features are computed by the feature engine (`src.feature_engineering.feature_engine`) and
+predicted by the booster directly, so loading a model neither unpickles a scikit-learn pipeline nor
+imports mlflow, wandb or pandas_ta.
+
+Classes:
+- LitePipeline: Inference path of an exported pipeline.
+
+Functions:
+- load_lite_pipeline: Load an exported pipeline.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+import xgboost as xgb
+
+from src.feature_engineering.feature_engine import FEATURE_NAMES, compute_features, compute_tail_features
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+FORMAT_VERSION = 1
+# Feature extractors the loader can rebuild
+FEATURE_EXTRACTORS = ('fused',)
+
+
+class LitePipeline:
+    """
+    Inference path of an exported pipeline: feature engine followed by the XGBoost booster.
+
+    Attributes:
+        booster (xgboost.Booster): Trained booster.
+        manifest (dict): Feature specification of the pipeline.
+    """
+
+    def __init__(self, booster, manifest):
+        self.booster = booster
+        self.manifest = manifest
+        self._inputs = manifest['features']['inputs']
+        self._classes = np.asarray(manifest['model']['classes'])
+        best_iteration = manifest['model']['best_iteration']
+        self._iteration_range = (0, 0 if best_iteration is None else best_iteration + 1)
+
+    def transform(self, X):
+        """
+        Compute the feature matrix of the input data (DataFrame or mapping of column arrays).
+        """
+        return compute_features(*[np.asarray(X[column]) for column in self._inputs])
+
+    def transform_tail(self, X, rows):
+        """
+        Compute the features of the last rows of the input data from a warm-up window of its history.
+        """
+        return compute_tail_features(*[np.asarray(X[column]) for column in self._inputs], rows,
+                                     warmup=self.manifest['features']['warmup_rows'])
+
+    def predict_features(self, features):
+        """
+        Predict the classes of a feature matrix.
+        """
+        scores = self.booster.inplace_predict(features, iteration_range=self._iteration_range)
+        if scores.ndim == 2:
+            return self._classes[np.argmax(scores, axis=1)]
+        return self._classes[(scores > 0.5).astype(int)]
+
+    def predict(self, X):
+        """
+        Predict the direction of the closing price of the next day for every row of the input data.
+
+        Parameters:
+            X (pandas.DataFrame or dict): Stock data with the input columns of the manifest.
+
+        Returns:
+            np.ndarray: The predicted class of each row, as `Pipeline.predict` of the exported pipeline.
+        """
+        return self.predict_features(self.transform(X))
+
+    def predict_latest(self, X, rows=1):
+        """
+        Predict the direction of the closing price of the next day for the last rows only.
+
+        Parameters:
+            X (pandas.DataFrame or dict): Stock data with the input columns of the manifest.
+            rows (int): Number of last rows to predict.
+
+        Returns:
+            np.ndarray: The predicted class of each of the last rows.
+        """
+        return self.predict_features(self.transform_tail(X, rows))
+
+
+def load_lite_pipeline(directory):
+    """
+    Load a pipeline exported by `src.training.export.export_pipeline`.
+
+    Parameters:
+        directory (str): Directory of the exported pipeline.
+
+    Returns:
+        LitePipeline: The inference path of the pipeline.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        logger.error(f"No exported pipeline in {directory}")
+        raise ValueError(f"No exported pipeline in {directory}")
+    with open(manifest_path) as fp:
+        manifest = json.load(fp)
+
+    if manifest.get('format_version') != FORMAT_VERSION:
+        logger.error(f"Unsupported export format version: {manifest.get('format_version')}")
+        raise ValueError(f"Unsupported export format version: {manifest.get('format_version')}")
+    features = manifest['features']
+    if features['extractor'] not in FEATURE_EXTRACTORS or features['names'] != FEATURE_NAMES:
+        logger.error(f"Unsupported feature extractor: {features['extractor']} {features['names']}")
+        raise ValueError(f"Unsupported feature extractor: {features['extractor']} {features['names']}")
+
+    booster = xgb.Booster(model_file=os.path.join(directory, manifest['model']['file']))
+    return LitePipeline(booster, manifest)
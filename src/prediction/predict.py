@@ -7,6 +7,8 @@ Usage:
     python predict.py --input_data_artifact <input_data_name> --input_pipeline_artifact <input_pipeline_name>
                                 --output_artifact <output_data_name> --output_type <output_data_type>
                                 --output_description <output_data_description>
+                                [--artifact_format <artifact_format>] [--incremental true] [--latest <rows>]
+                                [--ticker <ticker>]
 
 Arguments:
     --input_data_artifact (str): Name of the input data artifact in Weights & Biases (wandb).
@@ -14,6 +16,13 @@ Arguments:
     --output_artifact (str): Name of the artifact for the predicted data to be saved in wandb.
     --output_type (str): Type of the output data artifact.
     --output_description (str): Description of the output data artifact.
+    --artifact_format (str, optional): Format of the predicted data, 'csv' (default) or 'parquet'.
+    --incremental (bool, optional): Only predict the bars newer than the saved indicator state, computing
+      their features from the state in constant time per bar. The first run predicts all the bars and
+      saves the state to artifacts/prediction/indicator_state_<ticker>_<input_data_artifact>.json.
+    --ticker (str, optional): Ticker of the predicted stock, part of the name of the indicator state.
+    --latest (int, optional): Only predict the last `latest` bars, computing their features from the warm-up
+      window of history the indicators need instead of the whole input (default: 0, predict all the bars).
 
 Execution:
     - The script should be executed with required command-line arguments.
@@ -29,11 +38,16 @@ import sys
 import os
 import logging
 import argparse
-import shutil
 import wandb
 import json 
+import re
 import mlflow
 import uuid
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
 import pandas as pd
 
 from sklearn.metrics import accuracy_score
@@ -41,7 +55,10 @@ from sklearn.metrics import accuracy_score
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
 
-from src.utils.utils import read_data_from_wandb,upload_data_to_wandb
+from src.utils.utils import read_data_from_wandb,upload_data_to_wandb,save_data
+from src.utils.artifacts import init_run, download_artifact
+from src.feature_engineering.streaming import IndicatorState
+from src.feature_engineering.feature_store import get_feature_store
 
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(filename='predict.log', level=logging.INFO, format=log_fmt)
@@ -61,15 +78,214 @@ def parse_arguments():
     parser.add_argument("--output_artifact", type=str, help="Name of the artifact for the cleaned data", required=True)
     parser.add_argument("--output_type", type=str, help="Type of the output data artifact", required=True)
     parser.add_argument("--output_description", type=str, help="Description of the output data artifact", required=True)
+    parser.add_argument("--artifact_format", type=str, choices=["csv", "parquet"], help="Format of the output data", default="csv")
+    parser.add_argument("--incremental", type=lambda value: str(value).lower() == "true",
+                        help="Only predict the bars newer than the saved indicator state (true/false)", default=False)
+    parser.add_argument("--latest", type=int, help="Number of last bars to predict, 0 for all the bars", default=0)
+    parser.add_argument("--ticker", type=str, help="Ticker of the predicted stock", default=None)
     return parser.parse_args()
+
+
+def indicator_state_path(directory, ticker, input_artifact):
+    """
+    Return the path of the indicator state of the incremental predictions of a ticker and an input artifact.
+
+    The version or alias of the artifact is not part of the name, the new versions of the input
+    continue the state of the previous ones.
+
+    Parameters:
+        directory (str): Directory of the states.
+        ticker (str): Ticker of the predicted stock, None if it is not known.
+        input_artifact (str): Name of the input data artifact, e.g. `test:latest`.
+
+    Returns:
+        str: The path of the state file.
+    """
+    name = f"{ticker or ''}_{input_artifact.split(':')[0]}"
+    return os.path.join(directory, f"indicator_state_{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.json")
+
+
+def predict_data(df, pipeline, feature_store=None):
+    """
+    Predict the direction of the closing price of the next day.
+
+    Parameters:
+        df (pandas.DataFrame): Input DataFrame containing the stock data.
+        pipeline (sklearn.pipeline.Pipeline): The pre-trained ML pipeline, with the model as its last step.
+        feature_store (FeatureStore, optional): Store reusing the features computed for the same data and pipeline.
+
+    Returns:
+        pandas.DataFrame: The input data with a `prediction` column.
+    """
+    df = df.copy()
+    if feature_store:
+        features = feature_store.transform(df, pipeline[:-1])
+        df['prediction'] = pipeline.steps[-1][1].predict(pd.DataFrame(features))
+    else:
+        df['prediction'] = pipeline.predict(df)
+    return df
+
+
+def _tail_transformer(pipeline):
+    # Transformer of a chain of single-step pipelines and wrappers able to transform only the last rows
+    while not hasattr(pipeline, 'transform_tail'):
+        if hasattr(pipeline, 'steps') and len(pipeline.steps) == 1:
+            pipeline = pipeline.steps[0][1]
+        elif hasattr(pipeline, 'transformer'):
+            pipeline = pipeline.transformer
+        else:
+            return None
+    return pipeline
+
+
+def predict_latest(df, pipeline, rows=1):
+    """
+    Predict the direction of the closing price of the next day for the last bars only.
+
+    The features of the last bars are computed from the warm-up window of history their indicators
+    need, so the cost of the prediction does not grow with the history. Pipelines whose features
+    cannot be computed that way transform the whole input.
+
+    Parameters:
+        df (pandas.DataFrame): Input DataFrame containing the stock data.
+        pipeline (sklearn.pipeline.Pipeline): The pre-trained ML pipeline, with the model as its last step.
+        rows (int): Number of last bars to predict.
+
+    Returns:
+        pandas.DataFrame: The last bars with a `prediction` column, as the last rows of `predict_data`.
+    """
+    tail = df.iloc[-rows:].copy()
+    transformer = _tail_transformer(pipeline[:-1])
+    if transformer is not None:
+        features = transformer.transform_tail(df, rows)
+    else:
+        features = np.asarray(pipeline[:-1].transform(df))[-rows:]
+    tail['prediction'] = pipeline.steps[-1][1].predict(pd.DataFrame(features))
+    return tail
+
+
+def predict_incremental(df, pipeline, state=None, feature_store=None):
+    """
+    Predict the bars newer than an indicator state, updating the state one bar at a time.
+
+    The features of each new bar are computed from the state, so the cost of a prediction does not
+    grow with the history. Without a state, or when the last bar of the state is not in the data (e.g.
+    the state of another series), all the bars are predicted and the state is built from them.
+
+    Parameters:
+        df (pandas.DataFrame): Input DataFrame containing the stock data, with a `date` column.
+        pipeline (sklearn.pipeline.Pipeline): The pre-trained ML pipeline, with the model as its last step.
+        state (IndicatorState, optional): State of the indicators after the bars already predicted.
+        feature_store (FeatureStore, optional): Store used when all the bars are predicted.
+
+    Returns:
+        tuple: The new bars with a `prediction` column, and the updated state.
+    """
+    dates = pd.to_datetime(df['date'])
+    if state is not None and (state.last_date is None or not (dates == pd.Timestamp(state.last_date)).any()):
+        logging.warning(f"The last bar of the indicator state ({state.last_date}) is not in the data, the state is reset")
+        state = None
+    if state is None:
+        return predict_data(df, pipeline, feature_store), IndicatorState.from_frame(df)
+
+    df = df[dates > pd.Timestamp(state.last_date)].copy()
+    features = [state.update(row.close, row.high, row.low, row.volume, row.date) for row in df.itertuples()]
+    model = pipeline.steps[-1][1]
+    df['prediction'] = model.predict(pd.DataFrame(features)) if features else []
+    logging.info(f"Predicted {len(df)} new bars from the indicator state")
+    return df, state
     
     
+class PredictionBatcher:
+    """
+    Micro-batcher of the next-day predictions requested at the same time by several threads.
+
+    The features of a request are computed in the thread of the caller. The feature rows of the
+    requests received within `max_wait` seconds of the first one (up to `max_batch_size` rows) are
+    stacked into one matrix and predicted by a single call of each model, then the predictions
+    are returned to their callers.
+
+    Attributes:
+        max_batch_size (int): Maximum number of requests predicted together.
+        max_wait (float): Maximum time in seconds a request waits for other requests.
+        batches (int): Number of batches predicted.
+        requests (int): Number of requests predicted.
+    """
+
+    def __init__(self, max_batch_size=64, max_wait=0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+        self._thread.start()
+
+    def predict(self, pipeline, df):
+        """
+        Predict the direction of the close price of the day after the last bar of a DataFrame.
+
+        Parameters:
+            pipeline (sklearn.pipeline.Pipeline): The pre-trained ML pipeline, with the model as its last step.
+            df (pandas.DataFrame): Stock data of a ticker, sorted by date.
+
+        Returns:
+            int: The prediction of the last bar.
+        """
+        features = np.asarray(pipeline[:-1].transform(df))[-1:]
+        future = Future()
+        self._queue.put((pipeline.steps[-1][1], features, future))
+        return future.result()
+
+    def close(self):
+        """
+        Stop the batcher once the pending requests are predicted.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                batch.append(request)
+            self._predict(batch)
+
+    def _predict(self, batch):
+        # One call per model, the requests of a ticker without its own model share the production model
+        models = {}
+        for model, features, future in batch:
+            models.setdefault(id(model), (model, []))[1].append((features, future))
+        for model, requests in models.values():
+            try:
+                predictions = model.predict(np.vstack([features for features, _ in requests]))
+                for (_, future), prediction in zip(requests, predictions):
+                    future.set_result(int(prediction))
+            except Exception as e:
+                logging.error(f"Error occurred while predicting a batch: {str(e)}")
+                for _, future in requests:
+                    future.set_exception(e)
+        self.batches += 1
+        self.requests += len(batch)
+
+
 if __name__ == '__main__':
     
 
     logging.info("Starting prediction ...")
     args = parse_arguments()
-    run = wandb.init()
+    run = init_run()
 
     logging.info("Downloading input data...")
     download_data_path = os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "prediction")
@@ -78,21 +294,27 @@ if __name__ == '__main__':
 
     logging.info("Downloading ML pipeline...")
     download_pipeline_path = os.path.join(os.path.dirname(__file__), "..", "models", "full_pipeline")
-    if os.path.exists(download_pipeline_path):
-        shutil.rmtree(download_pipeline_path)
     model_artifact = run.use_artifact(args.input_pipeline_artifact)
-    pipeline_export_path = model_artifact.download(root=download_pipeline_path)
+    pipeline_export_path = download_artifact(model_artifact, download_pipeline_path)
     pipeline = mlflow.sklearn.load_model(pipeline_export_path)
     logging.info("ML pipeline downloaded and loaded successfully.")
 
     logging.info("Performing prediction...")
-    y_pred = pipeline.predict(df)
-    df['prediction'] = y_pred
+    if args.incremental:
+        state_path = indicator_state_path(os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "prediction"),
+                                          args.ticker, args.input_data_artifact)
+        state = IndicatorState.load(state_path) if os.path.isfile(state_path) else None
+        df, state = predict_incremental(df, pipeline, state, get_feature_store())
+        state.save(state_path)
+    elif args.latest > 0:
+        df = predict_latest(df, pipeline, args.latest)
+    else:
+        df = predict_data(df, pipeline, get_feature_store())
     logging.info("Prediction completed.")
 
     logging.info("Saving predicted data...")
     data_path = os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "prediction", "prediction.csv")
-    df.to_csv(data_path)
+    data_path = save_data(df, data_path, args.artifact_format)
     upload_data_to_wandb(run, data_path, args.output_artifact, args.output_type, args.output_description)
     logging.info("Predicted data saved and uploaded successfully.")
 
@@ -0,0 +1,413 @@
+"""
+server.py
+
+This script runs a resident prediction service. The production pipeline (and the per-ticker
+pipelines of the model registry, if any) are loaded once and kept in memory, so a prediction does
+not pay the start of a wandb run, the artifact download and the model loading. A background thread
+checks for new model versions and swaps them in without restarting the service.
+
+Endpoints (JSON responses):
+    GET  /predict?ticker=<ticker>   Next-day prediction of a ticker from its latest bars.
+    POST /predict                   Next-day prediction from the bars in the body:
+                                    {"ticker": <ticker>, "bars": [{"date": ..., "open": ..., "close": ...}, ...]}
+    GET  /health                    Loaded model versions.
+    GET  /metrics                   Number of requests, latency percentiles of each stage and batch sizes.
+    POST /reload                    Check for new model versions now.
+
+Usage:
+    python server.py [--host 0.0.0.0] [--port 8000] [--artifact trained_model:production]
+                     [--registry_dir <directory>] [--price_source_dir <directory>]
+                     [--reload_interval 60] [--lookback_days 400] [--bars_ttl 60]
+                     [--max_batch_size 64] [--max_wait_ms 5]
+
+Arguments:
+    --host (str, optional): Interface of the server (default: 0.0.0.0).
+    --port (int, optional): Port of the server (default: 8000).
+    --artifact (str, optional): Artifact of the production pipeline (default: trained_model:production).
+    --registry_dir (str, optional): Model registry whose latest version of a ticker is used instead of
+      the production pipeline (default: none).
+    --price_source_dir (str, optional): Directory of <ticker>.csv files used instead of Yahoo Finance.
+    --reload_interval (float, optional): Seconds between two checks for new model versions (default: 60).
+    --lookback_days (int, optional): Calendar days of history fetched for a prediction (default: 400).
+    --bars_ttl (float, optional): Seconds the fetched bars of a ticker are reused (default: 60).
+    --max_batch_size (int, optional): Maximum number of concurrent requests predicted by one model call,
+      0 to predict each request on its own (default: 64).
+    --max_wait_ms (float, optional): Maximum time a request waits for other requests to batch with (default: 5).
+
+Classes:
+- ModelWatcher: Loaded pipelines, reloaded when a new version is published.
+- LatencyStats: Latency percentiles of the recent requests.
+- PredictionService: Next-day predictions of tickers with the loaded pipelines.
+
+Functions:
+- make_server: Build the HTTP server of a prediction service.
+- request_prediction: Request the prediction of a ticker from a running server (see `client`).
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import mlflow
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.artifacts import init_run, download_artifact
+from src.data_cleaning.data_cleaning import clean_data
+from src.data_ingestion.price_sources import YahooPriceSource, LocalPriceSource
+from src.prediction.predict import predict_data, PredictionBatcher
+from src.training.model_registry import ModelRegistry
+from src.prediction.client import request_prediction
+
+log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logging.basicConfig(filename='server.log', level=logging.INFO, format=log_fmt)
+
+PRODUCTION = 'production'
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--host", type=str, help="Interface of the server", default="0.0.0.0")
+    parser.add_argument("--port", type=int, help="Port of the server", default=8000)
+    parser.add_argument("--artifact", type=str, help="Artifact of the production pipeline", default="trained_model:production")
+    parser.add_argument("--registry_dir", type=str, help="Directory of the model registry", default="")
+    parser.add_argument("--price_source_dir", type=str, help="Directory of <ticker>.csv files used instead of Yahoo Finance", default="")
+    parser.add_argument("--reload_interval", type=float, help="Seconds between two checks for new models", default=60)
+    parser.add_argument("--lookback_days", type=int, help="Calendar days of history fetched for a prediction", default=400)
+    parser.add_argument("--bars_ttl", type=float, help="Seconds the fetched bars of a ticker are reused", default=60)
+    parser.add_argument("--max_batch_size", type=int, help="Maximum number of requests predicted together, 0 to disable", default=64)
+    parser.add_argument("--max_wait_ms", type=float, help="Maximum time a request waits for other requests", default=5)
+    return parser.parse_args()
+
+
+class ModelWatcher:
+    """
+    Pipelines kept in memory, reloaded when a new version is published.
+
+    The production pipeline is identified by the digest of its artifact, and the pipeline of a
+    ticker by its latest version in the model registry. A new version is loaded before replacing
+    the current one, so the predictions never wait for a load.
+
+    Attributes:
+        run: The W&B run (or offline run) used to read the production artifact.
+        artifact_name (str): Artifact of the production pipeline, None to only use the registry.
+        registry (ModelRegistry): Registry of the per-ticker pipelines, or None.
+        download_path (str): Directory of the downloaded artifacts when the artifact cache is disabled.
+    """
+
+    def __init__(self, run, artifact_name='trained_model:production', registry=None, download_path=None):
+        self.run = run
+        self.artifact_name = artifact_name
+        self.registry = registry
+        self.download_path = download_path or os.path.join(os.path.dirname(__file__), "..", "models", "full_pipeline")
+        # (version, pipeline) of the production pipeline and of each ticker of the registry
+        self._models = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """
+        Load the pipelines whose version changed since the last refresh.
+
+        Returns:
+            list: Names of the reloaded pipelines (`production` or tickers).
+        """
+        reloaded = []
+        if self.artifact_name:
+            artifact = self.run.use_artifact(self.artifact_name)
+            if self.versions().get(PRODUCTION) != artifact.digest:
+                pipeline = mlflow.sklearn.load_model(download_artifact(artifact, self.download_path))
+                with self._lock:
+                    self._models[PRODUCTION] = (artifact.digest, pipeline)
+                reloaded.append(PRODUCTION)
+        if self.registry:
+            for ticker in self.registry.tickers():
+                version = self.registry.versions(ticker)[-1]
+                if self.versions().get(ticker) != version:
+                    pipeline = self.registry.load(ticker, version)
+                    with self._lock:
+                        self._models[ticker] = (version, pipeline)
+                    reloaded.append(ticker)
+        if reloaded:
+            logging.info(f"Loaded new model versions: {reloaded}")
+        return reloaded
+
+    def versions(self):
+        """
+        Return the loaded version of each pipeline.
+        """
+        with self._lock:
+            return {name: version for name, (version, _) in self._models.items()}
+
+    def get(self, ticker):
+        """
+        Return the pipeline of a ticker, the production pipeline if the registry has none.
+
+        Returns:
+            tuple: The name of the pipeline (ticker or `production`), its version and the pipeline.
+        """
+        with self._lock:
+            name = ticker if ticker in self._models else PRODUCTION
+            if name not in self._models:
+                raise LookupError(f"No model loaded for the ticker {ticker}")
+            version, pipeline = self._models[name]
+        return name, version, pipeline
+
+    def start(self, interval):
+        """
+        Check for new versions every `interval` seconds in a background thread.
+        """
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error(f"Error occurred while reloading the models: {str(e)}")
+
+        self._thread = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+class LatencyStats:
+    """
+    Latency percentiles of the most recent requests of each stage.
+
+    Attributes:
+        window (int): Number of recent latencies kept per stage.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._latencies = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds * 1000)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def report(self):
+        """
+        Return the number of requests and the mean, p50, p95 and p99 latencies in milliseconds of each stage.
+        """
+        with self._lock:
+            latencies = {stage: np.array(values) for stage, values in self._latencies.items()}
+            counts = dict(self._counts)
+        return {stage: {'count': counts[stage],
+                        'mean_ms': round(float(values.mean()), 3),
+                        'p50_ms': round(float(np.percentile(values, 50)), 3),
+                        'p95_ms': round(float(np.percentile(values, 95)), 3),
+                        'p99_ms': round(float(np.percentile(values, 99)), 3)}
+                for stage, values in latencies.items()}
+
+
+class PredictionService:
+    """
+    Next-day predictions of tickers with the pipelines of a ModelWatcher.
+
+    Attributes:
+        models (ModelWatcher): The loaded pipelines.
+        price_source (PriceSource): Source of the latest bars of a ticker.
+        lookback_days (int): Calendar days of history fetched for a prediction.
+        bars_ttl (float): Seconds the fetched bars of a ticker are reused.
+        batcher (PredictionBatcher): Micro-batcher of the concurrent requests, or None.
+        stats (LatencyStats): Latencies of the requests.
+    """
+
+    def __init__(self, models, price_source=None, lookback_days=400, bars_ttl=60, batcher=None):
+        self.models = models
+        self.batcher = batcher
+        self.price_source = price_source or YahooPriceSource()
+        self.lookback_days = lookback_days
+        self.bars_ttl = bars_ttl
+        self.stats = LatencyStats()
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def latest_bars(self, ticker):
+        """
+        Return the cleaned bars of the last `lookback_days` of a ticker, fetched at most every `bars_ttl` seconds.
+        """
+        with self._lock:
+            fetched_at, bars = self._bars.get(ticker, (None, None))
+        if fetched_at is not None and time.monotonic() - fetched_at < self.bars_ttl:
+            return bars
+
+        end = pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+        data = self.price_source.fetch(ticker, (end - pd.Timedelta(days=self.lookback_days)).strftime('%Y-%m-%d'),
+                                       end.strftime('%Y-%m-%d'))
+        if data is None or data.empty:
+            raise ValueError(f"No data found for the ticker {ticker}")
+        bars = clean_data(data.reset_index())
+        with self._lock:
+            self._bars[ticker] = (time.monotonic(), bars)
+        return bars
+
+    def predict(self, ticker, bars=None):
+        """
+        Predict the direction of the close price of the day after the last bar of a ticker.
+
+        Parameters:
+            ticker (str): Ticker of the stock.
+            bars (pd.DataFrame, optional): Bars of the ticker, sorted by date. The latest bars are fetched if None.
+
+        Returns:
+            dict: The ticker, date of the last bar, prediction (1 for up, 0 for down), the model used
+            and the latency of the request.
+        """
+        start = time.perf_counter()
+        if bars is None:
+            bars = self.latest_bars(ticker)
+        else:
+            bars = clean_data(bars.copy())
+        fetched = time.perf_counter()
+        self.stats.record('fetch', fetched - start)
+
+        name, version, pipeline = self.models.get(ticker)
+        if self.batcher:
+            prediction = self.batcher.predict(pipeline, bars)
+        else:
+            prediction = predict_data(bars, pipeline)['prediction'].iloc[-1]
+        end = time.perf_counter()
+        self.stats.record('predict', end - fetched)
+        self.stats.record('total', end - start)
+
+        date = bars['date'].iloc[-1] if 'date' in bars.columns else bars.index[-1]
+        return {'ticker': ticker,
+                'date': str(pd.Timestamp(date).date()),
+                'prediction': int(prediction),
+                'model': name,
+                'model_version': str(version),
+                'latency_ms': round((end - start) * 1000, 3)}
+
+    def metrics(self):
+        """
+        Return the latency of each stage, and the mean batch size when the requests are batched.
+        """
+        metrics = self.stats.report()
+        if self.batcher and self.batcher.batches:
+            metrics['batching'] = {'batches': self.batcher.batches,
+                                   'mean_batch_size': round(self.batcher.requests / self.batcher.batches, 2)}
+        return metrics
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, action):
+        try:
+            self._send(200, action())
+        except (ValueError, KeyError, LookupError) as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            logging.error(f"Error occurred while handling {self.path}: {str(e)}")
+            self._send(500, {'error': str(e)})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/predict':
+            ticker = parse_qs(url.query).get('ticker', [''])[0]
+            self._handle(lambda: self.service.predict(ticker) if ticker else self._missing('ticker'))
+        elif url.path == '/health':
+            self._handle(lambda: {'status': 'ok', 'models': self.service.models.versions()})
+        elif url.path == '/metrics':
+            self._handle(self.service.metrics)
+        else:
+            self._send(404, {'error': f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == '/predict':
+            self._handle(self._predict_bars)
+        elif url.path == '/reload':
+            self._handle(lambda: {'reloaded': self.service.models.refresh()})
+        else:
+            self._send(404, {'error': f"Unknown path {url.path}"})
+
+    def _predict_bars(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not body.get('ticker') or not body.get('bars'):
+            self._missing('ticker and bars')
+        return self.service.predict(body['ticker'], pd.DataFrame(body['bars']))
+
+    @staticmethod
+    def _missing(name):
+        raise ValueError(f"Missing {name} in the request")
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+
+def make_server(service, host='0.0.0.0', port=8000):
+    """
+    Build the HTTP server of a prediction service, handling each request in its own thread.
+
+    Parameters:
+        service (PredictionService): The prediction service.
+        host (str): Interface of the server.
+        port (int): Port of the server, 0 for any free port.
+
+    Returns:
+        ThreadingHTTPServer: The server, to be run with `serve_forever`.
+    """
+    handler = type('PredictionHandler', (_Handler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+
+
+    args = parse_arguments()
+    run = init_run()
+    models = ModelWatcher(run, args.artifact or None, ModelRegistry(args.registry_dir) if args.registry_dir else None)
+    models.refresh()
+    models.start(args.reload_interval)
+
+    price_source = LocalPriceSource(args.price_source_dir) if args.price_source_dir else YahooPriceSource()
+    batcher = PredictionBatcher(args.max_batch_size, args.max_wait_ms / 1000) if args.max_batch_size > 0 else None
+    service = PredictionService(models, price_source, lookback_days=args.lookback_days, bars_ttl=args.bars_ttl,
+                                batcher=batcher)
+    server = make_server(service, args.host, args.port)
+    logging.info(f"Serving predictions on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        models.stop()
+        if batcher:
+            batcher.close()
+        server.server_close()
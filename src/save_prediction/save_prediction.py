@@ -5,13 +5,14 @@ This script saves prediction with model version with date into a database.
 
 Usage:
     python predict.py --input_data_artifact <input_data_name> --used_model_artifact <used_model_name>
-                                --database_url <database_url> --table_name <table_name>
+                                --database_url <database_url> --table_name <table_name> [--ticker <ticker>]
 
 Arguments:
     --input_data_artifact (str): Name of the input data artifact in Weights & Biases (wandb).
     --used_model_artifact (str): Name of the model artifact used for prediction in wandb.
     --database_url (str): URL of the database where prediction results will be stored.
     --table_name (str): Name of the table in the database where prediction results will be saved.
+    --ticker (str, optional): Ticker of the predicted stock, saved with the prediction.
 
 
 Execution:
@@ -20,7 +21,9 @@ Execution:
     - Downloads the input data artifact from wandb.
     - Retrieves the trained model artifact used for prediction from wandb.
     - Prepares the prediction data by selecting necessary columns and adding model information.
-    - Inserts the prediction data into the specified database table.
+    - Applies the pending migrations of the database schema (see src/utils/db_migrations.py).
+    - Writes the prediction data into the specified database table, replacing the prediction of the
+      same ticker, day and model.
 """
 
 
@@ -36,8 +39,10 @@ from sklearn.metrics import accuracy_score
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
 
+from src.utils.artifacts import init_run
 from src.utils.utils import read_data_from_wandb
-from src.utils.db_utils import connect_to_database , insert_df , close_connection
+from src.utils.db_utils import get_pool , copy_df, PREDICTION_KEY
+from src.utils.db_migrations import migrate
 
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(filename='save_prediction.log', level=logging.INFO, format=log_fmt)
@@ -55,7 +60,29 @@ def parse_arguments():
     parser.add_argument("--used_model_artifact", type=str, help="model used in prediction", required=True)
     parser.add_argument("--database_url", type=str, help="database url", required=True)
     parser.add_argument("--table_name", type=str, help="table name to save the data", required=True)
+    parser.add_argument("--ticker", type=str, help="ticker of the predicted stock", default=None)
     return parser.parse_args()
+
+
+def prepare_prediction(df, model_version, ticker=None):
+    """
+    Prepare the prediction row saved in the database.
+
+    Parameters:
+        df (pandas.DataFrame): The predicted data, with `date` and `prediction` columns.
+        model_version (str): Name and version of the model used for the prediction.
+        ticker (str, optional): Ticker of the predicted stock, saved in the `ticker` column. Default is
+            None (an empty ticker, the key of a prediction has no missing value).
+
+    Returns:
+        pandas.DataFrame: The prediction with its date, an empty feedback, the model used and the ticker.
+    """
+    df = df.iloc[[0]]
+    df = df[['date', 'prediction']].copy()
+    df['feedback'] = None
+    df['model_used'] = model_version
+    df['ticker'] = ticker or ''
+    return df
     
     
 if __name__ == '__main__':
@@ -63,7 +90,7 @@ if __name__ == '__main__':
 
     logging.info("Starting prediction ...")
     args = parse_arguments()
-    run = wandb.init()
+    run = init_run()
 
     logging.info("Downloading data...")
     download_data_path = os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "prediction")
@@ -76,18 +103,22 @@ if __name__ == '__main__':
     logging.info("Model version retrieved successfully.")
 
     logging.info("Preparing data...")
-    df = df.iloc[[0]]
-    df = df[['date', 'prediction']]
-    df['feedback'] = None
-    df['model_used'] = model_version
+    df = prepare_prediction(df, model_version, args.ticker)
     logging.info("Data prepared successfully.")
     
     print(df.head())  # Print the prepared data
 
     logging.info("Inserting prediction into database...")
-    connection = connect_to_database(args.database_url)
-    insert_df(connection, df, table=args.table_name)
-    close_connection(connection)
+    pool = get_pool(args.database_url)
+    try:
+        # Brings the schema up to date (ticker column and unique index) before writing
+        migrate(pool)
+        # A prediction saved again for the same day replaces the previous one
+        if copy_df(pool, df, args.table_name, upsert_key=PREDICTION_KEY):
+            logging.error("Error saving the prediction into the database")
+            raise ValueError("Error saving the prediction into the database")
+    finally:
+        pool.close()
     logging.info("Prediction inserted into the database successfully.")
 
     wandb.finish()
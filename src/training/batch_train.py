@@ -0,0 +1,212 @@
+"""
+batch_train.py
+
+This script trains one full pipeline per ticker of a universe in a single run. The tickers are
+trained in a process pool, whose number of workers is limited by the available memory, and the
+pipelines are saved in the versioned model registry (see `src.training.model_registry`). A single
+summary table of the accuracy and training time of every ticker is logged, instead of one wandb
+run per model.
+
+Usage:
+    python batch_train.py --input_artifact <universe_data> --input_feature_engineering_artifact <pipeline_artifact>
+                          --train_pct <train_data_percentage> --xgboost_config <xgboost_config_file>
+                          --output_artifact <output_summary_name> --output_type <output_type>
+                          --output_description <output_description> [--early_stopping_rounds <rounds>]
+                          [--registry_dir <directory>] [--max_workers <max_workers>]
+
+Arguments:
+    --input_artifact (str): Directory artifact with one data file per ticker (output of the universe mode of the ingestion step).
+    --input_feature_engineering_artifact (str): Name of the feature engineering pipeline artifact in wandb.
+    --train_pct (float): Percentage of the data of a ticker used for training, the remainder is used for validation.
+    --xgboost_config (str): Path to the XGBoost configuration file.
+    --output_artifact (str): Name of the artifact for the summary table.
+    --output_type (str): Type of the output artifact.
+    --output_description (str): Description of the output artifact.
+    --early_stopping_rounds (int, optional): Rounds without improvement before the training stops (default: 0).
+    --registry_dir (str, optional): Directory of the model registry (default: src/models/registry).
+    --max_workers (int, optional): Maximum number of tickers trained at the same time (default: 1).
+
+Execution:
+    - Downloads the data of the tickers and the feature engineering pipeline from wandb.
+    - Cleans the data and trains the pipeline of each ticker in the process pool.
+    - Registers a new version of the model of each ticker.
+    - Prints the summary table and uploads it to wandb, with the mean accuracy in the run summary.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import mlflow
+import wandb
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.artifacts import init_run, download_artifact
+from src.utils.utils import upload_data_to_wandb, read_tickers_from_wandb, save_data
+from src.data_cleaning.data_cleaning import clean_data
+from src.feature_engineering.feature_store import get_feature_store
+from src.training.train import train_pipeline
+from src.training.model_registry import ModelRegistry, REGISTRY_DIR
+
+log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logging.basicConfig(filename='batch_train.log', level=logging.INFO, format=log_fmt)
+
+# Peak memory of the training of a ticker relative to the memory of its data (features, matrices, trees)
+TASK_MEMORY_FACTOR = 20
+# Memory of a worker process before it receives a ticker (interpreter, pandas, XGBoost)
+WORKER_MEMORY_BYTES = 300 * 1024 ** 2
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--input_artifact", type=str, help="input data of the tickers in wandb", required=True)
+    parser.add_argument("--input_feature_engineering_artifact", type=str, help="input feature engineering pipeline in wandb", required=True)
+    parser.add_argument("--train_pct", type=float, help="training data percentage", required=True)
+    parser.add_argument("--xgboost_config", type=str, help="Path to the XGBoost configuration file", required=True)
+    parser.add_argument("--output_artifact", type=str, help="Name of the artifact for the summary table", required=True)
+    parser.add_argument("--output_type", type=str, help="Type of the output artifact", required=True)
+    parser.add_argument("--output_description", type=str, help="Description of the output artifact", required=True)
+    parser.add_argument("--early_stopping_rounds", type=int, help="Rounds without improvement before the training stops", default=0)
+    parser.add_argument("--registry_dir", type=str, help="Directory of the model registry", default=REGISTRY_DIR)
+    parser.add_argument("--max_workers", type=int, help="Maximum number of tickers trained at the same time", default=1)
+    return parser.parse_args()
+
+
+def available_memory():
+    """
+    Return the physical memory currently available in bytes, or None if it is unknown.
+    """
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def memory_aware_workers(max_workers, task_bytes, available_bytes=None):
+    """
+    Compute the number of workers training tickers at the same time without exceeding the memory.
+
+    Parameters:
+        max_workers (int): Maximum number of workers.
+        task_bytes (int): Peak memory of the training of the largest ticker.
+        available_bytes (int, optional): Available memory, measured if None.
+
+    Returns:
+        int: The number of workers, at least 1 and at most the number of cores.
+    """
+    workers = max(1, min(max_workers, os.cpu_count() or 1))
+    available_bytes = available_bytes or available_memory()
+    if available_bytes:
+        workers = max(1, min(workers, available_bytes // (task_bytes + WORKER_MEMORY_BYTES)))
+    return int(workers)
+
+
+def train_ticker(ticker, df, feature_engineering, train_pct, xgboost_config, early_stopping_rounds, registry_dir):
+    """
+    Train the pipeline of a ticker and register it.
+
+    Returns:
+        dict: Summary of the ticker, with the error instead of the metrics if the training failed.
+    """
+    start = time.perf_counter()
+    record = {'ticker': ticker, 'status': 'ok', 'rows': len(df), 'accuracy': None, 'version': None, 'error': None}
+    try:
+        full_pipeline, accuracy, config = train_pipeline(df.copy(), feature_engineering, train_pct, xgboost_config,
+                                                         feature_store=get_feature_store(),
+                                                         early_stopping_rounds=early_stopping_rounds)
+        record['accuracy'] = accuracy
+        record['version'] = ModelRegistry(registry_dir).register(ticker, full_pipeline,
+                                                                 metadata=dict(config, accuracy=accuracy))
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+        logging.error(f"An error occurred while training the model of {ticker}: {str(e)}")
+    record['train_seconds'] = round(time.perf_counter() - start, 3)
+    logging.info(f"{ticker}: {record['status']} - accuracy {record['accuracy']} in {record['train_seconds']}s")
+    return record
+
+
+def batch_train(data, feature_engineering, train_pct, xgboost_config, registry_dir=REGISTRY_DIR,
+                early_stopping_rounds=None, max_workers=1):
+    """
+    Train and register the pipeline of each ticker.
+
+    The largest tickers are submitted first, and the XGBoost threads are split between the workers.
+
+    Parameters:
+        data (dict): Cleaned data of each ticker, sorted by date.
+        feature_engineering (sklearn.pipeline.Pipeline): Feature engineering pipeline.
+        train_pct (float): Percentage of the data of a ticker used for training.
+        xgboost_config (dict): Configuration parameters for the XGBoost classifier.
+        registry_dir (str): Directory of the model registry.
+        early_stopping_rounds (int, optional): Rounds without improvement on the validation data before the training stops.
+        max_workers (int): Maximum number of tickers trained at the same time, 1 to train them in this process.
+
+    Returns:
+        pd.DataFrame: Summary table with the status, accuracy, model version and training time of each ticker.
+    """
+    tickers = sorted(data, key=lambda ticker: len(data[ticker]), reverse=True)
+    task_bytes = max((int(df.memory_usage(deep=True).sum()) for df in data.values()), default=0) * TASK_MEMORY_FACTOR
+    workers = memory_aware_workers(max_workers, task_bytes) if tickers else 1
+    logging.info(f"Training {len(tickers)} tickers with {workers} workers")
+
+    if workers <= 1:
+        records = [train_ticker(ticker, data[ticker], feature_engineering, train_pct, xgboost_config,
+                                early_stopping_rounds, registry_dir) for ticker in tickers]
+    else:
+        xgboost_config = dict(xgboost_config, n_jobs=max(1, (os.cpu_count() or 1) // workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(train_ticker, ticker, data[ticker], feature_engineering, train_pct, xgboost_config,
+                                   early_stopping_rounds, registry_dir) for ticker in tickers]
+            records = [future.result() for future in futures]
+
+    return pd.DataFrame(records, columns=['ticker', 'status', 'rows', 'accuracy', 'version', 'train_seconds',
+                                          'error']).sort_values('ticker', ignore_index=True)
+
+
+if __name__ == '__main__':
+
+
+    logging.info("Starting batch training ...")
+    args = parse_arguments()
+    with open(args.xgboost_config) as fp:
+        xgboost_config = json.load(fp)
+
+    run = init_run()
+
+    download_data_path = os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "batch_training")
+    data = {ticker: clean_data(df) for ticker, df in
+            read_tickers_from_wandb(run, args.input_artifact, download_data_path).items()}
+    logging.info(f"Data of {len(data)} tickers downloaded successfully.")
+
+    download_feature_engineering_path = os.path.join(os.path.dirname(__file__), "..", "models", "feature_engineering")
+    feature_engineering = mlflow.sklearn.load_model(
+        download_artifact(run.use_artifact(args.input_feature_engineering_artifact), download_feature_engineering_path))
+    logging.info("Feature engineering pipeline downloaded successfully.")
+
+    summary = batch_train(data, feature_engineering, args.train_pct, xgboost_config, registry_dir=args.registry_dir,
+                          early_stopping_rounds=args.early_stopping_rounds, max_workers=args.max_workers)
+    print(summary.to_string(index=False))
+    run.summary['accuracy'] = summary['accuracy'].mean()
+    run.summary['failed'] = int((summary['status'] == 'failed').sum())
+
+    os.makedirs(download_data_path, exist_ok=True)
+    summary_path = save_data(summary, os.path.join(download_data_path, "batch_training_summary.csv"))
+    upload_data_to_wandb(run, summary_path, args.output_artifact, args.output_type, args.output_description,
+                         metadata={'tickers': len(summary), 'registry_dir': os.path.abspath(args.registry_dir)})
+    os.remove(args.xgboost_config)
+    wandb.finish()
+    logging.info("Batch training completed.")
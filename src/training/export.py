@@ -0,0 +1,100 @@
+"""
+Export
+
+This module exports a trained pipeline to the inference format read by `src.prediction.lite_model`:
+the XGBoost booster in its native format (UBJSON by default, or JSON) and a manifest with the
+specification of its features. Unlike the MLflow model of the pipeline, which is a pickle of the
+scikit-learn objects, the exported files are loaded without scikit-learn pipelines, mlflow, wandb
+or pandas_ta.
+
+Only pipelines whose features are computed by the feature engine (`FusedFeatureExtractor`) can be
+exported, since the loader rebuilds the features from the manifest.
+
+Functions:
+- exportable: Whether a pipeline can be exported.
+- export_pipeline: Export a pipeline to a directory.
+"""
+
+import os
+import json
+import logging
+
+from src.feature_engineering.feature_engine import FEATURE_NAMES, warmup_rows
+from src.feature_engineering.feature_engineering import FusedFeatureExtractor
+from src.prediction.lite_model import MANIFEST_FILE, FORMAT_VERSION
+
+logger = logging.getLogger(__name__)
+
+MODEL_FORMATS = {'ubj': 'model.ubj', 'json': 'model.json'}
+# Subdirectory of the exported files in the directory of an MLflow model
+INFERENCE_DIR = 'inference'
+
+
+def _feature_extractor(pipeline):
+    # Feature extractor of a chain of single-step pipelines and wrappers, None if there is another step
+    while not isinstance(pipeline, FusedFeatureExtractor):
+        if hasattr(pipeline, 'steps') and len(pipeline.steps) == 1:
+            pipeline = pipeline.steps[0][1]
+        elif hasattr(pipeline, 'transformer'):
+            pipeline = pipeline.transformer
+        else:
+            return None
+    return pipeline
+
+
+def exportable(pipeline):
+    """
+    Return whether a full pipeline (feature engineering and XGBoost model) can be exported.
+    """
+    steps = getattr(pipeline, 'steps', [])
+    return (len(steps) > 1 and hasattr(steps[-1][1], 'get_booster')
+            and _feature_extractor(pipeline[:-1]) is not None)
+
+
+def export_pipeline(pipeline, directory, model_format='ubj'):
+    """
+    Export a full pipeline to its booster and feature-spec manifest.
+
+    Parameters:
+        pipeline (sklearn.pipeline.Pipeline): Full pipeline, with the XGBoost classifier as its last step.
+        directory (str): Directory of the exported files, created if needed.
+        model_format (str): Native format of the booster, 'ubj' (default) or 'json'.
+
+    Returns:
+        str: The path of the manifest.
+    """
+    if model_format not in MODEL_FORMATS:
+        logger.error(f"Unsupported model format: {model_format}")
+        raise ValueError(f"Unsupported model format: {model_format}")
+    if not exportable(pipeline):
+        logger.error("Only the pipelines of the feature engine followed by an XGBoost model can be exported")
+        raise ValueError("Only the pipelines of the feature engine followed by an XGBoost model can be exported")
+
+    model = pipeline.steps[-1][1]
+    booster = model.get_booster()
+    os.makedirs(directory, exist_ok=True)
+    booster.save_model(os.path.join(directory, MODEL_FORMATS[model_format]))
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'features': {
+            'extractor': 'fused',
+            'inputs': ['close', 'high', 'low', 'volume'],
+            'names': FEATURE_NAMES,
+            'dtype': 'float32',
+            'warmup_rows': warmup_rows(),
+        },
+        'model': {
+            'file': MODEL_FORMATS[model_format],
+            'objective': model.get_xgb_params().get('objective'),
+            'classes': [int(c) for c in model.classes_],
+            'feature_names': booster.feature_names,
+            # Iterations used by the predictions of the classifier, all of them without early stopping
+            'best_iteration': getattr(model, 'best_iteration', None),
+        },
+    }
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+    logger.info(f"Pipeline exported to {directory}")
+    return manifest_path
@@ -0,0 +1,203 @@
+"""
+Hyperparameter Search
+
+This module searches the XGBoost configuration of the training step. Configurations are sampled
+at random from ranges of parameters, and evaluated by training trials on the training matrix and
+scoring them on the validation matrix (log loss). Every trial stops early when its validation
+loss stops improving.
+
+Two search methods are available:
+- random: every sampled configuration is trained up to `n_estimators` boosting rounds.
+- halving: successive halving. All the configurations are trained for `min_rounds` rounds, the
+  best `1 / reduction_factor` of them continue training for `reduction_factor` times more rounds,
+  and so on up to `n_estimators` rounds.
+
+The training and validation matrices are built once and shared by all the trials, which run in a
+thread pool (XGBoost releases the GIL while training). The cores are split between the trials
+trained at the same time, so they do not oversubscribe the machine.
+
+Functions:
+- sample_configs: Sample configurations from ranges of parameters.
+- search_hyperparameters: Search the best XGBoost configuration on training and validation data.
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+logger = logging.getLogger(__name__)
+
+SEARCH_METHODS = ('none', 'random', 'halving')
+
+# Ranges of the parameters sampled by default, integers for integer bounds
+DEFAULT_SEARCH_SPACE = {
+    'max_depth': [3, 10],
+    'learning_rate': [0.01, 0.3],
+    'min_child_weight': [1, 10],
+    'subsample': [0.5, 1.0],
+    'colsample_bytree': [0.5, 1.0],
+}
+
+# Parameters sampled uniformly on a log scale
+LOG_SCALE_PARAMETERS = {'learning_rate', 'gamma', 'reg_alpha', 'reg_lambda'}
+
+
+def sample_configs(space, n_trials, seed=None):
+    """
+    Sample configurations from ranges of parameters.
+
+    Parameters:
+        space (dict): [low, high] range of each parameter. Integers are sampled when both bounds are
+            integers, and the parameters of LOG_SCALE_PARAMETERS are sampled on a log scale.
+        n_trials (int): Number of configurations.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        list: The sampled configurations.
+    """
+    rng = np.random.default_rng(seed)
+    configs = [{} for _ in range(n_trials)]
+    for name, bounds in space.items():
+        if len(bounds) != 2 or bounds[0] > bounds[1]:
+            logger.error(f"Invalid range {bounds} for the parameter {name}")
+            raise ValueError(f"Invalid range {bounds} for the parameter {name}, expected [low, high]")
+        low, high = bounds
+        if isinstance(low, int) and isinstance(high, int):
+            values = rng.integers(low, high, endpoint=True, size=n_trials).tolist()
+        elif name in LOG_SCALE_PARAMETERS and low > 0:
+            values = np.exp(rng.uniform(np.log(low), np.log(high), size=n_trials)).tolist()
+        else:
+            values = rng.uniform(low, high, size=n_trials).tolist()
+        for config, value in zip(configs, values):
+            config[name] = value
+    return configs
+
+
+def _booster_params(config, nthread):
+    # Native parameters of a configuration of the XGBClassifier constructor
+    params = {key: value for key, value in config.items() if key not in ('n_estimators', 'n_jobs', 'random_state')}
+    if config.get('random_state') is not None:
+        params['seed'] = config['random_state']
+    params.update(nthread=nthread, tree_method='hist', eval_metric='logloss')
+    return params
+
+
+class _Trial:
+    """
+    Configuration being evaluated, with its booster and the validation loss of each boosting round.
+    """
+
+    def __init__(self, number, params, config):
+        self.number = number
+        self.params = params
+        self.config = config
+        self.booster = None
+        self.losses = []
+        self.stopped = False
+        self.seconds = 0.0
+
+    @property
+    def loss(self):
+        return min(self.losses) if self.losses else np.inf
+
+    @property
+    def best_iteration(self):
+        return int(np.argmin(self.losses))
+
+    def train(self, dtrain, dval, rounds, early_stopping_rounds, nthread):
+        """
+        Continue training the booster of the trial up to `rounds` boosting rounds, or until it stops early.
+        """
+        done = len(self.losses)
+        if self.stopped or rounds <= done:
+            return self
+        start = time.perf_counter()
+        evals_result = {}
+        self.booster = xgb.train(_booster_params(self.config, nthread), dtrain, num_boost_round=rounds - done,
+                                 evals=[(dval, 'validation')], evals_result=evals_result,
+                                 early_stopping_rounds=early_stopping_rounds, verbose_eval=False,
+                                 xgb_model=self.booster)
+        losses = evals_result['validation']['logloss']
+        self.stopped = len(losses) < rounds - done
+        self.losses.extend(losses)
+        self.seconds += time.perf_counter() - start
+        return self
+
+
+def search_hyperparameters(train_df, val_df, target_name, xgboost_config, method='random', space=None,
+                           n_trials=32, max_workers=1, early_stopping_rounds=20, min_rounds=10,
+                           reduction_factor=3, seed=None):
+    """
+    Search the best XGBoost configuration on training and validation data.
+
+    Parameters:
+        train_df (pandas.DataFrame): Training features and target.
+        val_df (pandas.DataFrame): Validation features and target, used for early stopping and to rank the trials.
+        target_name (str): Name of the target variable.
+        xgboost_config (dict): Base configuration of the XGBClassifier, whose `n_estimators` is the
+            maximum number of boosting rounds of a trial.
+        method (str): 'random' or 'halving'.
+        space (dict, optional): [low, high] range of each sampled parameter, DEFAULT_SEARCH_SPACE if None.
+        n_trials (int): Number of sampled configurations.
+        max_workers (int): Number of trials trained at the same time, at most the number of cores.
+        early_stopping_rounds (int): Rounds without improvement of the validation loss before a trial stops.
+        min_rounds (int): Boosting rounds of the first rung of successive halving.
+        reduction_factor (int): Successive halving keeps the best `1 / reduction_factor` trials of each rung.
+        seed (int, optional): Seed of the sampling.
+
+    Returns:
+        tuple: The best configuration, with `n_estimators` set to its best number of boosting rounds,
+        and a DataFrame of the trials sorted by validation loss.
+    """
+    if method not in SEARCH_METHODS[1:]:
+        logger.error(f"Unsupported search method '{method}'")
+        raise ValueError(f"Unsupported search method '{method}', expected one of {SEARCH_METHODS[1:]}")
+    if min_rounds < 1 or reduction_factor < 2:
+        logger.error("Successive halving requires min_rounds >= 1 and reduction_factor >= 2")
+        raise ValueError("Successive halving requires min_rounds >= 1 and reduction_factor >= 2")
+
+    max_rounds = int(xgboost_config.get('n_estimators', 100))
+    # A first rung beyond the maximum number of rounds is a single rung of max_rounds
+    min_rounds = min(min_rounds, max_rounds)
+    cores = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, n_trials, cores))
+    nthread = max(1, cores // max_workers)
+
+    # One contiguous float32 matrix shared by all the trials, the validation bins are those of the training data
+    def to_dmatrix(df, ref=None):
+        features = np.ascontiguousarray(df.drop(columns=[target_name]).to_numpy(dtype=np.float32))
+        return xgb.QuantileDMatrix(features, df[target_name].to_numpy(), ref=ref, nthread=cores)
+
+    dtrain = to_dmatrix(train_df)
+    dval = to_dmatrix(val_df, ref=dtrain)
+
+    trials = [_Trial(number, params, dict(xgboost_config, **params))
+              for number, params in enumerate(sample_configs(space or DEFAULT_SEARCH_SPACE, n_trials, seed))]
+    logger.info(f"Searching {n_trials} configurations ({method}) with {max_workers} workers of {nthread} threads")
+
+    # Boosting rounds of each rung
+    rungs = [max_rounds]
+    if method == 'halving':
+        rungs = [min(max_rounds, min_rounds * reduction_factor ** rung)
+                 for rung in range(int(np.ceil(np.log(max_rounds / min_rounds) / np.log(reduction_factor))) + 1)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        active = trials
+        for rung, rounds in enumerate(rungs):
+            list(pool.map(lambda trial: trial.train(dtrain, dval, rounds, early_stopping_rounds, nthread), active))
+            logger.info(f"Rung {rung}: {len(active)} trials trained up to {rounds} rounds")
+            # The trials that stopped early are not trained further
+            active = sorted((trial for trial in active if not trial.stopped), key=lambda trial: trial.loss)
+            active = active[:max(1, len(active) // reduction_factor)]
+
+    trials = sorted(trials, key=lambda trial: trial.loss)
+    report = pd.DataFrame([dict(trial.params, trial=trial.number, validation_logloss=trial.loss,
+                                best_iteration=trial.best_iteration, rounds=len(trial.losses),
+                                seconds=round(trial.seconds, 3)) for trial in trials])
+    best = trials[0]
+    logger.info(f"Best trial {best.number}: validation log loss {best.loss:.5f} at iteration {best.best_iteration}")
+    return dict(best.config, n_estimators=best.best_iteration + 1), report
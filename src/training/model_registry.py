@@ -0,0 +1,131 @@
+"""
+Model Registry
+
+This module stores the trained pipelines of several tickers in a versioned directory:
+
+    <root>/<ticker>/v<version>/    MLflow model of the full pipeline, with a metadata.json file and,
+                                   in an inference directory, its export (see `src.training.export`)
+
+A new version is written to a temporary directory and renamed once complete, so the readers of
+the registry never see a partially written model. The pip requirements of a pipeline are inferred
+by MLflow once per process and kind of pipeline, instead of once per saved model.
+
+Classes:
+- ModelRegistry: Versioned directory of the pipelines of each ticker.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import logging
+import mlflow
+
+from src.training.export import exportable, export_pipeline, INFERENCE_DIR
+from src.prediction.lite_model import load_lite_pipeline
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models', 'registry'))
+
+# Pip requirements inferred in this process, by the types of the steps of the pipeline
+_pip_requirements = {}
+
+
+class ModelRegistry:
+    """
+    Versioned directory of the pipelines of each ticker.
+
+    Attributes:
+        root (str): Directory of the registry.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def tickers(self):
+        """
+        Return the tickers with at least one registered model.
+        """
+        return sorted(ticker for ticker in os.listdir(self.root) if self.versions(ticker))
+
+    def versions(self, ticker):
+        """
+        Return the registered versions of the model of a ticker, in increasing order.
+        """
+        ticker_dir = os.path.join(self.root, ticker)
+        if not os.path.isdir(ticker_dir):
+            return []
+        return sorted(int(name[1:]) for name in os.listdir(ticker_dir) if name[:1] == 'v' and name[1:].isdigit())
+
+    def path(self, ticker, version=None):
+        """
+        Return the directory of a version of the model of a ticker, the latest one if version is None.
+        """
+        versions = self.versions(ticker)
+        if version is None and versions:
+            version = versions[-1]
+        if version not in versions:
+            logger.error(f"No model version {version} for the ticker {ticker} in {self.root}")
+            raise ValueError(f"No model version {version} for the ticker {ticker} in {self.root}")
+        return os.path.join(self.root, ticker, f"v{version}")
+
+    def register(self, ticker, pipeline, metadata=None):
+        """
+        Save a pipeline as the next version of the model of a ticker.
+
+        Parameters:
+            ticker (str): Ticker of the model.
+            pipeline (sklearn.pipeline.Pipeline): Full pipeline (feature engineering and model).
+            metadata (dict, optional): Metadata saved with the model (e.g. configuration and metrics).
+
+        Returns:
+            int: The version of the model.
+        """
+        ticker_dir = os.path.join(self.root, ticker)
+        tmp_dir = os.path.join(ticker_dir, f".tmp-{uuid.uuid4()}")
+        os.makedirs(ticker_dir, exist_ok=True)
+        try:
+            kind = tuple(type(step).__qualname__ for _, step in getattr(pipeline, 'steps', [(None, pipeline)]))
+            mlflow.sklearn.save_model(pipeline, tmp_dir, pip_requirements=_pip_requirements.get(kind))
+            if kind not in _pip_requirements:
+                with open(os.path.join(tmp_dir, 'requirements.txt')) as fp:
+                    _pip_requirements[kind] = [line.strip() for line in fp
+                                               if line.strip() and not line.startswith(('#', 'mlflow'))]
+            if exportable(pipeline):
+                export_pipeline(pipeline, os.path.join(tmp_dir, INFERENCE_DIR))
+            with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as fp:
+                json.dump(metadata or {}, fp, default=str)
+            while True:
+                version = (self.versions(ticker) or [0])[-1] + 1
+                try:
+                    # Fails if another writer registered the same version in the meantime
+                    os.rename(tmp_dir, os.path.join(ticker_dir, f"v{version}"))
+                    break
+                except OSError:
+                    if not os.path.isdir(os.path.join(ticker_dir, f"v{version}")):
+                        raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.info(f"Registered version {version} of the model of {ticker}")
+        return version
+
+    def load(self, ticker, version=None):
+        """
+        Load a version of the model of a ticker, the latest one if version is None.
+        """
+        return mlflow.sklearn.load_model(self.path(ticker, version))
+
+    def load_lite(self, ticker, version=None):
+        """
+        Load the exported inference path of a version of the model of a ticker, the latest one if version is None.
+        """
+        return load_lite_pipeline(os.path.join(self.path(ticker, version), INFERENCE_DIR))
+
+    def metadata(self, ticker, version=None):
+        """
+        Return the metadata of a version of the model of a ticker, the latest one if version is None.
+        """
+        with open(os.path.join(self.path(ticker, version), 'metadata.json')) as fp:
+            return json.load(fp)
@@ -7,7 +7,8 @@ Usage:
     python train.py  --input_data_artifact <input_data_name> --input_feature_engineering_artifact <input_feature_engineering_pipeline>
                                --train_pct <train_data_percentage> --xgboost_config <xgboost_config_file>
                                --output_artifact <output_model_name> --output_type <output_model_type>
-                               --output_description <output_model_description>
+                               --output_description <output_model_description> [--search_config <search_config_file>]
+                               [--early_stopping_rounds <rounds>]
 
 Arguments:
     --input_data_artifact (str): Name of the input data artifact in Weights & Biases (wandb).
@@ -17,15 +18,22 @@ Arguments:
     --output_artifact (str): Name of the artifact for the trained model to be saved in wandb.
     --output_type (str): Type of the output model artifact.
     --output_description (str): Description of the output model artifact.
+    --search_config (str, optional): Path to the JSON options of the hyperparameter search, whose `method`
+      is 'random', 'halving' or 'none' (default: no search).
+    --early_stopping_rounds (int, optional): Rounds without improvement of the validation loss before the
+      training stops (default: 0, no early stopping).
 
 Execution:
     - The script should be executed with required command-line arguments.
     - It initializes a wandb run to log the training process.
     - Downloads the input data and feature engineering pipeline artifacts from wandb.
     - Splits the data into training and validation datasets.
-    - Trains an XGBoost classifier on the training data.
+    - Optionally searches the best XGBoost configuration, which is saved as the metadata of the model artifact.
+    - Trains an XGBoost classifier on the training data, stopping early on the validation data.
     - Evaluates the trained model on the validation data and logs the accuracy.
-    - Saves the trained model along with its configuration and uploads it to wandb.
+    - Saves the trained model along with its configuration and uploads it to wandb. The model artifact
+      also contains the booster and feature manifest of the pipeline in an `inference` directory,
+      loaded by `src.prediction.lite_model` without mlflow or wandb.
 """
 
 
@@ -39,6 +47,8 @@ import json
 import xgboost as xgb
 import mlflow
 import uuid
+import time
+import numpy as np
 import pandas as pd
 from sklearn.pipeline import Pipeline
 from sklearn.base import BaseEstimator, TransformerMixin
@@ -49,6 +59,10 @@ parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')
 sys.path.insert(0, parent_dir)
 
 from src.utils.utils import read_data_from_wandb,upload_data_to_wandb
+from src.utils.artifacts import init_run, download_artifact
+from src.feature_engineering.feature_store import get_feature_store
+from src.training.hyperparameter_search import search_hyperparameters
+from src.training.export import exportable, export_pipeline, INFERENCE_DIR
 
 
 log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -80,6 +94,8 @@ def parse_arguments():
     parser.add_argument("--output_artifact", type=str, help="Name of the artifact for the cleaned data", required=True)
     parser.add_argument("--output_type", type=str, help="Type of the output data artifact", required=True)
     parser.add_argument("--output_description", type=str, help="Description of the output data artifact", required=True)
+    parser.add_argument("--search_config", type=str, help="Path to the hyperparameter search options", default=None)
+    parser.add_argument("--early_stopping_rounds", type=int, help="Rounds without improvement before the training stops", default=0)
     return parser.parse_args()
 
 def split_data(df, pct):
@@ -107,38 +123,80 @@ def split_data(df, pct):
         return None, None
 
 
-def train_xgboost(df, target_name, xgboost_config):
+def to_float32_matrix(df, columns):
+    """
+    Copy columns of a DataFrame into a C-contiguous float32 matrix, one column at a time.
+
+    Parameters:
+        df (pandas.DataFrame): Input DataFrame.
+        columns (list): Columns to copy.
+
+    Returns:
+        numpy.ndarray: Matrix with one column per column of `columns`.
+    """
+    matrix = np.empty((len(df), len(columns)), dtype=np.float32)
+    for position, column in enumerate(columns):
+        matrix[:, position] = df[column].to_numpy()
+    return matrix
+
+
+def train_xgboost(df, target_name, xgboost_config, val_df=None, early_stopping_rounds=None):
     """
     Train an XGBoost classifier.
 
+    The features are passed to XGBoost as a float32 matrix, quantized once into a QuantileDMatrix
+    by the `hist` tree method (the default when the configuration sets no tree method).
+
     Parameters:
         df (pandas.DataFrame): Input DataFrame containing the training data.
         target_name (str): Name of the target variable.
         xgboost_config (dict): Configuration parameters for the XGBoost classifier.
+        val_df (pandas.DataFrame, optional): Validation data evaluated after each boosting round.
+        early_stopping_rounds (int, optional): Rounds without improvement on the validation data before the training stops.
 
     Returns:
         xgb.XGBClassifier: Trained XGBoost classifier.
     """
     try:
+        xgboost_config = dict(xgboost_config)
+        xgboost_config.setdefault('tree_method', 'hist')
+        if val_df is not None and early_stopping_rounds:
+            xgboost_config['early_stopping_rounds'] = early_stopping_rounds
+
         # Define the XGBoost classifier
         clf = xgb.XGBClassifier(**xgboost_config)
 
+        # Features without the copy of the whole DataFrame made by dropping the target
+        feature_columns = [column for column in df.columns if column != target_name]
+        features = to_float32_matrix(df, feature_columns)
+        eval_set = None
+        if val_df is not None:
+            eval_set = [(to_float32_matrix(val_df, feature_columns), val_df[target_name].to_numpy())]
+
         # Train the classifier
-        clf.fit(df.drop(columns=[target_name]), df[target_name])
-        
+        start = time.perf_counter()
+        clf.fit(features, df[target_name].to_numpy(), eval_set=eval_set, verbose=False)
+        seconds = time.perf_counter() - start
+        # Keep the feature names of the columns for the validation of the prediction data
+        clf.get_booster().feature_names = [str(column) for column in feature_columns]
+
+        best_iteration = clf.best_iteration if eval_set and early_stopping_rounds else clf.get_booster().num_boosted_rounds() - 1
+        logging.info(f"Trained on {len(df)} rows in {seconds:.3f}s ({len(df) / max(seconds, 1e-9):.0f} rows/sec), "
+                     f"best iteration {best_iteration}")
         return clf
     except Exception as e:
         logging.error(f"Error occurred while training XGBoost classifier: {str(e)}")
         return None
 
 
-def transform_data(df, pipeline):
+def transform_data(df, pipeline, feature_store=None):
     """
     Transform input data using a feature engineering pipeline.
 
     Parameters:
         df (pandas.DataFrame): Input DataFrame containing the data.
         pipeline (sklearn.pipeline.Pipeline): Feature engineering pipeline.
+        feature_store (FeatureStore, optional): Store reusing the features computed for the same data and pipeline.
 
     Returns:
         pandas.DataFrame: Transformed DataFrame with features and labels.
@@ -150,7 +208,7 @@ def transform_data(df, pipeline):
         df.reset_index(drop=True, inplace=True)
 
         # Transform data using the pipeline
-        features_df = pipeline.transform(df)
+        features_df = feature_store.transform(df, pipeline) if feature_store else pipeline.transform(df)
         features_df = pd.DataFrame(features_df)
         features_df["label"] = df["label"].copy()
         features_df.dropna(inplace=True)
@@ -160,6 +218,57 @@ def transform_data(df, pipeline):
         logging.error(f"Error occurred while transforming data: {str(e)}")
         return None
 
+
+def train_pipeline(df, feature_engineering, train_pct, xgboost_config, feature_store=None, search=None,
+                   early_stopping_rounds=None):
+    """
+    Train the XGBoost classifier and build the full prediction pipeline.
+
+    With a hyperparameter search, the classifier is trained with the best configuration found on
+    the validation data.
+
+    Parameters:
+        df (pandas.DataFrame): Input DataFrame containing the training and validation data.
+        feature_engineering (sklearn.pipeline.Pipeline): Feature engineering pipeline.
+        train_pct (float): Percentage of data to be used for training, the remainder is used for validation.
+        xgboost_config (dict): Configuration parameters for the XGBoost classifier.
+        feature_store (FeatureStore, optional): Store reusing the features computed for the same data and pipeline.
+        search (dict, optional): Options of `search_hyperparameters` (method, n_trials, max_workers...).
+        early_stopping_rounds (int, optional): Rounds without improvement on the validation data before the training stops.
+
+    Returns:
+        tuple: The full pipeline (feature engineering and model), its accuracy on the validation data
+        and the configuration of the classifier.
+    """
+    # Splitting data
+    train_df, val_df = split_data(df, train_pct)
+    logging.info("Data split into train and validation sets.")
+
+    transformed_train_df = transform_data(train_df, feature_engineering, feature_store)
+    transformed_val_df = transform_data(val_df, feature_engineering, feature_store)
+
+    # Hyperparameter search
+    if search and search.get('method', 'none') != 'none':
+        xgboost_config, trials = search_hyperparameters(transformed_train_df, transformed_val_df, 'label',
+                                                        xgboost_config, **search)
+        logging.info(f"Hyperparameter search trials:\n{trials.to_string(index=False)}")
+
+    # Training
+    model = train_xgboost(transformed_train_df, 'label', xgboost_config, val_df=transformed_val_df,
+                          early_stopping_rounds=early_stopping_rounds)
+    logging.info("Model trained successfully.")
+
+    # Evaluation
+    y_pred = model.predict(transformed_val_df.drop(columns=['label']))
+    accuracy = accuracy_score(y_pred, transformed_val_df['label'])
+    logging.info(f"Accuracy: {accuracy}")
+
+    full_pipeline = Pipeline([
+        ('feature_engineering', TransformerWrapper(feature_engineering)),
+        ('model', model)
+    ])
+    return full_pipeline, accuracy, xgboost_config
+
 if __name__ == '__main__':
     
 
@@ -170,8 +279,12 @@ if __name__ == '__main__':
         # Get the XGBoost configuration and update W&B
         with open(args.xgboost_config) as fp:
             xgboost_config = json.load(fp)
+        search = None
+        if args.search_config:
+            with open(args.search_config) as fp:
+                search = json.load(fp)
 
-        run = wandb.init()
+        run = init_run()
 
         # Downloading data
         download_data_path = os.path.join(os.path.dirname(__file__), "..", "..", "artifacts", "feature_engineering")
@@ -180,38 +293,26 @@ if __name__ == '__main__':
 
         # Downloading feature engineering pipeline
         download_feature_engineering_path = os.path.join(os.path.dirname(__file__), "..", "models", "feature_engineering")
-        if os.path.exists(download_feature_engineering_path):
-            shutil.rmtree(download_feature_engineering_path)
-        feature_engineering_export_path = run.use_artifact(args.input_feature_engineering_artifact).download(root=download_feature_engineering_path)
+        feature_engineering_export_path = download_artifact(run.use_artifact(args.input_feature_engineering_artifact),
+                                                            download_feature_engineering_path)
         feature_engineering = mlflow.sklearn.load_model(feature_engineering_export_path)
         logging.info("Feature engineering pipeline downloaded successfully.")
 
-        # Splitting data
-        train_df, val_df = split_data(df, args.train_pct)
-        logging.info("Data split into train and validation sets.")
-
-        # Training
-        transformed_train_df = transform_data(train_df, feature_engineering)
-        model = train_xgboost(transformed_train_df, 'label', xgboost_config)
-        logging.info("Model trained successfully.")
-
-        # Evaluation
-        transformed_val_df = transform_data(val_df, feature_engineering)
-        y_pred = model.predict(transformed_val_df.drop(columns=['label']))
-        accuracy = accuracy_score(y_pred, transformed_val_df['label'])
+        # Training and evaluation
+        full_pipeline, accuracy, xgboost_config = train_pipeline(df, feature_engineering, args.train_pct,
+                                                                 xgboost_config, feature_store=get_feature_store(),
+                                                                 search=search,
+                                                                 early_stopping_rounds=args.early_stopping_rounds)
         run.summary['accuracy'] = accuracy
-        logging.info(f"Accuracy: {accuracy}")
 
         # Saving full pipeline
-        full_pipeline = Pipeline([
-            ('feature_engineering', TransformerWrapper(feature_engineering)),
-            ('model', model)
-        ])
         unique_id = uuid.uuid4()
         model_path = os.path.join(os.path.dirname(__file__), "..", "models", f"config_{unique_id}")
         if os.path.exists(model_path):
             shutil.rmtree(model_path)
         mlflow.sklearn.save_model(full_pipeline, model_path)
+        if exportable(full_pipeline):
+            export_pipeline(full_pipeline, os.path.join(model_path, INFERENCE_DIR))
         logging.info("Full pipeline saved successfully.")
 
         # Uploading pipeline to W&B
@@ -221,6 +322,8 @@ if __name__ == '__main__':
 
         shutil.rmtree(model_path)
         os.remove(args.xgboost_config)
+        if args.search_config:
+            os.remove(args.search_config)
         wandb.finish()
         logging.info("Training completed.")
 
@@ -0,0 +1,414 @@
+"""
+Artifact Cache and Offline Artifact Store
+
+This module keeps downloaded artifacts in a local content-addressed cache, and provides a
+filesystem-backed stand-in for Weights & Biases so the pipeline can run without network.
+
+Classes:
+- ArtifactCache: Local cache of artifact files keyed by the artifact digest, with size-bounded LRU eviction.
+- LocalArtifactStore: Filesystem-backed artifact store with versions and aliases.
+- LocalArtifact: Artifact of a LocalArtifactStore, exposing the parts of the W&B artifact API used by the steps.
+- OfflineRun: Stand-in of a W&B run reading and logging artifacts in a LocalArtifactStore.
+
+Functions:
+- get_artifact_cache: Return the artifact cache configured by the environment.
+- download_artifact: Download an artifact through the cache.
+- init_run: Start a W&B run, or an offline run when an offline store is configured.
+
+Environment variables:
+- ARTIFACT_CACHE_DIR: Directory of the artifact cache (default: artifacts/cache).
+- ARTIFACT_CACHE_MAX_MB: Maximum size of the artifact cache in MB, 0 disables the cache (default: 2048).
+- ARTIFACT_STORE_DIR: Directory of the offline artifact store. When set, steps read and log
+  their artifacts there instead of W&B.
+
+Usage:
+    Promote a version of an artifact of the offline store:
+    python artifacts.py --store_dir <store_dir> --artifact trained_model:latest --alias production
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+import wandb
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, the cache is then only locked between the threads of a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'artifacts', 'cache'))
+DEFAULT_CACHE_MAX_MB = 2048
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ArtifactCache:
+    """
+    Local cache of artifact files keyed by the artifact digest.
+
+    Each cached artifact is stored in `<root>/<digest>`. An index keeps the size and last access
+    time of the entries, and the least recently used entries are evicted when the cache exceeds
+    its maximum size. The steps running in separate processes share the cache, the index is read,
+    updated and written, and the entries evicted, under a lock on the `index.lock` file.
+
+    Attributes:
+        root (str): Directory of the cache.
+        max_bytes (int): Maximum size of the cache in bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, 'index.json')
+        self._lock_path = os.path.join(root, 'index.lock')
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Lock between the threads of this process, then between the processes
+        with self._lock:
+            with open(self._lock_path, 'a') as fp:
+                if fcntl is not None:
+                    fcntl.flock(fp, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        if not os.path.isfile(self._index_path):
+            return {}
+        with open(self._index_path) as fp:
+            return json.load(fp)
+
+    def get(self, artifact):
+        """
+        Return the cached directory of an artifact.
+
+        Parameters:
+            artifact: The artifact, with `name` and `digest` attributes.
+
+        Returns:
+            str: The directory containing the artifact files, or None if the artifact is not cached.
+        """
+        with self._locked():
+            index = self._read_index()
+            path = os.path.join(self.root, artifact.digest)
+            if artifact.digest not in index or not os.path.isdir(path):
+                return None
+            index[artifact.digest]['last_access'] = time.time()
+            _write_json(self._index_path, index)
+            return path
+
+    def download(self, artifact):
+        """
+        Return the cached directory of an artifact, downloading it on a cache miss.
+
+        Parameters:
+            artifact: The artifact, with `name` and `digest` attributes and a `download(root)` method.
+
+        Returns:
+            str: The directory containing the artifact files.
+        """
+        path = self.get(artifact)
+        if path is not None:
+            logger.info(f"Artifact cache hit: {artifact.name} ({artifact.digest})")
+            return path
+
+        logger.info(f"Artifact cache miss: {artifact.name} ({artifact.digest})")
+        tmp_path = tempfile.mkdtemp(dir=self.root)
+        try:
+            artifact.download(root=tmp_path)
+            with self._locked():
+                path = os.path.join(self.root, artifact.digest)
+                if os.path.isdir(path):
+                    shutil.rmtree(tmp_path)
+                else:
+                    os.replace(tmp_path, path)
+                index = self._read_index()
+                index[artifact.digest] = {'name': artifact.name,
+                                          'size': _directory_size(path),
+                                          'last_access': time.time()}
+                self._evict(index, keep=artifact.digest)
+                _write_json(self._index_path, index)
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+        return path
+
+    def _evict(self, index, keep):
+        total = sum(entry['size'] for entry in index.values())
+        for digest in sorted(index, key=lambda digest: index[digest]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, digest), ignore_errors=True)
+            total -= index.pop(digest)['size']
+            logger.info(f"Evicted artifact {digest} from the cache")
+
+
+_cache = None
+
+
+def get_artifact_cache():
+    """
+    Return the artifact cache configured by the ARTIFACT_CACHE_DIR and ARTIFACT_CACHE_MAX_MB
+    environment variables.
+
+    Returns:
+        ArtifactCache: The artifact cache, or None if the cache is disabled.
+    """
+    global _cache
+    max_bytes = int(float(os.environ.get('ARTIFACT_CACHE_MAX_MB', DEFAULT_CACHE_MAX_MB)) * 1024 ** 2)
+    if max_bytes <= 0:
+        return None
+
+    root = os.environ.get('ARTIFACT_CACHE_DIR') or DEFAULT_CACHE_DIR
+    if _cache is None or _cache.root != root or _cache.max_bytes != max_bytes:
+        _cache = ArtifactCache(root, max_bytes)
+    return _cache
+
+
+def download_artifact(artifact, download_path=None):
+    """
+    Download the files of an artifact through the artifact cache.
+
+    Parameters:
+        artifact: The artifact to download.
+        download_path (str, optional): Directory used when the cache is disabled.
+
+    Returns:
+        str: The directory containing the artifact files.
+    """
+    cache = get_artifact_cache()
+    if cache is None:
+        return artifact.download(root=download_path)
+    return cache.download(artifact)
+
+
+class LocalArtifact:
+    """
+    Artifact version stored in a LocalArtifactStore.
+
+    Attributes:
+        name (str): Name of the artifact with its version, e.g. `cleaned_data:v2`.
+        version (str): Version of the artifact, e.g. `v2`.
+        digest (str): Hash of the artifact files.
+        type (str): Type of the artifact.
+        description (str): Description of the artifact.
+        metadata (dict): Metadata of the artifact.
+    """
+
+    def __init__(self, path, name, version):
+        self._path = path
+        self.name = f"{name}:{version}"
+        self.version = version
+        with open(os.path.join(path, 'meta.json')) as fp:
+            meta = json.load(fp)
+        self.digest = meta['digest']
+        self.type = meta['type']
+        self.description = meta['description']
+        self.metadata = meta['metadata']
+
+    def download(self, root=None):
+        """
+        Copy the artifact files to a directory.
+
+        Parameters:
+            root (str, optional): Destination directory. Defaults to `artifacts/<name>`.
+
+        Returns:
+            str: The destination directory.
+        """
+        root = root or os.path.join('artifacts', self.name.replace(':', '_'))
+        shutil.copytree(os.path.join(self._path, 'files'), root, dirs_exist_ok=True)
+        return root
+
+
+class LocalArtifactStore:
+    """
+    Filesystem-backed artifact store.
+
+    Every version of an artifact is stored in `<root>/<name>/<version>` and aliases such as
+    `latest` or `production` are kept in `<root>/<name>/aliases.json`.
+
+    Attributes:
+        root (str): Directory of the store.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _aliases(self, name):
+        path = os.path.join(self.root, name, 'aliases.json')
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as fp:
+            return json.load(fp)
+
+    def get(self, artifact_name):
+        """
+        Return a version of an artifact.
+
+        Parameters:
+            artifact_name (str): Name of the artifact with a version or alias, e.g. `test:latest`.
+                The `latest` alias is used when none is given.
+
+        Raises:
+            ValueError: If the artifact or its version does not exist.
+
+        Returns:
+            LocalArtifact: The artifact version.
+        """
+        name, _, alias = artifact_name.partition(':')
+        alias = alias or 'latest'
+        version = self._aliases(name).get(alias, alias)
+        path = os.path.join(self.root, name, version)
+        if not os.path.isfile(os.path.join(path, 'meta.json')):
+            raise ValueError(f"Artifact '{artifact_name}' not found in the offline store {self.root}")
+        return LocalArtifact(path, name, version)
+
+    def add_alias(self, artifact_name, alias):
+        """
+        Point an alias to a version of an artifact, e.g. to promote a model to `production`.
+
+        Parameters:
+            artifact_name (str): Name of the artifact with a version or alias.
+            alias (str): The alias to set.
+        """
+        artifact = self.get(artifact_name)
+        name = artifact_name.partition(':')[0]
+        with self._lock:
+            aliases = self._aliases(name)
+            aliases[alias] = artifact.version
+            _write_json(os.path.join(self.root, name, 'aliases.json'), aliases)
+
+    def log(self, name, files, type, description=None, metadata=None):
+        """
+        Store a new version of an artifact, unless its files did not change since the latest version.
+
+        Parameters:
+            name (str): Name of the artifact.
+            files (dict): Path of each file in the artifact mapped to its local path.
+            type (str): Type of the artifact.
+            description (str, optional): Description of the artifact.
+            metadata (dict, optional): Metadata of the artifact.
+
+        Returns:
+            LocalArtifact: The stored artifact version.
+        """
+        digest = hashlib.sha256()
+        for artifact_path in sorted(files):
+            digest.update(artifact_path.encode())
+            with open(files[artifact_path], 'rb') as fp:
+                for block in iter(lambda: fp.read(1 << 20), b''):
+                    digest.update(block)
+        digest = digest.hexdigest()
+
+        with self._lock:
+            aliases = self._aliases(name)
+            if 'latest' in aliases and self.get(f"{name}:latest").digest == digest:
+                return self.get(f"{name}:latest")
+
+            versions = [int(version[1:]) for version in aliases.values() if version.startswith('v')]
+            version = f"v{max(versions) + 1 if versions else 0}"
+            path = os.path.join(self.root, name, version)
+            for artifact_path, local_path in files.items():
+                destination = os.path.join(path, 'files', artifact_path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(local_path, destination)
+            _write_json(os.path.join(path, 'meta.json'), {'digest': digest,
+                                                          'type': type,
+                                                          'description': description,
+                                                          'metadata': metadata or {}})
+            aliases['latest'] = aliases[version] = version
+            _write_json(os.path.join(self.root, name, 'aliases.json'), aliases)
+        logger.info(f"Stored artifact {name}:{version} in the offline store")
+        return self.get(f"{name}:{version}")
+
+
+class OfflineRun:
+    """
+    Stand-in of a W&B run reading and logging artifacts in a LocalArtifactStore.
+
+    Attributes:
+        store (LocalArtifactStore): The offline artifact store.
+        summary (dict): Summary metrics of the run.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.summary = {}
+
+    def use_artifact(self, artifact_name):
+        return self.store.get(artifact_name)
+
+    def log_artifact(self, artifact):
+        """
+        Store a W&B artifact in the offline store.
+
+        Parameters:
+            artifact (wandb.Artifact): The artifact built by the step.
+
+        Returns:
+            LocalArtifact: The stored artifact version.
+        """
+        files = {path: entry.local_path for path, entry in artifact.manifest.entries.items()}
+        return self.store.log(artifact.name, files, artifact.type, artifact.description, artifact.metadata)
+
+    def log(self, data):
+        self.summary.update(data)
+
+    def finish(self):
+        pass
+
+
+def init_run(**kwargs):
+    """
+    Start a W&B run, or an offline run when the ARTIFACT_STORE_DIR environment variable is set.
+
+    Parameters:
+        **kwargs: Arguments passed to `wandb.init`.
+
+    Returns:
+        The W&B run or the OfflineRun.
+    """
+    store_dir = os.environ.get('ARTIFACT_STORE_DIR')
+    if store_dir:
+        logger.info(f"Using the offline artifact store {store_dir}")
+        return OfflineRun(LocalArtifactStore(store_dir))
+    return wandb.init(**kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Set an alias of an artifact in the offline store")
+    parser.add_argument("--store_dir", type=str, help="directory of the offline artifact store", required=True)
+    parser.add_argument("--artifact", type=str, help="artifact name with its version or alias", required=True)
+    parser.add_argument("--alias", type=str, help="alias to set, e.g. production", required=True)
+    args = parser.parse_args()
+
+    LocalArtifactStore(args.store_dir).add_alias(args.artifact, args.alias)
@@ -0,0 +1,189 @@
+"""
+Database Migrations
+
+This module versions the schema of the predictions database. The migrations are applied in order,
+each one in its own transaction, and the applied versions are recorded in the `schema_migrations`
+table, so `migrate` can run before every write and only applies the missing migrations. Concurrent
+runs are serialized by an advisory lock. Only the writers migrate (save_prediction, the pipeline
+executor or this script): the readers, e.g. the dashboard, need no DDL privileges and show no data
+until the schema is up to date.
+
+Migrations:
+1. Create the predictions table, as created by the first deployments.
+2. Add the ticker of the predictions, and index them by (ticker, date, model_used) for the lookups of
+   the dashboard. The primary key on the date only, which allowed a single prediction per day, is
+   replaced by this unique index, so a prediction is written once per ticker, day and model (see
+   `db_utils.copy_df` with PREDICTION_KEY). Duplicated predictions are removed first.
+3. Count the writes to the predictions table in `data_versions`, with a statement-level trigger.
+   The result caches of the readers (see `db_utils.select_predictions`) compare this version to
+   know when their results are stale, whichever process wrote the rows.
+4. Queue the (model_used, ticker, date) of the predictions whose outcome changes in `prediction_changes`,
+   with a row-level trigger, and create the tables of the performance summary (see `performance`).
+   The days already scored are queued, so the first refresh aggregates the existing history.
+
+Functions:
+- migrate: Apply the pending migrations.
+
+Usage:
+    python db_migrations.py --database_url <database_url>
+"""
+
+import sys
+import os
+import logging
+import argparse
+import psycopg2
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.db_utils import borrow_connection, PREDICTIONS_TABLE, OUTCOMES_TABLE, PERFORMANCE_TABLE
+
+logger = logging.getLogger(__name__)
+
+# Key of the advisory lock serializing the migrations
+MIGRATION_LOCK = 4817203
+
+MIGRATIONS = [
+    (1, "create predictions table", [
+        f"""CREATE TABLE IF NOT EXISTS {PREDICTIONS_TABLE} (
+            date DATE PRIMARY KEY,
+            prediction NUMERIC,
+            feedback NUMERIC,
+            model_used VARCHAR(50)
+        )""",
+    ]),
+    (2, "add ticker and unique (ticker, date, model_used) index", [
+        f"ALTER TABLE {PREDICTIONS_TABLE} ADD COLUMN IF NOT EXISTS ticker VARCHAR(16)",
+        f"ALTER TABLE {PREDICTIONS_TABLE} DROP CONSTRAINT IF EXISTS {PREDICTIONS_TABLE}_pkey",
+        # The last written of the duplicated predictions is kept
+        f"""DELETE FROM {PREDICTIONS_TABLE} AS a USING {PREDICTIONS_TABLE} AS b
+            WHERE a.ctid < b.ctid AND a.ticker = b.ticker AND a.date = b.date AND a.model_used = b.model_used""",
+        f"""CREATE UNIQUE INDEX IF NOT EXISTS {PREDICTIONS_TABLE}_ticker_date_model_idx
+            ON {PREDICTIONS_TABLE} (ticker, date, model_used)""",
+    ]),
+    (3, "version the writes to the predictions table", [
+        """CREATE TABLE IF NOT EXISTS data_versions (
+            table_name VARCHAR(63) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )""",
+        f"INSERT INTO data_versions (table_name) VALUES ('{PREDICTIONS_TABLE}') ON CONFLICT DO NOTHING",
+        """CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS {PREDICTIONS_TABLE}_version ON {PREDICTIONS_TABLE}",
+        f"""CREATE TRIGGER {PREDICTIONS_TABLE}_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {PREDICTIONS_TABLE}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()""",
+    ]),
+    (4, "queue the prediction outcomes and create the performance summary", [
+        """CREATE TABLE IF NOT EXISTS prediction_changes (
+            id BIGSERIAL PRIMARY KEY,
+            model_used VARCHAR(50),
+            ticker VARCHAR(16),
+            date DATE
+        )""",
+        """CREATE OR REPLACE FUNCTION queue_prediction_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND ROW(NEW.date, NEW.ticker, NEW.model_used, NEW.prediction, NEW.feedback)
+                    IS NOT DISTINCT FROM ROW(OLD.date, OLD.ticker, OLD.model_used, OLD.prediction, OLD.feedback) THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP <> 'INSERT' THEN
+                INSERT INTO prediction_changes (model_used, ticker, date) VALUES (OLD.model_used, OLD.ticker, OLD.date);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO prediction_changes (model_used, ticker, date) VALUES (NEW.model_used, NEW.ticker, NEW.date);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS {PREDICTIONS_TABLE}_changes ON {PREDICTIONS_TABLE}",
+        f"""CREATE TRIGGER {PREDICTIONS_TABLE}_changes
+            AFTER INSERT OR UPDATE OR DELETE ON {PREDICTIONS_TABLE}
+            FOR EACH ROW EXECUTE FUNCTION queue_prediction_change()""",
+        f"""INSERT INTO prediction_changes (model_used, ticker, date)
+            SELECT DISTINCT model_used, ticker, date FROM {PREDICTIONS_TABLE} WHERE feedback IS NOT NULL""",
+        f"""CREATE TABLE IF NOT EXISTS {OUTCOMES_TABLE} (
+            model_used VARCHAR(50) NOT NULL,
+            ticker VARCHAR(16) NOT NULL,
+            date DATE NOT NULL,
+            tp INTEGER NOT NULL,
+            fp INTEGER NOT NULL,
+            tn INTEGER NOT NULL,
+            fn INTEGER NOT NULL,
+            PRIMARY KEY (model_used, ticker, date)
+        )""",
+        f"""CREATE TABLE IF NOT EXISTS {PERFORMANCE_TABLE} (
+            model_used VARCHAR(50) NOT NULL,
+            ticker VARCHAR(16) NOT NULL,
+            window_days INTEGER NOT NULL,
+            start_date DATE,
+            end_date DATE,
+            predictions INTEGER NOT NULL,
+            accuracy DOUBLE PRECISION,
+            "precision" DOUBLE PRECISION,
+            hit_rate DOUBLE PRECISION,
+            updated_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (model_used, ticker, window_days)
+        )""",
+    ]),
+]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """
+    Apply the migrations not applied yet to the database, in order.
+
+    Parameters:
+        conn (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
+        migrations (list): (version, name, statements) of each migration, in increasing version order.
+
+    Returns:
+        list: The versions applied by this call.
+    """
+    applied = []
+    with borrow_connection(conn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )""")
+            conn.commit()
+
+            for version, name, statements in migrations:
+                try:
+                    # Held until the end of the transaction, the other runs wait and find the version applied
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+                    cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                    if cursor.fetchone():
+                        conn.rollback()
+                        continue
+                    for statement in statements:
+                        cursor.execute(statement)
+                    cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    logger.error(f"Error applying the migration {version} ({name}): {e}")
+                    raise
+                logger.info(f"Applied the migration {version} ({name})")
+                applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply the pending migrations of the predictions database")
+    parser.add_argument("--database_url", type=str, help="database url", default=os.environ.get("DB_URL"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    connection = psycopg2.connect(args.database_url)
+    try:
+        print("Applied migrations:", migrate(connection))
+    finally:
+        connection.close()
@@ -1,12 +1,288 @@
+import io
+import os
+import re
+import uuid
+import time
 import logging
+import threading
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import PoolError
 import psycopg2.extras as extras 
 import pandas as pd
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+DEFAULT_MAX_CONNECTIONS = 5
+# Seconds a connection stays idle in a pool before it is checked when borrowed
+DEFAULT_CHECK_INTERVAL = 30.0
+# Rows serialized and sent to the database per COPY statement
+DEFAULT_COPY_CHUNK_ROWS = 100000
+# Table of the predictions, and the columns identifying a prediction
+PREDICTIONS_TABLE = 'stocks_predictions'
+PREDICTION_KEY = ('date', 'ticker', 'model_used')
+PREDICTION_COLUMNS = ('date', 'ticker', 'prediction', 'feedback', 'model_used')
+# Daily confusion counts of the scored predictions, and the performance summary computed from them
+OUTCOMES_TABLE = 'prediction_outcomes'
+PERFORMANCE_TABLE = 'prediction_performance'
+# Maximum number of results kept by the prediction cache
+PREDICTION_CACHE_SIZE = 256
+
+# Pools of this process, by database URL
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Results of select_predictions, by query, with the version of the table they were read at
+_prediction_cache = OrderedDict()
+_prediction_cache_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections.
+
+    Connections are created on demand up to `maxconn`, and a borrower waits for a connection to be
+    returned when they are all in use. A connection idle for more than `check_interval` seconds is
+    checked with `health_query` before it is lent, and a connection that fails the check, or whose
+    borrower raised an error and that fails the check afterwards, is replaced. The transaction left
+    open by a borrower is rolled back when its connection is returned.
+
+    The connections are created by a factory, e.g. `psycopg2.connect` or `sqlite3.connect`.
+
+    Attributes:
+    - minconn (int): Number of connections opened when the pool is created.
+    - maxconn (int): Maximum number of connections open at the same time.
+    - timeout (float): Maximum seconds to wait for a connection.
+    - check_interval (float): Idle seconds after which a connection is checked before it is lent.
+    - health_query (str): Query run by the health check.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=DEFAULT_MAX_CONNECTIONS, timeout=30.0,
+                 check_interval=DEFAULT_CHECK_INTERVAL, health_query="SELECT 1"):
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            logging.error("Invalid pool size: minconn=%s, maxconn=%s", minconn, maxconn)
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.health_query = health_query
+        self._connect = connect
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._counts = {'created': 0, 'borrowed': 0, 'discarded': 0, 'waits': 0, 'failed_checks': 0}
+        for _ in range(minconn):
+            self._idle.append((self._new_connection(), time.monotonic()))
+
+    def _new_connection(self):
+        connection = self._connect()
+        with self._cond:
+            self._counts['created'] += 1
+        return connection
+
+    def _healthy(self, connection):
+        # psycopg2 connections know when they are closed, the others are checked by the query
+        if getattr(connection, 'closed', 0):
+            healthy = False
+        else:
+            try:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(self.health_query)
+                    cursor.fetchall()
+                finally:
+                    cursor.close()
+                connection.rollback()
+                healthy = True
+            except Exception:
+                healthy = False
+        if not healthy:
+            with self._cond:
+                self._counts['failed_checks'] += 1
+        return healthy
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """
+        Borrow a connection, waiting up to `timeout` seconds for one to be returned if they are all in use.
+
+        Returns:
+        - connection: A healthy connection, to be returned with `putconn`.
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._in_use < self.maxconn:
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.error("No database connection available after %s seconds.", self.timeout)
+                    raise PoolError(f"No database connection available after {self.timeout} seconds")
+                self._counts['waits'] += 1
+                self._cond.wait(remaining)
+            # The slot is reserved, the connection is opened or checked outside of the lock
+            self._in_use += 1
+
+        try:
+            if connection is not None and time.monotonic() - last_used > self.check_interval \
+                    and not self._healthy(connection):
+                logging.info("Replacing a stale database connection.")
+                self._discard(connection)
+                with self._cond:
+                    self._counts['discarded'] += 1
+                connection = None
+            if connection is None:
+                connection = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counts['borrowed'] += 1
+        return connection
+
+    def putconn(self, connection, discard=False):
+        """
+        Return a borrowed connection to the pool, rolling back its open transaction.
+
+        Parameters:
+        - connection: The borrowed connection.
+        - discard (bool): Close the connection instead of keeping it, e.g. when it is broken.
+        """
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._counts['discarded'] += 1
+            keep = not discard and not self._closed
+            if keep:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+        if not keep:
+            self._discard(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+        A connection whose borrower raised an error is replaced if it fails the health check.
+        """
+        connection = self.getconn()
+        try:
+            yield connection
+        except Exception:
+            # The transaction aborted by the error fails any query until it is rolled back
+            try:
+                connection.rollback()
+            except Exception:
+                pass
+            self.putconn(connection, discard=not self._healthy(connection))
+            raise
+        self.putconn(connection)
+
+    def stats(self):
+        """
+        Return the statistics of the pool.
+
+        Returns:
+        - dict: Open, in use and idle connections, and the numbers of connections created, borrowed and
+          discarded, of borrowers that waited and of failed health checks.
+        """
+        with self._cond:
+            return dict(open=self._in_use + len(self._idle), in_use=self._in_use, idle=len(self._idle),
+                        maxconn=self.maxconn, **self._counts)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """
+        Close the idle connections, the borrowed ones are closed when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for connection, _ in idle:
+            self._discard(connection)
+        logging.info("Connection pool closed.")
+
+
+def get_pool(database_url, maxconn=None):
+    """
+    Return the connection pool of a PostgreSQL database, shared by the threads of the process.
+
+    Parameters:
+    - database_url (str): The URL of the PostgreSQL database.
+    - maxconn (int, optional): Maximum number of connections, the DB_POOL_MAX_CONNECTIONS environment
+      variable or DEFAULT_MAX_CONNECTIONS if None.
+
+    Returns:
+    - ConnectionPool: The pool of the database.
+    """
+    with _pools_lock:
+        pool = _pools.get(database_url)
+        if pool is None or pool.closed:
+            maxconn = maxconn or int(os.environ.get('DB_POOL_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+            # No connection is opened before the first borrower
+            pool = ConnectionPool(functools.partial(psycopg2.connect, database_url), minconn=0, maxconn=maxconn)
+            _pools[database_url] = pool
+            logging.info("Connection pool created for %s.", _redact(database_url))
+        return pool
+
+
+def pool_stats():
+    """
+    Return the statistics of the connection pools of the process, by database URL without password.
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {_redact(url): pool.stats() for url, pool in pools.items()}
+
+
+def _redact(database_url):
+    return re.sub(r'(://[^:/@]*:)[^@]*@', r'\1***@', str(database_url))
+
+
+@contextmanager
+def borrow_connection(connection):
+    """
+    Use a connection, borrowed from the pool for the duration of a `with` block if a pool is given.
+
+    Parameters:
+    - connection (psycopg2 connection or ConnectionPool): A connection, or the pool to borrow it from.
+    """
+    if isinstance(connection, ConnectionPool):
+        with connection.connection() as borrowed:
+            yield borrowed
+    else:
+        yield connection
+
+
 def connect_to_database(database_url):
     """
     Establishes a connection to the PostgreSQL database.
@@ -29,8 +305,10 @@ def insert_df(conn, df, table):
     """
     Inserts data from a Pandas DataFrame into a PostgreSQL table using psycopg2's execute_values method.
 
+    Each row is converted to a tuple, see `copy_df` to load large DataFrames.
+
     Parameters:
-    - conn (psycopg2 connection): The connection to the PostgreSQL database.
+    - conn (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
     - df (DataFrame): The DataFrame containing the data to be inserted.
     - table (str): The name of the PostgreSQL table.
 
@@ -46,28 +324,105 @@ def insert_df(conn, df, table):
     # SQL query to execute
     query = "INSERT INTO %s(%s) VALUES %%s" % (table, cols)
 
-    cursor = conn.cursor()
-    try:
-        # Execute the query using psycopg2's execute_values method
-        extras.execute_values(cursor, query, tuples)
-        conn.commit()
-        logging.info("Data inserted into table %s.", table)
-    except (Exception, psycopg2.DatabaseError) as error:
-        # Rollback changes if an error occurs
-        logging.error("Error inserting data into table %s: %s", table, error)
-        conn.rollback()
-        return 1
-    finally:
-        # Close the cursor
-        cursor.close()
-        logging.info("Cursor closed.")
+    with borrow_connection(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            # Execute the query using psycopg2's execute_values method
+            extras.execute_values(cursor, query, tuples)
+            conn.commit()
+            logging.info("Data inserted into table %s.", table)
+        except (Exception, psycopg2.DatabaseError) as error:
+            # Rollback changes if an error occurs
+            logging.error("Error inserting data into table %s: %s", table, error)
+            conn.rollback()
+            return 1
+        finally:
+            # Close the cursor
+            cursor.close()
+            logging.info("Cursor closed.")
         
+def copy_df(conn, df, table, upsert_key=None, chunk_rows=DEFAULT_COPY_CHUNK_ROWS):
+    """
+    Bulk loads a Pandas DataFrame into a PostgreSQL table with COPY ... FROM STDIN.
+
+    The DataFrame is serialized to CSV by chunks of `chunk_rows` rows in an in-memory buffer, without
+    creating a Python object per row, and all the chunks are loaded in a single transaction. Missing
+    values are written as \\N and loaded as NULL, empty strings stay empty strings.
+
+    With an upsert key, the rows are copied to a temporary staging table, then the rows of the table
+    with the same key are updated and the others inserted, under a lock preventing concurrent writers
+    from inserting the same keys. The keys are compared with IS NOT DISTINCT FROM, so a NULL matches a
+    NULL. Only the last row of each key of the DataFrame is kept.
+
+    Parameters:
+    - conn (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
+    - df (DataFrame): The DataFrame containing the data to be loaded.
+    - table (str): The name of the PostgreSQL table.
+    - upsert_key (list, optional): Columns identifying a row, e.g. PREDICTION_KEY, to update the existing rows. Default is None (insert only).
+    - chunk_rows (int, optional): Number of rows per COPY statement. Default is DEFAULT_COPY_CHUNK_ROWS.
+
+    Returns:
+    - int: Returns 1 if an error occurs, otherwise returns None.
+    """
+    columns = list(df.columns)
+    if upsert_key:
+        missing = [column for column in upsert_key if column not in columns]
+        if missing:
+            logging.error("Upsert key columns missing from the data: %s", missing)
+            raise ValueError(f"Upsert key columns missing from the data: {missing}")
+        df = df.drop_duplicates(subset=list(upsert_key), keep='last')
+
+    target = sql.Identifier(table)
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    destination = sql.Identifier(f"staging_{uuid.uuid4().hex}") if upsert_key else target
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')").format(destination, column_list)
+
+    with borrow_connection(conn) as conn:
+        cursor = conn.cursor()
+        try:
+            if upsert_key:
+                cursor.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+                    destination, target))
+
+            for start in range(0, len(df), chunk_rows):
+                buffer = io.StringIO()
+                # Unquoted empty fields would be loaded as NULL by the default of the CSV format
+                df.iloc[start:start + chunk_rows].to_csv(buffer, header=False, index=False, na_rep='\\N')
+                buffer.seek(0)
+                cursor.copy_expert(copy_query, buffer)
+
+            if upsert_key:
+                matches = sql.SQL(' AND ').join(
+                    sql.SQL("t.{0} IS NOT DISTINCT FROM s.{0}").format(sql.Identifier(column)) for column in upsert_key)
+                updated = [column for column in columns if column not in upsert_key]
+                cursor.execute(sql.SQL("LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE").format(target))
+                if updated:
+                    cursor.execute(sql.SQL("UPDATE {} AS t SET {} FROM {} AS s WHERE {}").format(
+                        target,
+                        sql.SQL(', ').join(sql.SQL("{0} = s.{0}").format(sql.Identifier(column)) for column in updated),
+                        destination, matches))
+                cursor.execute(sql.SQL(
+                    "INSERT INTO {} ({}) SELECT {} FROM {} AS s WHERE NOT EXISTS (SELECT 1 FROM {} AS t WHERE {})"
+                ).format(target, column_list, column_list, destination, target, matches))
+            conn.commit()
+            logging.info("%s rows copied into table %s.", len(df), table)
+        except (Exception, psycopg2.DatabaseError) as error:
+            # Rollback changes if an error occurs
+            logging.error("Error copying data into table %s: %s", table, error)
+            conn.rollback()
+            return 1
+        finally:
+            cursor.close()
+
 def update_data(connection, table_name, set_clause, where_clause=None):
     """
     Updates existing records in a table.
 
+    The changes of the predictions table, e.g. their feedback, are then folded into the performance
+    summary (see performance.refresh_performance).
+
     Parameters:
-    - connection (psycopg2 connection): The connection to the PostgreSQL database.
+    - connection (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
     - table_name (str): The name of the table to be updated.
     - set_clause (str): The SET clause specifying the columns to be updated.
     - where_clause (str, optional): The WHERE clause specifying the condition for updating rows. Default is None.
@@ -75,48 +430,174 @@ def update_data(connection, table_name, set_clause, where_clause=None):
     Returns:
     - None
     """
-    try:
-        cursor = connection.cursor()
-        update_query = sql.SQL("UPDATE {} SET {}").format(
-            sql.Identifier(table_name),
-            set_clause
-        )
-        if where_clause:
-            update_query += sql.SQL(" WHERE {}").format(where_clause)
-        cursor.execute(update_query)
-        connection.commit()
-        logging.info("Data updated in table %s.", table_name)
-    except psycopg2.Error as e:
-        connection.rollback()
-        logging.error("Error updating data in table %s: %s", table_name, e)
-    finally:
-        if cursor:
-            cursor.close()
-            logging.info("Cursor closed.")
+    with borrow_connection(connection) as connection:
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            update_query = sql.SQL("UPDATE {} SET {}").format(
+                sql.Identifier(table_name),
+                set_clause
+            )
+            if where_clause:
+                update_query += sql.SQL(" WHERE {}").format(where_clause)
+            cursor.execute(update_query)
+            connection.commit()
+            logging.info("Data updated in table %s.", table_name)
+        except psycopg2.Error as e:
+            connection.rollback()
+            logging.error("Error updating data in table %s: %s", table_name, e)
+            return
+        finally:
+            if cursor:
+                cursor.close()
+                logging.info("Cursor closed.")
+
+        if table_name == PREDICTIONS_TABLE:
+            # Imported here, the performance module is built on this one
+            from src.utils.performance import refresh_performance
+            try:
+                refresh_performance(connection)
+            except (psycopg2.Error, ValueError) as e:
+                # The changes stay queued, the next refresh folds them
+                logging.error("Error refreshing the performance summary: %s", e)
 
 def select_data(connection, table_name, columns="*", where_clause=None):
-    cursor = None  # Define cursor variable and initialize it to None
+    """
+    Selects records from a table.
+
+    Parameters:
+    - connection (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
+    - table_name (str): The name of the table.
+    - columns (list or str, optional): The columns to select. Default is "*".
+    - where_clause (str, optional): The WHERE clause specifying the condition for selecting rows. Default is None.
+
+    Returns:
+    - list: The selected rows, or None if an error occurs.
+    """
+    with borrow_connection(connection) as connection:
+        cursor = None  # Define cursor variable and initialize it to None
+        try:
+            cursor = connection.cursor()
+            # Initialize the query with SELECT statement
+            select_query = sql.SQL("SELECT {} FROM {}").format(
+                sql.SQL(', ').join(map(sql.Identifier, columns)) if columns != "*" else sql.SQL('*'),
+                sql.Identifier(table_name)
+            )
+            # If where_clause is provided, add WHERE clause to the query
+            if where_clause:
+                # Compose the WHERE clause as a SQL expression
+                where_expr = sql.SQL(where_clause)
+                select_query += sql.SQL(" WHERE {}").format(where_expr)
+            cursor.execute(select_query)
+            rows = cursor.fetchall()
+            return rows
+        except psycopg2.Error as e:
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+
+def table_version(connection, table_name):
+    """
+    Returns the write version of a table, incremented by a trigger on every write (see db_migrations).
+
+    Parameters:
+    - connection (psycopg2 connection): The connection to the PostgreSQL database.
+    - table_name (str): The name of the table.
+
+    Returns:
+    - int: The version of the table, or None if the writes to the table are not versioned.
+    """
+    cursor = connection.cursor()
     try:
-        cursor = connection.cursor()
-        # Initialize the query with SELECT statement
-        select_query = sql.SQL("SELECT {} FROM {}").format(
-            sql.SQL(', ').join(map(sql.Identifier, columns)) if columns != "*" else sql.SQL('*'),
-            sql.Identifier(table_name)
-        )
-        # If where_clause is provided, add WHERE clause to the query
-        if where_clause:
-            # Compose the WHERE clause as a SQL expression
-            where_expr = sql.SQL(where_clause)
-            select_query += sql.SQL(" WHERE {}").format(where_expr)
-        cursor.execute(select_query)
-        rows = cursor.fetchall()
-        return rows
-    except psycopg2.Error as e:
+        cursor.execute("SELECT version FROM data_versions WHERE table_name = %s", (table_name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except psycopg2.Error:
+        # The table is not versioned (migration not applied), end the failed transaction
+        connection.rollback()
         return None
     finally:
-        if cursor:
+        cursor.close()
+
+def select_predictions(connection, tickers=None, start_date=None, end_date=None, table_name=PREDICTIONS_TABLE,
+                       columns=PREDICTION_COLUMNS, use_cache=True):
+    """
+    Selects the predictions of a set of tickers over a date range in a single parameterized query.
+
+    The results are cached in the process until the version of the table changes, i.e. until rows are
+    written to it by any process (e.g. by save_prediction). The lookup is served by the (ticker, date)
+    index of the table.
+
+    Parameters:
+    - connection (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
+    - tickers (list, optional): The tickers of the predictions. Default is None (all tickers).
+    - start_date (str or date, optional): The first date of the predictions (inclusive). Default is None.
+    - end_date (str or date, optional): The last date of the predictions (inclusive). Default is None.
+    - table_name (str, optional): The name of the table. Default is PREDICTIONS_TABLE.
+    - columns (tuple, optional): The columns to select. Default is PREDICTION_COLUMNS.
+    - use_cache (bool, optional): Return the cached result of the same query if the table did not change. Default is True.
+
+    Returns:
+    - DataFrame: The predictions sorted by ticker and date, or None if an error occurs.
+    """
+    tickers = None if tickers is None else tuple(sorted(set(tickers)))
+    key = (table_name, tickers, str(start_date) if start_date else None, str(end_date) if end_date else None,
+           tuple(columns))
+
+    conditions, params = [], []
+    if tickers is not None:
+        conditions.append(sql.SQL("ticker = ANY(%s)"))
+        params.append(list(tickers))
+    if start_date:
+        conditions.append(sql.SQL("date >= %s"))
+        params.append(start_date)
+    if end_date:
+        conditions.append(sql.SQL("date <= %s"))
+        params.append(end_date)
+    query = sql.SQL("SELECT {} FROM {}").format(sql.SQL(', ').join(map(sql.Identifier, columns)),
+                                                sql.Identifier(table_name))
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY ticker, date")
+
+    with borrow_connection(connection) as connection:
+        version = table_version(connection, table_name) if use_cache else None
+        if version is not None:
+            with _prediction_cache_lock:
+                cached = _prediction_cache.get(key)
+                if cached is not None and cached[0] == version:
+                    _prediction_cache.move_to_end(key)
+                    return cached[1].copy()
+
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params)
+            result = pd.DataFrame(cursor.fetchall(), columns=list(columns))
+            # End the read transaction, the next lookups must see the new writes
+            connection.rollback()
+        except psycopg2.Error as e:
+            connection.rollback()
+            logging.error("Error selecting predictions from table %s: %s", table_name, e)
+            return None
+        finally:
             cursor.close()
 
+    if version is not None:
+        with _prediction_cache_lock:
+            _prediction_cache[key] = (version, result.copy())
+            _prediction_cache.move_to_end(key)
+            while len(_prediction_cache) > PREDICTION_CACHE_SIZE:
+                _prediction_cache.popitem(last=False)
+    return result
+
+def clear_prediction_cache():
+    """
+    Clears the results cached by select_predictions.
+    """
+    with _prediction_cache_lock:
+        _prediction_cache.clear()
+
 def close_connection(connection):
     """
     Closes the connection to the database.
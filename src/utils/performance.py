@@ -0,0 +1,260 @@
+"""
+Performance
+
+This module keeps the performance summary of the predictions displayed by the dashboard: the
+accuracy, precision and hit rate of each model and ticker over rolling windows of days, so a page
+view reads a few summary rows instead of scanning the whole predictions table.
+
+The summary is updated incrementally. A trigger of the predictions table (migration 4 of
+`db_migrations`) queues the (model_used, ticker, date) of every row whose prediction or feedback
+changes, e.g. when the feedback of a day is set by `db_utils.update_data`. A refresh recomputes the
+confusion counts of the queued days only, then the windows of the models and tickers of these days
+from their daily counts. The queued days are removed once the summary is written, and a refresh
+recomputes its days from the predictions, so a failed refresh is retried by the next one.
+
+Metrics (a prediction or feedback of 1 is an up move, 0 a down move):
+- accuracy: Share of the predictions whose direction was right.
+- precision: Share of the predicted up moves that happened.
+- hit_rate: Share of the up moves that were predicted.
+
+Predictions saved without a ticker or model are summarized under an empty ticker or model.
+
+Functions:
+- daily_outcomes: Confusion counts of the scored predictions per model, ticker and day.
+- rolling_performance: Metrics of each model and ticker over the rolling windows.
+- refresh_performance: Fold the queued changes of the predictions into the summary table.
+- select_performance: Read the summary table.
+
+Usage:
+    python performance.py --database_url <database_url>
+"""
+
+import sys
+import os
+import logging
+import argparse
+import psycopg2
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.db_utils import (borrow_connection, copy_df, select_predictions, PREDICTIONS_TABLE, OUTCOMES_TABLE,
+                                PERFORMANCE_TABLE)
+
+logger = logging.getLogger(__name__)
+
+# Rolling windows of the summary in days, ending at the last scored day, 0 for the whole history
+PERFORMANCE_WINDOWS = (7, 30, 90, 0)
+# Key of the advisory lock serializing the refreshes
+PERFORMANCE_LOCK = 4817204
+
+OUTCOME_KEY = ('model_used', 'ticker', 'date')
+PERFORMANCE_KEY = ('model_used', 'ticker', 'window_days')
+COUNTS = ['tp', 'fp', 'tn', 'fn']
+PERFORMANCE_COLUMNS = ['model_used', 'ticker', 'window_days', 'start_date', 'end_date', 'predictions',
+                       'accuracy', 'precision', 'hit_rate', 'updated_at']
+
+
+def _normalize_keys(df):
+    # Predictions without a ticker or model are summarized under an empty one
+    df = df.copy()
+    df['model_used'] = df['model_used'].fillna('').astype(str)
+    df['ticker'] = df['ticker'].fillna('').astype(str)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def daily_outcomes(predictions, days=None):
+    """
+    Count the true/false positives and negatives of the scored predictions per model, ticker and day.
+
+    Parameters:
+        predictions (pandas.DataFrame): The predictions, with `model_used`, `ticker`, `date`, `prediction`
+            and `feedback` columns. The rows without feedback are not scored.
+        days (pandas.DataFrame, optional): The (model_used, ticker, date) to count. The days without
+            scored predictions get zero counts, to reset the counts stored for them. Default is None
+            (the days of the predictions).
+
+    Returns:
+        pandas.DataFrame: The `tp`, `fp`, `tn` and `fn` counts of each (model_used, ticker, date).
+    """
+    predictions = _normalize_keys(predictions).dropna(subset=['prediction', 'feedback'])
+    predicted = predictions['prediction'].astype(float) == 1
+    actual = predictions['feedback'].astype(float) == 1
+    counts = pd.DataFrame({'tp': predicted & actual, 'fp': predicted & ~actual,
+                           'tn': ~predicted & ~actual, 'fn': ~predicted & actual}).astype(int)
+    counts = pd.concat([predictions[list(OUTCOME_KEY)], counts], axis=1).groupby(list(OUTCOME_KEY)).sum()
+
+    if days is not None:
+        index = pd.MultiIndex.from_frame(_normalize_keys(days)[list(OUTCOME_KEY)].drop_duplicates())
+        counts = counts.reindex(index, fill_value=0)
+    return counts.reset_index().astype({count: int for count in COUNTS})
+
+
+def rolling_performance(outcomes, windows=PERFORMANCE_WINDOWS, updated_at=None):
+    """
+    Compute the metrics of each model and ticker over rolling windows of days.
+
+    A window of N days ends at the last scored day of the model and ticker, and covers the days
+    after the last day minus N days. The metrics of a window without scored predictions are missing.
+
+    Parameters:
+        outcomes (pandas.DataFrame): The daily counts of the models and tickers, as returned by `daily_outcomes`.
+        windows (tuple): The lengths of the windows in days, 0 for the whole history.
+        updated_at (pandas.Timestamp, optional): The time of the refresh. Default is None (now).
+
+    Returns:
+        pandas.DataFrame: One row per model, ticker and window, with the PERFORMANCE_COLUMNS.
+    """
+    updated_at = pd.Timestamp.now().floor('s') if updated_at is None else updated_at
+    outcomes = outcomes.assign(date=pd.to_datetime(outcomes['date']), n=outcomes[COUNTS].sum(axis=1))
+    # Days without scored predictions do not move the windows
+    last_days = outcomes[outcomes['n'] > 0].groupby(['model_used', 'ticker'])['date'].max()
+    outcomes = outcomes.join(last_days.rename('last_day'), on=['model_used', 'ticker'])
+
+    summaries = []
+    for days in windows:
+        in_window = outcomes['n'] > 0
+        if days:
+            in_window &= outcomes['date'] > outcomes['last_day'] - pd.Timedelta(days=days)
+        window = outcomes[in_window].groupby(['model_used', 'ticker'])
+        summary = window[COUNTS + ['n']].sum().join(window['date'].agg(start_date='min', end_date='max'))
+        # Every model and ticker gets a row, with missing metrics if it has no scored predictions
+        pairs = outcomes[['model_used', 'ticker']].drop_duplicates()
+        summary = pairs.join(summary, on=['model_used', 'ticker']).fillna({count: 0 for count in COUNTS + ['n']})
+        summary['window_days'] = days
+        summaries.append(summary)
+
+    summary = pd.concat(summaries, ignore_index=True)
+    n = summary['n'].where(summary['n'] > 0)
+    summary['predictions'] = summary['n'].astype(int)
+    summary['accuracy'] = (summary['tp'] + summary['tn']) / n
+    summary['precision'] = summary['tp'] / (summary['tp'] + summary['fp']).where(lambda x: x > 0)
+    summary['hit_rate'] = summary['tp'] / (summary['tp'] + summary['fn']).where(lambda x: x > 0)
+    summary['start_date'] = summary['start_date'].dt.date
+    summary['end_date'] = summary['end_date'].dt.date
+    summary['updated_at'] = updated_at
+    return summary[PERFORMANCE_COLUMNS].sort_values(list(PERFORMANCE_KEY), ignore_index=True)
+
+
+def _select_outcomes(cursor, pairs):
+    # Daily counts of the models and tickers, read by ticker then filtered by model
+    cursor.execute(f"SELECT model_used, ticker, date, tp, fp, tn, fn FROM {OUTCOMES_TABLE} WHERE ticker = ANY(%s)",
+                   (sorted(pairs['ticker'].unique()),))
+    outcomes = pd.DataFrame(cursor.fetchall(), columns=list(OUTCOME_KEY) + COUNTS)
+    return outcomes.merge(pairs, on=['model_used', 'ticker'])
+
+
+def refresh_performance(connection, windows=PERFORMANCE_WINDOWS, table_name=PREDICTIONS_TABLE):
+    """
+    Fold the queued changes of the predictions into the daily counts and the performance summary.
+
+    Parameters:
+        connection (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
+        windows (tuple): The lengths of the windows in days, 0 for the whole history.
+        table_name (str): The name of the predictions table.
+
+    Returns:
+        int: The number of queued changes folded into the summary.
+    """
+    with borrow_connection(connection) as connection:
+        cursor = connection.cursor()
+        try:
+            # Held across the commits of the refresh, the other refreshes wait and find the queue emptied
+            cursor.execute("SELECT pg_advisory_lock(%s)", (PERFORMANCE_LOCK,))
+            cursor.execute("SELECT id, model_used, ticker, date FROM prediction_changes ORDER BY id")
+            changes = pd.DataFrame(cursor.fetchall(), columns=['id'] + list(OUTCOME_KEY))
+            connection.commit()
+            if changes.empty:
+                return 0
+
+            days = _normalize_keys(changes)
+            # Predictions without a ticker are only found without a ticker filter
+            tickers = None if (days['ticker'] == '').any() else sorted(days['ticker'].unique())
+            predictions = select_predictions(connection, tickers=tickers, start_date=days['date'].min().date(),
+                                             end_date=days['date'].max().date(), table_name=table_name,
+                                             use_cache=False)
+            if predictions is None:
+                logging.error("Error reading the changed predictions")
+                raise ValueError("Error reading the changed predictions")
+            outcomes = daily_outcomes(predictions, days=days)
+            if copy_df(connection, outcomes, OUTCOMES_TABLE, upsert_key=OUTCOME_KEY):
+                logging.error("Error writing the daily outcomes")
+                raise ValueError("Error writing the daily outcomes")
+
+            pairs = days[['model_used', 'ticker']].drop_duplicates()
+            summary = rolling_performance(_select_outcomes(cursor, pairs), windows)
+            if copy_df(connection, summary, PERFORMANCE_TABLE, upsert_key=PERFORMANCE_KEY):
+                logging.error("Error writing the performance summary")
+                raise ValueError("Error writing the performance summary")
+
+            # The changes queued during the refresh are kept for the next one
+            cursor.execute("DELETE FROM prediction_changes WHERE id <= %s", (int(changes['id'].max()),))
+            connection.commit()
+            logger.info(f"Refreshed the performance of {len(pairs)} models and tickers from {len(changes)} changes")
+            return len(changes)
+        except psycopg2.Error as e:
+            connection.rollback()
+            logging.error(f"Error refreshing the performance summary: {e}")
+            raise
+        finally:
+            try:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (PERFORMANCE_LOCK,))
+                connection.commit()
+            except psycopg2.Error:
+                connection.rollback()
+            cursor.close()
+
+
+def select_performance(connection, tickers=None, window_days=None):
+    """
+    Read the performance summary.
+
+    Parameters:
+        connection (psycopg2 connection or ConnectionPool): The connection to the PostgreSQL database, or the pool to borrow it from.
+        tickers (list, optional): The tickers to read. Default is None (all tickers).
+        window_days (list, optional): The windows to read, in days. Default is None (all windows).
+
+    Returns:
+        pandas.DataFrame: The PERFORMANCE_COLUMNS of the summary rows, or None if an error occurs.
+    """
+    conditions, params = [], []
+    if tickers is not None:
+        conditions.append("ticker = ANY(%s)")
+        params.append(list(tickers))
+    if window_days is not None:
+        conditions.append("window_days = ANY(%s)")
+        params.append([int(days) for days in window_days])
+    columns = ', '.join(f'"{column}"' for column in PERFORMANCE_COLUMNS)
+    query = f"SELECT {columns} FROM {PERFORMANCE_TABLE}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY model_used, ticker, window_days"
+
+    with borrow_connection(connection) as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params)
+            result = pd.DataFrame(cursor.fetchall(), columns=PERFORMANCE_COLUMNS)
+            connection.rollback()
+            return result
+        except psycopg2.Error as e:
+            connection.rollback()
+            logging.error(f"Error reading the performance summary: {e}")
+            return None
+        finally:
+            cursor.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fold the changed predictions into the performance summary")
+    parser.add_argument("--database_url", type=str, help="database url", default=os.environ.get("DB_URL"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    connection = psycopg2.connect(args.database_url)
+    try:
+        print("Folded changes:", refresh_performance(connection))
+    finally:
+        connection.close()
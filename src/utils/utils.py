@@ -2,43 +2,153 @@ import os
 import pandas as pd
 import wandb
 import logging
+from src.utils.artifacts import download_artifact
 
 logger = logging.getLogger(__name__)
 
+# Formats supported for the data artifacts exchanged between the pipeline steps
+DATA_FORMATS = ('csv', 'parquet')
+
+
+def to_columnar(df):
+    """
+    Convert a DataFrame to the typed layout used by the columnar artifact format.
+
+    The date column (if any) becomes a datetime index, leftover CSV index columns are dropped,
+    floats are stored as float32 and integers as int64.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame to convert.
+
+    Returns:
+        pd.DataFrame: The converted DataFrame.
+    """
+    df = df.drop(columns=[column for column in df.columns if str(column).startswith('Unnamed: ')])
+    date_columns = [column for column in df.columns if str(column).lower() == 'date']
+    if date_columns and not isinstance(df.index, pd.DatetimeIndex):
+        df = df.set_index(date_columns[0])
+        df.index = pd.to_datetime(df.index)
+
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if pd.api.types.is_float_dtype(dtype):
+            dtypes[column] = 'float32'
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = 'int64'
+    return df.astype(dtypes)
+
+
+def save_data(df, path, file_format='csv'):
+    """
+    Save a DataFrame in one of the artifact formats.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame to save.
+        path (str): Path of the file, its extension is replaced by the one of the format.
+        file_format (str): 'parquet' for the typed columnar format, or 'csv'.
+
+    Returns:
+        str: The path of the saved file.
+    """
+    if file_format not in DATA_FORMATS:
+        raise ValueError(f"Unsupported data format '{file_format}', expected one of {DATA_FORMATS}")
+
+    path = os.path.splitext(path)[0] + '.' + file_format
+    if file_format == 'parquet':
+        to_columnar(df).to_parquet(path, index=True)
+    else:
+        df.to_csv(path)
+    return path
+
+
+def load_data(path):
+    """
+    Load a DataFrame saved with `save_data`.
+
+    The datetime index of a columnar file is returned as a column, as it is when reading a CSV file.
+
+    Parameters:
+        path (str): Path of the file.
+
+    Returns:
+        pd.DataFrame: The loaded DataFrame.
+    """
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+        if isinstance(df.index, pd.DatetimeIndex):
+            df = df.reset_index()
+        return df
+    return pd.read_csv(path)
+
+
+def download_data_file(run, artifact_name, download_path):
+    """
+    Download the data file of a Weights & Biases artifact, without reading it.
+
+    Parameters:
+        run (wandb.sdk.wandb_run.Run): The W&B run object.
+        artifact_name (str): The name of the artifact containing the data.
+        download_path (str): The path to download the artifact when the artifact cache is disabled.
+
+    Returns:
+        str: The path of the file, the columnar file being preferred when both formats exist.
+    """
+    artifact = run.use_artifact(artifact_name)
+    print(artifact.name)
+    artifact_dir = download_artifact(artifact, download_path)
+    artifact_paths = [os.path.join(artifact_dir, artifact_name.split(':')[0] + '.' + file_format)
+                      for file_format in ('parquet', 'csv')]
+    return next((path for path in artifact_paths if os.path.isfile(path)), artifact_paths[-1])
 
 
 def read_data_from_wandb(run, artifact_name, download_path):
     """
     Read ingested data from Weights & Biases.
 
+    The artifact file is read in the columnar format when available, and as CSV otherwise.
+    Artifacts are downloaded through the local artifact cache, see `src.utils.artifacts`.
+
     Parameters:
         run (wandb.sdk.wandb_run.Run): The W&B run object.
         artifact_name (str): The name of the artifact containing the ingested data.
-        download_path (str): The path to download the artifact.
+        download_path (str): The path to download the artifact when the artifact cache is disabled.
 
     Returns:
         pd.DataFrame: The DataFrame containing the ingested data.
     """
     try:
         logger.info(f"Reading data from W&B artifact: {artifact_name}")
-        artifact = run.use_artifact(artifact_name)
-        file_name = artifact_name.split(':')[0] + '.csv'
-        artifact_path = os.path.join(download_path, file_name)
-        print(artifact.name)
-        # Check if file exists and delete it
-        if os.path.isfile(artifact_path):
-            os.remove(artifact_path)
-            logger.info(f"Deleted existing file: {artifact_path}")
-
-        artifact.download(root=download_path)
-        
-        df = pd.read_csv(artifact_path)
+        df = load_data(download_data_file(run, artifact_name, download_path))
         logger.info("Data read successfully")
         return df
     except Exception as e:
         logger.error(f"Error occurred while reading data from W&B: {str(e)}")
         raise ValueError(f"Failed to read data from W&B artifact: {str(e)}")
 
+def read_tickers_from_wandb(run, artifact_name, download_path):
+    """
+    Read the data of the tickers of a Weights & Biases artifact, one file per ticker named after it
+    (e.g. the output of the universe mode of the ingestion step).
+
+    Parameters:
+        run (wandb.sdk.wandb_run.Run): The W&B run object.
+        artifact_name (str): The name of the artifact containing the data of the tickers.
+        download_path (str): The path to download the artifact when the artifact cache is disabled.
+
+    Returns:
+        dict: The DataFrame of each ticker, the columnar file being preferred when both formats exist.
+    """
+    artifact_dir = download_artifact(run.use_artifact(artifact_name), download_path)
+    data = {}
+    for name in sorted(os.listdir(artifact_dir), key=lambda name: not name.endswith('.parquet')):
+        ticker, extension = os.path.splitext(name)
+        if extension in ('.csv', '.parquet') and ticker not in data:
+            data[ticker] = load_data(os.path.join(artifact_dir, name))
+    if not data:
+        logger.error(f"No data found in the artifact {artifact_name}")
+        raise ValueError(f"No data found in the artifact {artifact_name}")
+    return dict(sorted(data.items()))
+
 def upload_data_to_wandb(run , data_path , output_artifact, output_type, output_description , metadata=None ,file_flag = True):
     """
     Upload data to Weights & Biases.
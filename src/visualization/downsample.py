@@ -0,0 +1,164 @@
+"""
+Downsample
+
+This module reduces the points of a price series sent to a chart to about one per pixel of its
+width, keeping its visual shape, so the payload and render time of the chart do not grow with the
+history (decades of daily bars, or minute bars).
+
+The points of a visible window are selected by Largest-Triangle-Three-Buckets (LTTB). Since LTTB
+visits the points one bucket at a time, it is only run on a preselection of the window: the
+minimum and maximum of fixed-size buckets of the series, precomputed once per zoom level. The
+level used for a window is the coarsest one that still has `minmax_ratio` candidates per output
+point, and the selected points of a window are cached.
+
+Functions:
+- lttb: Indices of the points kept by Largest-Triangle-Three-Buckets.
+- minmax_indices: Indices of the minimum and maximum of each bucket of a series.
+
+Classes:
+- ChartDownsampler: Points of a series to draw for a visible window and chart width.
+"""
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Bucket sizes of the precomputed min/max levels, each one keeps 2 points per bucket
+DEFAULT_BUCKET_SIZES = (4, 32, 256, 2048)
+# Candidates of the min/max preselection per point selected by LTTB
+DEFAULT_MINMAX_RATIO = 4
+
+
+def lttb(x, y, threshold):
+    """
+    Select the points of a series that keep its shape with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept, and the inner points are split into `threshold - 2` buckets
+    of the same number of points. In each bucket, the point forming the largest triangle with the
+    point selected in the previous bucket and the average of the next bucket is kept.
+
+    Parameters:
+        x (array-like): Increasing abscissas of the points (e.g. timestamps as integers).
+        y (array-like): Values of the points.
+        threshold (int): Number of points to keep.
+
+    Returns:
+        np.ndarray: The sorted indices of the kept points, all of them if there are at most `threshold`.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Average of each bucket, and of the last point for the last bucket
+    sums_x, sums_y = np.add.reduceat(x[1:n - 1], edges[:-1] - 1), np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    next_x = np.append((sums_x / counts)[1:], x[-1])
+    next_y = np.append((sums_y / counts)[1:], y[-1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        area = np.abs((x[selected] - next_x[bucket]) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (next_y[bucket] - y[selected]))
+        selected = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        kept[bucket + 1] = selected
+    return kept
+
+
+def minmax_indices(y, bucket_size):
+    """
+    Select the minimum and maximum of each bucket of `bucket_size` consecutive points.
+
+    Parameters:
+        y (array-like): Values of the points.
+        bucket_size (int): Number of points of a bucket.
+
+    Returns:
+        np.ndarray: The sorted indices of the selected points, with the first and last points.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = -(-n // bucket_size)
+    low = np.full(buckets * bucket_size, np.inf)
+    high = np.full(buckets * bucket_size, -np.inf)
+    valid = ~np.isnan(y)
+    low[:n][valid] = y[valid]
+    high[:n][valid] = y[valid]
+    starts = np.arange(buckets) * bucket_size
+    indices = np.concatenate([[0, n - 1],
+                              starts + np.argmin(low.reshape(buckets, bucket_size), axis=1),
+                              starts + np.argmax(high.reshape(buckets, bucket_size), axis=1)])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def _to_int64(value):
+    # Bound of a window in the unit of the abscissas, nanoseconds for dates
+    if isinstance(value, (int, float, np.number)):
+        return value
+    return np.datetime64(value, 'ns').astype(np.int64)
+
+
+class ChartDownsampler:
+    """
+    Points of a series to draw for a visible window and chart width.
+
+    Attributes:
+        x (np.ndarray): Increasing abscissas of the series, as int64 (datetimes are converted to nanoseconds).
+        y (np.ndarray): Values of the series.
+        levels (list): Indices of the points of each zoom level, from the full series to the coarsest one.
+        minmax_ratio (int): Candidates of the preselection per selected point.
+    """
+
+    def __init__(self, x, y, bucket_sizes=DEFAULT_BUCKET_SIZES, minmax_ratio=DEFAULT_MINMAX_RATIO, cache_size=64):
+        self.x = np.asarray(x).astype(np.int64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.minmax_ratio = minmax_ratio
+        self.levels = [np.arange(len(self.y))]
+        for bucket_size in bucket_sizes:
+            if len(self.y) <= 2 * bucket_size:
+                break
+            self.levels.append(minmax_indices(self.y, bucket_size))
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def window_indices(self, start=None, end=None, width=800):
+        """
+        Select the points of the series to draw in a window, about one per pixel.
+
+        Parameters:
+            start, end (optional): Bounds of the visible window (inclusive), in the unit of `x`, e.g.
+                datetimes. The whole series if None.
+            width (int): Width of the chart in pixels, the number of points to select.
+
+        Returns:
+            np.ndarray: The sorted indices of the selected points in the series.
+        """
+        first = 0 if start is None else int(np.searchsorted(self.x, _to_int64(start), 'left'))
+        last = len(self.x) if end is None else int(np.searchsorted(self.x, _to_int64(end), 'right'))
+        key = (first, last, width)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        # Coarsest level with enough candidates in the window
+        candidates = np.arange(first, last)
+        for level in self.levels[1:]:
+            in_window = level[np.searchsorted(level, first):np.searchsorted(level, last)]
+            if len(in_window) < width * self.minmax_ratio:
+                break
+            # The bounds of the window are drawn even if they are not extremes of their bucket
+            candidates = np.unique(np.concatenate([[first], in_window, [last - 1]]))
+        indices = candidates[lttb(self.x[candidates], self.y[candidates], width)]
+
+        with self._lock:
+            self._cache[key] = indices
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return indices
@@ -0,0 +1,155 @@
+"""
+Market Data
+
+This module provides the daily bars displayed by the dashboard. The bars of a ticker are kept in
+memory and refreshed at most every `ttl` seconds, and a refresh only fetches the bars from the last
+cached day onwards (the last bar of the day may still change), instead of the whole history.
+
+The history is first read from the local price store of the pipeline (the `<ticker>.csv` files of
+the ingestion step) when it has the ticker, and only the newer bars are fetched from the price
+source. A `LocalPriceSource` over fixture files replaces Yahoo Finance in tests and offline runs.
+
+Classes:
+- MarketData: Cached, incrementally refreshed daily bars of several tickers.
+
+Functions:
+- default_market_data: Market data configured by the environment variables of the dashboard.
+"""
+
+import os
+import time
+import logging
+import threading
+import pandas as pd
+
+from src.data_ingestion.price_sources import YahooPriceSource, LocalPriceSource
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+# Local price store written by the ingestion step
+PRICE_STORE_DIR = os.path.join(ROOT_DIR, 'artifacts', 'data_ingestion')
+DEFAULT_TTL = 300
+DEFAULT_START_DATE = '2023-01-01'
+
+
+class MarketData:
+    """
+    Cached, incrementally refreshed daily bars of several tickers.
+
+    Attributes:
+        price_source (PriceSource): Source of the new bars.
+        store (PriceSource): Local price store read before the first fetch of a ticker, or None.
+        start_date (str): First date of the history of a ticker (YYYY-MM-DD).
+        ttl (float): Seconds during which the cached bars of a ticker are returned without a refresh.
+        fetches (int): Number of requests sent to the price source.
+        hits (int): Number of histories returned from the cache.
+    """
+
+    def __init__(self, price_source, store=None, start_date=DEFAULT_START_DATE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.price_source = price_source
+        self.store = store
+        self.start_date = start_date
+        self.ttl = ttl
+        self.fetches = 0
+        self.hits = 0
+        self._clock = clock
+        self._bars = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _ticker_lock(self, ticker):
+        with self._lock:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _fetch(self, source, ticker, start):
+        end = (pd.Timestamp.today().normalize() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        if source is self.price_source:
+            with self._lock:
+                self.fetches += 1
+        data = source.fetch(ticker, pd.Timestamp(start).strftime('%Y-%m-%d'), end)
+        if data is None or data.empty:
+            return pd.DataFrame()
+        if isinstance(data.columns, pd.MultiIndex):
+            # Recent yfinance versions return (price, ticker) columns, the store has the price columns only
+            data = data.droplevel(-1, axis=1)
+        data.index = pd.to_datetime(data.index)
+        return data.sort_index()
+
+    def history(self, ticker):
+        """
+        Return the daily bars of a ticker since `start_date`, refreshed if they are older than `ttl` seconds.
+
+        Parameters:
+            ticker (str): Ticker of the stock.
+
+        Returns:
+            pd.DataFrame: The OHLCV bars indexed by date. The cached frame is shared, it must not be modified.
+        """
+        # One refresh at a time per ticker, the other readers wait for its bars
+        with self._ticker_lock(ticker):
+            refreshed_at, bars = self._bars.get(ticker, (None, None))
+            if refreshed_at is not None and self._clock() - refreshed_at < self.ttl:
+                self.hits += 1
+                return bars
+            bars = self._refresh(ticker, bars)
+            self._bars[ticker] = (self._clock(), bars)
+            return bars
+
+    def _refresh(self, ticker, bars):
+        if bars is None and self.store is not None:
+            bars = self._fetch(self.store, ticker, self.start_date)
+            if bars.empty:
+                bars = None
+            else:
+                logger.info(f"Read {len(bars)} bars of {ticker} from the price store")
+
+        if bars is None:
+            new_bars = self._fetch(self.price_source, ticker, self.start_date)
+            logger.info(f"Fetched {len(new_bars)} bars of {ticker}")
+            return new_bars
+
+        # The last cached day is fetched again, its bar may have changed since it was cached
+        new_bars = self._fetch(self.price_source, ticker, bars.index[-1].normalize())
+        if new_bars.empty:
+            return bars
+        logger.info(f"Fetched {len(new_bars)} new bars of {ticker}")
+        return pd.concat([bars[bars.index < new_bars.index[0]], new_bars])
+
+    def latest(self, ticker):
+        """
+        Return the last daily bar of a ticker, named by its date.
+        """
+        bars = self.history(ticker)
+        if bars.empty:
+            logger.error(f"No data found for the ticker {ticker}")
+            raise ValueError(f"No data found for the ticker {ticker}")
+        return bars.iloc[-1]
+
+    def invalidate(self, ticker=None):
+        """
+        Refresh the bars of a ticker, or of all the tickers, on their next read.
+        """
+        with self._lock:
+            tickers = [ticker] if ticker else list(self._bars)
+            for name in tickers:
+                if name in self._bars:
+                    self._bars[name] = (None, self._bars[name][1])
+
+
+def default_market_data():
+    """
+    Return the market data configured by the environment variables of the dashboard:
+
+    - DASHBOARD_PRICE_SOURCE_DIR: Directory of `<ticker>.csv` files used instead of Yahoo Finance.
+    - DASHBOARD_PRICE_STORE_DIR: Local price store read first (default: artifacts/data_ingestion, if it exists).
+    - DASHBOARD_DATA_TTL: Seconds between two refreshes of a ticker (default: DEFAULT_TTL).
+
+    Returns:
+        MarketData: The market data of the dashboard.
+    """
+    source_dir = os.environ.get('DASHBOARD_PRICE_SOURCE_DIR')
+    store_dir = os.environ.get('DASHBOARD_PRICE_STORE_DIR', PRICE_STORE_DIR)
+    return MarketData(LocalPriceSource(source_dir) if source_dir else YahooPriceSource(),
+                      store=LocalPriceSource(store_dir) if store_dir and os.path.isdir(store_dir) else None,
+                      ttl=float(os.environ.get('DASHBOARD_DATA_TTL', DEFAULT_TTL)))
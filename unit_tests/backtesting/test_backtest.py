@@ -0,0 +1,58 @@
+import os
+import sys
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.backtesting.backtest import make_folds, run_backtest
+from src.feature_engineering.feature_store import FeatureStore
+
+
+def price_changes(df):
+    return df[['close', 'volume']].pct_change().to_numpy()
+
+
+def test_make_folds():
+    expanding = make_folds(100, n_folds=4, test_size=10)
+    assert expanding[0] == (0, 60, 60, 70)
+    assert expanding[-1] == (0, 90, 90, 100)
+
+    rolling = make_folds(100, n_folds=4, test_size=10, mode='rolling', train_size=50)
+    assert rolling[0] == (10, 60, 60, 70)
+    assert rolling[-1] == (40, 90, 90, 100)
+
+    with pytest.raises(ValueError):
+        make_folds(100, n_folds=4, test_size=10, mode='rolling', train_size=80)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_run_backtest(tmp_path, max_workers, make_ohlcv):
+    data = {'AAPL': make_ohlcv(300, 0), 'MSFT': make_ohlcv(250, 1)}
+    pipeline = Pipeline([('changes', FunctionTransformer(price_changes))])
+    store = FeatureStore(str(tmp_path), max_bytes=10 * 1024 ** 2)
+
+    report = run_backtest(data, pipeline, {'n_estimators': 5}, n_folds=5, test_size=20,
+                          max_workers=max_workers, feature_store=store)
+
+    assert len(report) == 10
+    assert set(report['ticker']) == {'AAPL', 'MSFT'}
+    assert report['accuracy'].between(0, 1).all()
+    assert (report['seconds'] >= 0).all()
+    # The features of each ticker are computed once for all its folds
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_run_backtest_small_store(tmp_path, make_ohlcv):
+    # Room for the matrix of a single ticker: the matrices of the tickers are pinned until their folds ran
+    data = {'AAPL': make_ohlcv(300, 0), 'MSFT': make_ohlcv(250, 1)}
+    pipeline = Pipeline([('changes', FunctionTransformer(price_changes))])
+    store = FeatureStore(str(tmp_path), max_bytes=6000)
+
+    report = run_backtest(data, pipeline, {'n_estimators': 5}, n_folds=5, test_size=20, feature_store=store)
+    assert len(report) == 10
+
+    # A fold whose training fails is not evaluated
+    with pytest.raises(ValueError):
+        run_backtest(data, pipeline, {'n_estimators': 5, 'objective': 'unknown'}, n_folds=5, test_size=20, feature_store=store)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def ohlcv(rows, seed=0, start='2020-01-01'):
+    # Daily bars of a random walk, on consecutive business days
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, rows))
+    return pd.DataFrame({'date': pd.bdate_range(start, periods=rows), 'close': close,
+                         'high': close + rng.uniform(0.1, 2, rows), 'low': close - rng.uniform(0.1, 2, rows),
+                         'volume': rng.integers(1000, 5000, rows)})
+
+
+def labelled(rows, seed=0):
+    # Four normal features and a binary label driven by the first one
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(rows, 4)))
+    df['label'] = (df[0] + rng.normal(0, 0.5, rows) > 0).astype(int)
+    return df
+
+
+@pytest.fixture(scope='session')
+def make_ohlcv():
+    """
+    Factory of synthetic OHLCV bars: make_ohlcv(rows, seed=0, start='2020-01-01').
+    """
+    return ohlcv
+
+
+@pytest.fixture(scope='session')
+def make_labelled():
+    """
+    Factory of synthetic training data with a `label` column: make_labelled(rows, seed=0).
+    """
+    return labelled
@@ -2,11 +2,14 @@ import sys
 import os
 from unittest.mock import patch
 import pytest
+import numpy as np
 import pandas as pd
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
-from src.data_cleaning.data_cleaning import clean_data
+from src.data_cleaning.data_cleaning import clean_data, clean_file
+from src.utils.utils import save_data, load_data
+from src.data_cleaning.cleaning_engine import clean_chunks, clean_frame, trading_sessions
 
 @pytest.fixture
 def sample_data():
@@ -61,3 +64,103 @@ def test_clean_data(sample_data):
     pd.testing.assert_frame_equal(cleaned_data, expected_output)
 
 
+
+def test_clean_data_time_interpolation():
+    # The missing values are interpolated in time, not by position
+    dates = pd.to_datetime(['2024-01-02', '2024-01-03', '2024-01-08'])
+    df = pd.DataFrame({'Date': dates, 'close': [1.0, None, 7.0]})
+    cleaned_data = clean_data(df)
+    assert cleaned_data['close'].tolist() == [1.0, 2.0, 7.0]
+    # The input is not modified
+    assert df['close'].isna().sum() == 1
+    assert 'Date' in df.columns
+
+def test_clean_data_panel():
+    # The values of a symbol are never interpolated from another symbol, in the order of the input
+    index = pd.MultiIndex.from_tuples([('B', pd.Timestamp('2024-01-03')), ('A', pd.Timestamp('2024-01-02')),
+                                       ('B', pd.Timestamp('2024-01-02')), ('A', pd.Timestamp('2024-01-03'))],
+                                      names=['symbol', 'date'])
+    df = pd.DataFrame({'close': [None, 1.0, 10.0, None]}, index=index)
+    cleaned_data = clean_data(df)
+    assert cleaned_data.index.equals(df.index)
+    assert cleaned_data['close'].tolist() == [10.0, 1.0, 10.0, 1.0]
+
+def test_clean_data_report():
+    dates = trading_sessions('XNYS', '2024-01-02', '2024-03-28')
+    close = np.full(len(dates), 100.0) * np.exp(np.linspace(0, 0.1, len(dates)) + 0.001 * (-1) ** np.arange(len(dates)))
+    close[40] *= 2
+    df = pd.DataFrame({'date': dates, 'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close,
+                       'volume': 100})
+    # 2024-02-16 is a session, 2024-02-19 (Presidents Day) is not
+    df = df[df['date'] != '2024-02-16']
+    df.loc[df.index[5], 'high'] = df['close'].iloc[5] * 0.5
+    _, report = clean_data(df, return_report=True)
+
+    assert report.loc[report['check'] == 'missing_session', 'date'].tolist() == [pd.Timestamp('2024-02-16')]
+    assert pd.Timestamp(dates[40]) in report.loc[report['check'] == 'outlier', 'date'].tolist()
+    ohlc = report[report['check'] == 'ohlc']
+    assert ohlc['date'].tolist() == [dates[5], dates[5]]
+    assert ohlc['detail'].tolist() == ['high_below_body', 'low_above_body']
+
+def test_clean_data_repair():
+    df = pd.DataFrame({'date': pd.bdate_range('2024-01-02', periods=3), 'open': [1.0, 2.0, 3.0],
+                       'high': [1.5, 1.0, 3.5], 'low': [0.5, -1.0, 2.5], 'close': [1.0, 2.0, 3.0],
+                       'volume': [10, -5, 30]})
+    cleaned_data = clean_data(df, calendar='B', repair=True)
+    # The negative low is interpolated, then the high and low are widened to the range of the bar
+    assert cleaned_data['low'].tolist() == [0.5, 1.0, 2.5]
+    assert cleaned_data['high'].tolist() == [1.5, 2.0, 3.5]
+    assert cleaned_data['volume'].tolist() == [10, 20, 30]
+    assert cleaned_data['volume'].dtype == df['volume'].dtype
+    # Bars without volume are repaired too
+    cleaned_data = clean_data(df.drop(columns=['volume']), calendar='B', repair=True)
+    assert cleaned_data['low'].tolist() == [0.5, 1.0, 2.5]
+    assert 'volume' not in cleaned_data
+
+def test_clean_data_chunks():
+    # Cleaning by chunks gives the same result as a single pass
+    rng = np.random.default_rng(0)
+    index = pd.MultiIndex.from_product([['A', 'B', 'C'], pd.bdate_range('2023-01-02', periods=60)],
+                                       names=['symbol', 'date'])
+    values = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (len(index), 4)), axis=0))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    df = pd.DataFrame(values, index=index, columns=['open', 'high', 'low', 'close'])
+    cleaned_data, report = clean_frame(df)
+    report = report.sort_values(['symbol', 'date'], kind='stable', ignore_index=True)
+    for chunk_rows in (1, 7, 50):
+        chunks = (df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows))
+        results = list(clean_chunks(chunks))
+        chunked_report = pd.concat([result[1] for result in results if len(result[1])], ignore_index=True)
+        pd.testing.assert_frame_equal(pd.concat([result[0] for result in results]), cleaned_data)
+        # The issues of a bar are in the same chunk, the order does not depend on the chunks
+        pd.testing.assert_frame_equal(chunked_report.sort_values(['symbol', 'date'], kind='stable', ignore_index=True),
+                                      report)
+
+def test_trading_sessions():
+    assert len(trading_sessions('XNYS', '2024-01-01', '2024-12-31')) == 252
+    assert pd.Timestamp('2024-07-04') not in trading_sessions('XNYS', '2024-07-01', '2024-07-05')
+    with pytest.raises(ValueError):
+        trading_sessions('XXXX', '2024-01-01', '2024-12-31')
+
+@pytest.mark.parametrize("file_format", ['csv', 'parquet'])
+def test_clean_file(tmp_path, file_format):
+    # Streaming a file by chunks gives the same file as cleaning it in memory
+    rng = np.random.default_rng(1)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 300)))
+    data = pd.DataFrame({'Date': pd.bdate_range('2023-01-02', periods=300), 'Open': close, 'High': close * 1.01,
+                         'Low': close * 0.99, 'Close': close, 'Adj Close': close,
+                         'Volume': rng.integers(100, 1000, 300)})
+    data.loc[rng.random(300) < 0.1, ['Open', 'Close']] = np.nan
+    input_path = save_data(data, str(tmp_path / 'raw.csv'), file_format)
+
+    cleaned_data, report = clean_data(load_data(input_path), return_report=True)
+    expected = load_data(save_data(cleaned_data, str(tmp_path / 'expected.csv'), file_format))
+    output_path, counts = clean_file(input_path, str(tmp_path / 'cleaned.csv'), chunk_rows=7, file_format=file_format)
+    pd.testing.assert_frame_equal(load_data(output_path), expected)
+    pd.testing.assert_series_equal(counts.sort_index(), report['check'].value_counts().sort_index(), check_names=False)
+
+def test_clean_file_unsorted(tmp_path):
+    data = pd.DataFrame({'Date': pd.to_datetime(['2024-01-03', '2024-01-02']), 'Close': [1.0, 2.0]})
+    input_path = save_data(data, str(tmp_path / 'raw.csv'))
+    with pytest.raises(ValueError):
+        clean_file(input_path, str(tmp_path / 'cleaned.csv'), chunk_rows=1)
@@ -9,7 +9,8 @@ import pandas as pd
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
-from src.data_ingestion.data_ingestion import  download_stock_data, parse_arguments
+from src.data_ingestion.data_ingestion import  download_stock_data, parse_arguments, read_universe, fetch_with_retry, download_universe, incremental_download, read_watermarks, read_last_timestamp
+from src.data_ingestion.price_sources import PriceSource, LocalPriceSource
 
 
 def test_download_stock_data():
@@ -26,3 +27,89 @@ def test_download_stock_data():
     
     os.remove(output_path) 
        
+
+
+@pytest.fixture
+def price_dir(tmp_path):
+    # Local fixture source standing in for Yahoo Finance
+    index = pd.date_range(start='2022-01-03', periods=10, freq='B', name='Date')
+    for stock_name in ['AAPL', 'MSFT']:
+        data = pd.DataFrame({'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': 1.5, 'Adj Close': 1.5, 'Volume': 100},
+                            index=index)
+        data.to_csv(tmp_path / (stock_name + '.csv'))
+    return tmp_path
+
+
+def test_read_universe(tmp_path):
+    universe_file = tmp_path / 'universe.txt'
+    universe_file.write_text('AAPL\n# comment\nMSFT, GOOG\n\nAAPL\n')
+
+    assert read_universe('AAPL, MSFT,,AAPL') == ['AAPL', 'MSFT']
+    assert read_universe(str(universe_file)) == ['AAPL', 'MSFT', 'GOOG']
+
+
+def test_download_universe(price_dir, tmp_path):
+    output_dir = tmp_path / 'output'
+    report = download_universe(['AAPL', 'MSFT', 'UNKNOWN'], '2022-01-01', '2022-01-10', str(output_dir),
+                               price_source=LocalPriceSource(str(price_dir)), max_workers=2, backoff=0)
+
+    report = report.set_index('stock_name')
+    assert report.loc['AAPL', 'status'] == 'ok'
+    assert report.loc['AAPL', 'rows'] == 5
+    assert report.loc['UNKNOWN', 'status'] == 'failed'
+    assert report.loc['UNKNOWN', 'attempts'] == 4
+    assert (report['seconds'] >= 0).all()
+    assert len(pd.read_csv(output_dir / 'MSFT.csv')) == 5
+    assert not (output_dir / 'UNKNOWN.csv').exists()
+
+
+def test_fetch_with_retry_recovers():
+    class FlakySource(PriceSource):
+        def __init__(self):
+            self.calls = 0
+
+        def fetch(self, stock_name, start_date, end_date):
+            self.calls += 1
+            if self.calls < 3:
+                raise ConnectionError("rate limited")
+            return pd.DataFrame({'Close': [1.0]})
+
+    data, attempts = fetch_with_retry(FlakySource(), 'AAPL', '2022-01-01', '2022-01-10', retries=3, backoff=0)
+    assert attempts == 3
+    assert len(data) == 1
+
+
+def test_incremental_download(price_dir, tmp_path):
+    source = LocalPriceSource(str(price_dir))
+    (tmp_path / 'store').mkdir()
+    output_path = str(tmp_path / 'store' / 'AAPL.csv')
+    watermark_path = str(tmp_path / 'store' / '_watermarks.json')
+
+    # First run stores the history, the next ones only the missing bars
+    assert incremental_download('AAPL', '2022-01-06', output_path, price_source=source, start_date='2022-01-01')[0] == 3
+    assert incremental_download('AAPL', '2022-01-11', output_path, price_source=source)[0] == 3
+    assert incremental_download('AAPL', '2022-01-11', output_path, price_source=source)[0] == 0
+    assert read_watermarks(watermark_path)['AAPL'] == '2022-01-10T00:00:00'
+
+    # A run that crashed before updating the watermark is merged without duplicates
+    os.remove(watermark_path)
+    assert incremental_download('AAPL', '2022-01-15', output_path, price_source=source)[0] == 4
+
+    data = pd.read_csv(output_path, index_col=0, parse_dates=True)
+    expected = pd.read_csv(price_dir / 'AAPL.csv', index_col=0, parse_dates=True)
+    pd.testing.assert_frame_equal(data, expected)
+    assert read_last_timestamp(output_path) == pd.Timestamp('2022-01-14')
+
+
+def test_incremental_download_up_to_date(price_dir, tmp_path):
+    source = LocalPriceSource(str(price_dir))
+    (tmp_path / 'store').mkdir()
+    output_path = str(tmp_path / 'store' / 'AAPL.csv')
+    watermark_path = str(tmp_path / 'store' / '_watermarks.json')
+    assert incremental_download('AAPL', '2022-01-08', output_path, price_source=source, start_date='2022-01-01')[0] == 5
+
+    # The store ends on Friday, no bar closed over the weekend: nothing to store, and no retry
+    stored = open(output_path).read()
+    assert incremental_download('AAPL', '2022-01-10', output_path, price_source=source, backoff=60) == (0, 1)
+    assert open(output_path).read() == stored
+    assert read_watermarks(watermark_path)['AAPL'] == '2022-01-07T00:00:00'
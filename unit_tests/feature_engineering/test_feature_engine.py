@@ -0,0 +1,52 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.feature_engineering.feature_engine import (compute_features, compute_panel_features, compute_tail_features,
+                                                    warmup_rows, FEATURE_NAMES)
+
+
+@pytest.fixture
+def panel():
+    # Symbols with different histories, rows shuffled
+    rng = np.random.default_rng(0)
+    frames = []
+    for symbol, rows in (('AAPL', 300), ('MSFT', 120), ('TSLA', 20), ('AMZN', 250)):
+        close = 100 + np.cumsum(rng.normal(0, 1, rows))
+        frames.append(pd.DataFrame({'symbol': symbol, 'date': pd.bdate_range('2020-01-01', periods=rows),
+                                    'close': close, 'high': close + 1, 'low': close - 1,
+                                    'volume': rng.integers(1000, 10000, rows)}))
+    return pd.concat(frames).sample(frac=1, random_state=0).set_index(['symbol', 'date'])
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_compute_panel_features(panel, max_workers):
+    features = compute_panel_features(panel, max_workers=max_workers)
+
+    assert list(features.columns) == FEATURE_NAMES
+    assert features.index.equals(panel.index)
+    # Each symbol has the features of its own history
+    for symbol, bars in panel.groupby(level='symbol'):
+        bars = bars.sort_index()
+        expected = compute_features(bars['close'], bars['high'], bars['low'], bars['volume'])
+        np.testing.assert_array_equal(features.loc[bars.index].to_numpy(), expected)
+
+
+def test_compute_panel_features_requires_symbol_level(panel):
+    with pytest.raises(ValueError):
+        compute_panel_features(panel.reset_index(level='symbol'))
+
+
+@pytest.mark.parametrize("rows", [1, 5, 2000])
+def test_compute_tail_features(rows):
+    rng = np.random.default_rng(1)
+    close = 100 + np.cumsum(rng.normal(0, 1, 2000))
+    high, low, volume = close + rng.uniform(0, 2, 2000), close - rng.uniform(0, 2, 2000), rng.integers(1000, 10000, 2000)
+
+    assert warmup_rows() < 1000
+    expected = compute_features(close, high, low, volume)[-rows:]
+    np.testing.assert_allclose(compute_tail_features(close, high, low, volume, rows), expected, rtol=1e-6)
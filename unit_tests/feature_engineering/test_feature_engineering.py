@@ -7,7 +7,8 @@ import logging
 import numpy as np
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, parent_dir)
-from src.feature_engineering.feature_engineering import RSIFeatureExtractor, ADLFeatureExtractor, OBVFeatureExtractor, MACDFeatureExtractor
+from src.feature_engineering.feature_engineering import RSIFeatureExtractor, ADLFeatureExtractor, OBVFeatureExtractor, MACDFeatureExtractor, FusedFeatureExtractor
+from sklearn.pipeline import FeatureUnion
 import pandas_ta as ta
 
 
@@ -86,4 +87,24 @@ def test_macd_feature_extractor(sample_data):
     assert 'macd_hist' in transformed_data.columns
     assert 'macd_signal' in transformed_data.columns
     
-    assert len(transformed_data) == len(sample_data) 
\ No newline at end of file
+    assert len(transformed_data) == len(sample_data) 
+
+
+def test_fused_feature_extractor(sample_data):
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, 2000))
+    long_data = pd.DataFrame({'close': close, 'high': close + rng.uniform(0.1, 2, 2000),
+                              'low': close - rng.uniform(0.1, 2, 2000),
+                              'volume': rng.integers(1000, 10000, 2000)})
+    feature_union = FeatureUnion([('rsi', RSIFeatureExtractor()), ('adl', ADLFeatureExtractor()),
+                                  ('obv', OBVFeatureExtractor()), ('macd', MACDFeatureExtractor())])
+
+    for data in (sample_data, long_data):
+        expected = feature_union.transform(data).astype(float)
+        transformed_data = FusedFeatureExtractor().transform(data)
+
+        # Same features as the FeatureUnion of the extractors, in float32
+        assert transformed_data.dtype == np.float32
+        assert transformed_data.shape == expected.shape
+        np.testing.assert_array_equal(np.isnan(transformed_data), np.isnan(expected))
+        np.testing.assert_allclose(transformed_data, expected.astype(np.float32), rtol=1e-6, atol=1e-4)
@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.feature_engineering import feature_store
+from src.feature_engineering.feature_store import FeatureStore
+
+
+def test_feature_store_reuses_features(tmp_path, make_ohlcv):
+    store = FeatureStore(str(tmp_path), max_bytes=10 * 1024 ** 2)
+    pipeline = Pipeline([('log', FunctionTransformer(np.log1p))])
+    df = make_ohlcv(100)[['close', 'volume']]
+
+    features = store.transform(df, pipeline)
+    np.testing.assert_allclose(features, np.log1p(df.to_numpy()))
+    assert len(os.listdir(tmp_path)) == 1
+
+    # Same data and pipeline: the stored matrix is memory-mapped
+    cached = store.transform(df.copy(), pipeline)
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, features)
+    assert len(os.listdir(tmp_path)) == 1
+
+    # Other data or another pipeline are new entries
+    store.transform(make_ohlcv(100, seed=1)[['close', 'volume']], pipeline)
+    store.transform(df, Pipeline([('sqrt', FunctionTransformer(np.sqrt))]))
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_feature_store_eviction(tmp_path, make_ohlcv):
+    # Room for a single matrix of 1000 x 2 floats
+    store = FeatureStore(str(tmp_path), max_bytes=20000)
+    pipeline = Pipeline([('log', FunctionTransformer(np.log1p))])
+
+    first = make_ohlcv(1000, seed=0)[['close', 'volume']]
+    store.transform(first, pipeline)
+    store.transform(make_ohlcv(1000, seed=1)[['close', 'volume']], pipeline)
+
+    assert os.listdir(tmp_path) == [store.key(make_ohlcv(1000, seed=1)[['close', 'volume']], pipeline) + '.npy']
+
+
+def test_feature_store_key_code(monkeypatch, make_ohlcv):
+    # The matrices of another version of the feature code are not served
+    df = make_ohlcv(100)[['close', 'volume']]
+    pipeline = Pipeline([('log', FunctionTransformer(np.log1p))])
+    key = FeatureStore.key(df, pipeline)
+    assert FeatureStore.key(df.copy(), pipeline) == key
+
+    monkeypatch.setattr(feature_store, 'code_hash', lambda *modules: 'changed')
+    feature_store.feature_code_hash.cache_clear()
+    try:
+        assert FeatureStore.key(df, pipeline) != key
+    finally:
+        feature_store.feature_code_hash.cache_clear()
@@ -0,0 +1,37 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.feature_engineering.feature_engine import compute_features
+from src.feature_engineering.streaming import IndicatorState
+
+
+def test_streaming_matches_batch(tmp_path, make_ohlcv):
+    df = make_ohlcv(500)
+    expected = compute_features(df['close'], df['high'], df['low'], df['volume'])
+
+    # Build the state from the history, snapshot it, then stream the remaining bars
+    state = IndicatorState.from_frame(df.iloc[:300])
+    state.save(tmp_path / 'state.json')
+    state = IndicatorState.load(tmp_path / 'state.json')
+    assert state.bars == 300
+    assert pd.Timestamp(state.last_date) == df['date'].iloc[299]
+
+    features = np.array([state.update(row.close, row.high, row.low, row.volume, row.date)
+                         for row in df.iloc[300:].itertuples()])
+    np.testing.assert_allclose(features, expected[300:], rtol=1e-5)
+
+
+def test_streaming_warm_up(make_ohlcv):
+    df = make_ohlcv(40)
+    expected = compute_features(df['close'], df['high'], df['low'], df['volume'])
+
+    state = IndicatorState()
+    features = np.array([state.update(row.close, row.high, row.low, row.volume) for row in df.itertuples()])
+
+    # Indicators are missing until they have enough bars, like in the batch transform
+    np.testing.assert_array_equal(np.isnan(features), np.isnan(expected))
+    np.testing.assert_allclose(features, expected, rtol=1e-5)
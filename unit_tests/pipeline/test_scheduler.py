@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import threading
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.pipeline.scheduler import StepSpec, StepCache, DagScheduler, content_hash, code_hash, critical_path
+
+SPECS = [StepSpec("ingestion", [], ["raw"], cacheable=False),
+         StepSpec("cleaning", ["raw"], ["cleaned"]),
+         StepSpec("features", [], ["pipeline"]),
+         StepSpec("training", ["cleaned", "pipeline"], ["model"], {"depth": 3})]
+
+
+def make_scheduler(data, ran, cache=None, delay=0.0):
+    lock = threading.Lock()
+
+    def run_step(name):
+        time.sleep(delay)
+        with lock:
+            ran.append(name)
+        if name == "ingestion":
+            data["raw"] = pd.DataFrame({'Close': [1.0, 2.0, 3.0]})
+        elif name == "cleaning":
+            data["cleaned"] = data["raw"] * 2
+        elif name == "features":
+            data["pipeline"] = "pipeline"
+        else:
+            data["model"] = len(data["cleaned"])
+
+    def input_hash(name):
+        return content_hash(data[name]) if name in data else None
+
+    def restore(values, hashes):
+        data.update(values)
+
+    def outputs(name):
+        spec = [spec for spec in SPECS if spec.name == name][0]
+        return ({output: data[output] for output in spec.outputs},
+                {output: content_hash(data[output]) for output in spec.outputs})
+
+    return DagScheduler(SPECS, run_step, max_workers=4, cache=cache, input_hash=input_hash,
+                        restore=restore, outputs=outputs)
+
+
+def test_independent_steps_run_in_parallel():
+    data, ran = {}, []
+    scheduler = make_scheduler(data, ran, delay=0.2)
+    records = scheduler.run(["ingestion", "cleaning", "features", "training"])
+
+    assert data["model"] == 3
+    # Features do not depend on the data steps and start with the ingestion
+    assert records["features"]["start"] < records["ingestion"]["end"]
+    assert records["training"]["start"] >= records["cleaning"]["end"]
+    assert ran.index("ingestion") < ran.index("cleaning") < ran.index("training")
+
+    path, seconds = critical_path(scheduler.specs, records)
+    assert path == ["ingestion", "cleaning", "training"]
+    assert seconds >= 0.6
+
+
+def test_unchanged_steps_are_skipped(tmp_path):
+    steps = ["ingestion", "cleaning", "features", "training"]
+    ran = []
+    make_scheduler({}, ran, StepCache(str(tmp_path))).run(steps)
+    assert sorted(ran) == sorted(steps)
+
+    # Same raw data: only the ingestion runs again and the outputs come from the cache
+    ran, data = [], {}
+    records = make_scheduler(data, ran, StepCache(str(tmp_path))).run(steps)
+    assert ran == ["ingestion"]
+    assert records["training"]["skipped"]
+    assert data["model"] == 3
+
+    # A parameter change invalidates the step
+    SPECS[3].params = {"depth": 4}
+    try:
+        ran = []
+        make_scheduler({}, ran, StepCache(str(tmp_path))).run(steps)
+        assert sorted(ran) == ["ingestion", "training"]
+    finally:
+        SPECS[3].params = {"depth": 3}
+
+
+def test_step_cache_concurrent_stores(tmp_path):
+    cache = StepCache(str(tmp_path))
+    threads = [threading.Thread(target=cache.store, args=(f"step{i}", str(i), {f"out{i}": i}, {f"out{i}": str(i)}))
+               for i in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # No entry is lost by the writes of the other threads
+    reloaded = StepCache(str(tmp_path))
+    assert all(reloaded.lookup(f"step{i}", str(i))['values'] == {f"out{i}": i} for i in range(32))
+
+
+def test_code_hash():
+    import src.pipeline
+    import src.pipeline.timing
+    assert code_hash(src.pipeline) == code_hash(src.pipeline)
+    assert code_hash(src.pipeline) != code_hash(src.pipeline.timing)
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.pipeline.timing import step_timer, timing_report
+
+
+def test_step_timer():
+    timings = {}
+    with pytest.raises(ValueError):
+        with step_timer(timings, 'data_cleaning'):
+            raise ValueError("step failed")
+    # Failed steps are timed too
+    assert timings['data_cleaning'] >= 0
+
+
+def test_timing_report():
+    report = timing_report({'data_cleaning': 1.0, 'training': 4.0},
+                           {'data_cleaning': 5.0, 'training': 10.0}).set_index('step')
+
+    assert report.loc['data_cleaning', 'speedup'] == 5.0
+    assert report.loc['total', 'seconds'] == 5.0
+    assert report.loc['total', 'speedup'] == 3.0
+
+    # Without a baseline the speedup is unknown
+    assert timing_report({'training': 4.0})['speedup'].isna().all()
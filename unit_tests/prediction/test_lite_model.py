@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+import pytest
+import xgboost as xgb
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.prediction.lite_model import load_lite_pipeline
+from src.training.export import export_pipeline, exportable
+from src.training.train import train_pipeline
+from src.feature_engineering.feature_engineering import build_feature_pipeline
+
+
+@pytest.fixture(scope='module')
+def pipeline(make_ohlcv):
+    full_pipeline, _, _ = train_pipeline(make_ohlcv(1500, 0), build_feature_pipeline(), 0.8,
+                                         {'n_estimators': 200, 'learning_rate': 0.3}, early_stopping_rounds=5)
+    return full_pipeline
+
+
+@pytest.mark.parametrize('model_format', ['ubj', 'json'])
+def test_export_pipeline(pipeline, model_format, tmp_path, make_ohlcv):
+    export_pipeline(pipeline, str(tmp_path), model_format=model_format)
+    lite = load_lite_pipeline(str(tmp_path))
+    df = make_ohlcv(800, 1)
+
+    assert os.path.isfile(os.path.join(tmp_path, f"model.{model_format}"))
+    assert lite.manifest['model']['best_iteration'] == pipeline.steps[-1][1].best_iteration
+    # Same predictions as the scikit-learn pipeline, for all the rows and for the last ones
+    np.testing.assert_array_equal(lite.predict(df), pipeline.predict(df))
+    np.testing.assert_array_equal(lite.predict_latest(df, rows=3), pipeline.predict(df)[-3:])
+
+
+def test_export_unsupported_pipeline(tmp_path, make_ohlcv):
+    df = make_ohlcv(100, 0)
+    features = FunctionTransformer(lambda X: X[['close', 'volume']].to_numpy())
+    model = xgb.XGBClassifier(n_estimators=2).fit(features.transform(df), (df['close'].diff() > 0).astype(int))
+    pipeline = Pipeline([('features', features), ('model', model)])
+
+    assert not exportable(pipeline)
+    with pytest.raises(ValueError):
+        export_pipeline(pipeline, str(tmp_path))
+    with pytest.raises(ValueError):
+        load_lite_pipeline(str(tmp_path))
+
+
+def test_load_without_mlflow(pipeline, tmp_path):
+    export_pipeline(pipeline, str(tmp_path))
+    with open(os.path.join(tmp_path, 'manifest.json')) as fp:
+        assert json.load(fp)['features']['inputs'] == ['close', 'high', 'low', 'volume']
+
+    code = ("import sys; from src.prediction.lite_model import load_lite_pipeline; "
+            f"load_lite_pipeline({str(tmp_path)!r}); "
+            "print(sorted(m for m in ('mlflow', 'wandb', 'pandas_ta') if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=parent_dir, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
@@ -0,0 +1,71 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import xgboost as xgb
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.prediction.predict import (PredictionBatcher, predict_data, predict_latest, predict_incremental,
+                                    indicator_state_path)
+from src.feature_engineering.feature_engineering import build_feature_pipeline
+from src.feature_engineering.streaming import IndicatorState
+
+
+def price_changes(df):
+    return df[['close', 'volume']].pct_change().fillna(0).to_numpy()
+
+
+def make_pipeline(df):
+    features = FunctionTransformer(price_changes)
+    model = xgb.XGBClassifier(n_estimators=10).fit(features.transform(df), (df['close'].diff().shift(-1) > 0).astype(int))
+    return Pipeline([('features', features), ('model', model)])
+
+
+def test_prediction_batcher(make_ohlcv):
+    pipelines = [make_pipeline(make_ohlcv(300, 0)), make_pipeline(make_ohlcv(300, 1))]
+    requests = [(pipelines[ticker % 2], make_ohlcv(100, ticker)) for ticker in range(64)]
+    batcher = PredictionBatcher(max_batch_size=16, max_wait=0.05)
+    try:
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            predictions = list(pool.map(lambda request: batcher.predict(*request), requests))
+    finally:
+        batcher.close()
+
+    # Same predictions as one pipeline call per request, with fewer model calls
+    assert predictions == [int(pipeline.predict(df)[-1]) for pipeline, df in requests]
+    assert batcher.requests == 64
+    assert batcher.batches < 64
+
+
+def test_predict_latest(make_ohlcv):
+    df = make_ohlcv(3000, 2, start='2010-01-01')
+    features = build_feature_pipeline()
+    model = xgb.XGBClassifier(n_estimators=20).fit(features.transform(df), (df['close'].diff().shift(-1) > 0).astype(int))
+    pipeline = Pipeline([('feature_engineering', features), ('model', model)])
+
+    expected = predict_data(df, pipeline).iloc[-10:]
+    pd.testing.assert_frame_equal(predict_latest(df, pipeline, rows=10), expected)
+
+
+def test_predict_incremental(make_ohlcv):
+    df = make_ohlcv(400, 3, start='2010-01-01')
+    features = build_feature_pipeline()
+    model = xgb.XGBClassifier(n_estimators=20).fit(features.transform(df), (df['close'].diff().shift(-1) > 0).astype(int))
+    pipeline = Pipeline([('feature_engineering', features), ('model', model)])
+
+    # The bars after the state are predicted from it
+    predictions, state = predict_incremental(df, pipeline, IndicatorState.from_frame(df.iloc[:390]))
+    assert predictions['date'].tolist() == df['date'].iloc[390:].tolist()
+    assert pd.Timestamp(state.last_date) == df['date'].iloc[-1]
+
+    # The state of another series is reset, all the bars are predicted
+    other = IndicatorState.from_frame(df.assign(date=pd.bdate_range('2000-01-03', periods=400)).iloc[:390])
+    predictions, state = predict_incremental(df, pipeline, other)
+    assert len(predictions) == 400
+    assert state.bars == 400
+
+    assert indicator_state_path('states', 'AAPL', 'test:latest') == os.path.join('states', 'indicator_state_AAPL_test.json')
+    assert indicator_state_path('states', 'MSFT', 'test:v3') != indicator_state_path('states', 'AAPL', 'test:v3')
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import threading
+from urllib.request import Request, urlopen
+import numpy as np
+import pandas as pd
+import pytest
+import mlflow
+import xgboost as xgb
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.prediction.server import ModelWatcher, PredictionService, make_server
+from src.prediction.client import request_prediction
+from src.data_ingestion.price_sources import LocalPriceSource
+from src.training.model_registry import ModelRegistry
+from src.utils.artifacts import LocalArtifactStore, OfflineRun
+
+
+def price_changes(df):
+    return df[['close', 'volume']].pct_change().fillna(0).to_numpy()
+
+
+def make_bars(rows, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, rows))
+    end = pd.Timestamp.today().normalize()
+    return pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close, 'Adj Close': close,
+                         'Volume': rng.integers(1000, 5000, rows)},
+                        index=pd.bdate_range(end=end, periods=rows, name='Date'))
+
+
+def make_pipeline(n_estimators):
+    bars = make_bars(200, 0)
+    bars.columns = bars.columns.str.lower().str.replace(' ', '_')
+    features = FunctionTransformer(price_changes)
+    model = xgb.XGBClassifier(n_estimators=n_estimators).fit(features.transform(bars), np.arange(200) % 2)
+    return Pipeline([('features', features), ('model', model)])
+
+
+def log_model(store, tmp_path, pipeline, name):
+    model_dir = os.path.join(tmp_path, name)
+    mlflow.sklearn.save_model(pipeline, model_dir, pip_requirements=[])
+    files = {os.path.relpath(os.path.join(root, file), model_dir): os.path.join(root, file)
+             for root, _, names in os.walk(model_dir) for file in names}
+    store.log('trained_model', files, 'trained_model')
+    store.add_alias('trained_model:latest', 'production')
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    monkeypatch.setenv('ARTIFACT_CACHE_MAX_MB', '0')
+    store = LocalArtifactStore(str(tmp_path / 'store'))
+    log_model(store, str(tmp_path), make_pipeline(3), 'v0')
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    registry.register('MSFT', make_pipeline(4))
+    watcher = ModelWatcher(OfflineRun(store), 'trained_model:production', registry,
+                           download_path=str(tmp_path / 'download'))
+    watcher.store = store
+    return watcher
+
+
+def test_model_watcher_reloads_new_versions(watcher, tmp_path):
+    assert sorted(watcher.refresh()) == ['MSFT', 'production']
+    assert watcher.refresh() == []
+    assert watcher.get('AAPL')[:2] == ('production', watcher.store.get('trained_model:v0').digest)
+    assert watcher.get('MSFT')[:2] == ('MSFT', 1)
+
+    log_model(watcher.store, str(tmp_path), make_pipeline(5), 'v1')
+    watcher.registry.register('MSFT', make_pipeline(6))
+    assert sorted(watcher.refresh()) == ['MSFT', 'production']
+    assert watcher.get('AAPL')[1] == watcher.store.get('trained_model:v1').digest
+    assert watcher.get('MSFT')[1] == 2
+
+
+def test_prediction_server(watcher, tmp_path):
+    watcher.refresh()
+    prices_dir = tmp_path / 'prices'
+    prices_dir.mkdir()
+    prices = make_bars(300, 1)
+    prices.to_csv(prices_dir / 'AAPL.csv')
+    service = PredictionService(watcher, LocalPriceSource(str(prices_dir)), bars_ttl=60)
+    server = make_server(service, '127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        prediction = request_prediction(url, 'AAPL')
+        assert prediction['model'] == 'production'
+        assert prediction['prediction'] in (0, 1)
+        assert prediction['date'] == str(prices.index[-1].date())
+
+        # Bars posted by the client, predicted by the model of the ticker
+        bars = make_bars(50, 2).reset_index()
+        bars['Date'] = bars['Date'].astype(str)
+        request = Request(f"{url}/predict", data=json.dumps({'ticker': 'MSFT', 'bars': bars.to_dict('records')}).encode(),
+                          method='POST')
+        with urlopen(request) as response:
+            assert json.loads(response.read())['model'] == 'MSFT'
+
+        with urlopen(f"{url}/metrics") as response:
+            metrics = json.loads(response.read())
+        assert metrics['total']['count'] == 2
+        assert metrics['predict']['p99_ms'] >= metrics['predict']['p50_ms']
+
+        with pytest.raises(Exception) as error:
+            request_prediction(url, 'TSLA')
+        assert error.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
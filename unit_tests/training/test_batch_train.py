@@ -0,0 +1,45 @@
+import os
+import sys
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.training.batch_train import batch_train, memory_aware_workers
+from src.training.model_registry import ModelRegistry
+
+
+def price_changes(df):
+    return df[['close', 'volume']].pct_change().to_numpy()
+
+
+def test_memory_aware_workers():
+    assert memory_aware_workers(4, task_bytes=0, available_bytes=1) == 1
+    assert memory_aware_workers(1, task_bytes=0, available_bytes=10 ** 12) == 1
+    assert memory_aware_workers(64, task_bytes=0, available_bytes=10 ** 15) == os.cpu_count()
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_batch_train(tmp_path, max_workers, make_ohlcv):
+    data = {'AAPL': make_ohlcv(200, 0), 'MSFT': make_ohlcv(150, 1), 'EMPTY': make_ohlcv(0, 2)}
+    pipeline = Pipeline([('changes', FunctionTransformer(price_changes))])
+
+    summary = batch_train(data, pipeline, 0.8, {'n_estimators': 5}, registry_dir=str(tmp_path),
+                          max_workers=max_workers)
+    summary = summary.set_index('ticker')
+
+    assert list(summary.index) == ['AAPL', 'EMPTY', 'MSFT']
+    assert summary.loc['EMPTY', 'status'] == 'failed'
+    assert (summary.loc[['AAPL', 'MSFT'], 'status'] == 'ok').all()
+    assert summary.loc[['AAPL', 'MSFT'], 'accuracy'].between(0, 1).all()
+
+    # A second batch registers new versions
+    batch_train(data, pipeline, 0.8, {'n_estimators': 5}, registry_dir=str(tmp_path))
+    registry = ModelRegistry(str(tmp_path))
+    assert registry.tickers() == ['AAPL', 'MSFT']
+    assert registry.versions('AAPL') == [1, 2]
+    assert registry.metadata('MSFT')['n_estimators'] == 5
+    assert registry.load('AAPL').predict(data['AAPL']).shape == (200,)
+    with pytest.raises(ValueError):
+        registry.path('AAPL', version=3)
@@ -0,0 +1,48 @@
+import os
+import sys
+import pytest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.training.hyperparameter_search import sample_configs, search_hyperparameters
+
+
+def test_sample_configs():
+    configs = sample_configs({'max_depth': [3, 5], 'learning_rate': [0.01, 0.3]}, n_trials=50, seed=0)
+
+    assert len(configs) == 50
+    assert all(isinstance(config['max_depth'], int) and 3 <= config['max_depth'] <= 5 for config in configs)
+    assert all(0.01 <= config['learning_rate'] <= 0.3 for config in configs)
+    assert configs == sample_configs({'max_depth': [3, 5], 'learning_rate': [0.01, 0.3]}, n_trials=50, seed=0)
+
+    with pytest.raises(ValueError):
+        sample_configs({'max_depth': [5, 3]}, n_trials=1)
+
+
+@pytest.mark.parametrize("method", ["random", "halving"])
+def test_search_hyperparameters(method, make_labelled):
+    xgboost_config = {'n_estimators': 30, 'objective': 'binary:logistic', 'n_jobs': -1}
+
+    best, trials = search_hyperparameters(make_labelled(500, 0), make_labelled(200, 1), 'label', xgboost_config,
+                                          method=method, n_trials=6, max_workers=2, early_stopping_rounds=5,
+                                          min_rounds=5, seed=0)
+
+    assert len(trials) == 6
+    assert trials['validation_logloss'].is_monotonic_increasing
+    assert (trials['rounds'] <= 30).all()
+    # The best configuration keeps the base parameters and its best number of rounds
+    assert best['objective'] == 'binary:logistic'
+    assert best['n_estimators'] == trials['best_iteration'].iloc[0] + 1
+    assert best['max_depth'] == trials['max_depth'].iloc[0]
+    if method == 'halving':
+        # Only the best trials of the first rung are trained further
+        assert (trials['rounds'] <= 5).sum() >= 4
+
+
+def test_search_hyperparameters_few_rounds(make_labelled):
+    # Fewer rounds than the first rung of the halving: all the trials are trained in a single rung
+    best, trials = search_hyperparameters(make_labelled(200, 0), make_labelled(100, 1), 'label', {'n_estimators': 3},
+                                          method='halving', n_trials=4, min_rounds=10, seed=0)
+    assert len(trials) == 4
+    assert (trials['rounds'] <= 3).all()
+    assert best['n_estimators'] <= 3
@@ -0,0 +1,35 @@
+import os
+import sys
+import numpy as np
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.training.train import to_float32_matrix, train_xgboost
+
+
+def test_to_float32_matrix(make_labelled):
+    df = make_labelled(10, 0)
+    matrix = to_float32_matrix(df, [0, 1, 2, 3])
+
+    assert matrix.dtype == np.float32
+    assert matrix.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(matrix, df[[0, 1, 2, 3]].to_numpy(dtype=np.float32))
+
+
+def test_train_xgboost_early_stopping(make_labelled):
+    train_df, val_df = make_labelled(500, 0), make_labelled(200, 1)
+
+    model = train_xgboost(train_df, 'label', {'n_estimators': 500, 'learning_rate': 0.3}, val_df=val_df,
+                          early_stopping_rounds=5)
+
+    assert model.get_xgb_params()['tree_method'] == 'hist'
+    assert model.best_iteration < 499
+    assert model.get_booster().num_boosted_rounds() == model.best_iteration + 6
+    # The model predicts DataFrames with the columns of the training data
+    assert model.predict(val_df.drop(columns=['label'])).shape == (200,)
+
+
+def test_train_xgboost_without_validation(make_labelled):
+    model = train_xgboost(make_labelled(100, 0), 'label', {'n_estimators': 10})
+
+    assert model.get_booster().num_boosted_rounds() == 10
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import multiprocessing
+import pytest
+import wandb
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.utils.artifacts import ArtifactCache, LocalArtifactStore, OfflineRun
+
+
+class FakeArtifact:
+    # Counts the downloads of a W&B artifact
+    def __init__(self, name, digest, size):
+        self.name = name
+        self.digest = digest
+        self.size = size
+        self.downloads = 0
+
+    def download(self, root):
+        self.downloads += 1
+        with open(os.path.join(root, 'data.csv'), 'w') as fp:
+            fp.write('x' * self.size)
+        return root
+
+
+def test_artifact_cache_hit(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=1000)
+    artifact = FakeArtifact('test:v0', 'digest0', 10)
+
+    path = cache.download(artifact)
+    assert cache.download(artifact) == path
+    assert artifact.downloads == 1
+    assert os.path.isfile(os.path.join(path, 'data.csv'))
+
+
+def test_artifact_cache_lru_eviction(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=250)
+    first, second, third = [FakeArtifact(f'test:v{i}', f'digest{i}', 100) for i in range(3)]
+
+    cache.download(first)
+    cache.download(second)
+    cache.download(first)  # second is now the least recently used
+    cache.download(third)
+
+    assert cache.get(first) is not None
+    assert cache.get(second) is None
+    assert cache.get(third) is not None
+
+
+def download_artifacts(root, first):
+    # Process of a step sharing the cache
+    cache = ArtifactCache(root, max_bytes=10 ** 6)
+    for i in range(first, first + 20):
+        cache.download(FakeArtifact(f'test:v{i}', f'digest{i}', 10))
+
+
+def test_artifact_cache_shared_by_processes(tmp_path):
+    processes = [multiprocessing.Process(target=download_artifacts, args=(str(tmp_path), first))
+                 for first in range(0, 80, 20)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # No process loses the index entries of the others
+    with open(tmp_path / 'index.json') as fp:
+        assert len(json.load(fp)) == 80
+
+
+def test_offline_run(tmp_path):
+    data_path = tmp_path / 'cleaned_data.csv'
+    data_path.write_text('date,close\n2024-01-01,1.0\n')
+    run = OfflineRun(LocalArtifactStore(str(tmp_path / 'store')))
+
+    for _ in range(2):
+        artifact = wandb.Artifact('cleaned_data', type='cleaned_data', description='Stock data cleaned')
+        artifact.add_file(str(data_path))
+        run.log_artifact(artifact)
+
+    # Unchanged files do not create a new version
+    artifact = run.use_artifact('cleaned_data:latest')
+    assert artifact.name == 'cleaned_data:v0'
+    download_path = artifact.download(root=str(tmp_path / 'download'))
+    assert (tmp_path / 'download' / 'cleaned_data.csv').read_text() == data_path.read_text()
+    assert download_path == str(tmp_path / 'download')
+
+    run.store.add_alias('cleaned_data:v0', 'production')
+    assert run.use_artifact('cleaned_data:production').digest == artifact.digest
+    with pytest.raises(ValueError):
+        run.use_artifact('cleaned_data:v1')
@@ -0,0 +1,62 @@
+import os
+import sys
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.db_migrations import MIGRATIONS, migrate
+
+
+class MigrationCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.statements.append(query)
+        self.row = None
+        if query.startswith("SELECT 1 FROM schema_migrations"):
+            self.row = (1,) if params[0] in self.connection.applied else None
+        elif query.startswith("INSERT INTO schema_migrations"):
+            self.connection.pending.append(params[0])
+
+    def fetchone(self):
+        return self.row
+
+
+class MigrationConnection:
+    def __init__(self):
+        self.statements, self.applied, self.pending = [], set(), []
+
+    def cursor(self):
+        return MigrationCursor(self)
+
+    def commit(self):
+        self.applied.update(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+def test_migrate():
+    connection = MigrationConnection()
+    assert migrate(connection) == [version for version, _, _ in MIGRATIONS] == [1, 2, 3, 4]
+    assert any("CREATE UNIQUE INDEX IF NOT EXISTS stocks_predictions_ticker_date_model_idx" in statement
+               for statement in connection.statements)
+    # The duplicated predictions are removed before the unique index is created
+    statements = [statement.split()[0] + ' ' + statement.split()[1] for statement in connection.statements]
+    assert statements.index("DELETE FROM") < statements.index("CREATE UNIQUE")
+    # Each migration runs under the advisory lock
+    assert sum(statement.startswith("SELECT pg_advisory_xact_lock") for statement in connection.statements) == 4
+
+    # The applied migrations are skipped
+    connection.statements = []
+    assert migrate(connection) == []
+    assert not any("ALTER TABLE" in statement for statement in connection.statements)
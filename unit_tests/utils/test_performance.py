@@ -0,0 +1,133 @@
+import io
+import os
+import sys
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import psycopg2
+from psycopg2 import sql
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+
+from src.utils.db_utils import update_data
+from src.utils.performance import (PERFORMANCE_COLUMNS, daily_outcomes, refresh_performance, rolling_performance,
+                                   select_performance)
+from test_db_utils import FakeConnection
+
+
+def make_predictions():
+    dates = pd.date_range('2024-01-01', periods=10)
+    return pd.DataFrame({
+        'date': list(dates) * 2,
+        'ticker': ['AAPL'] * 10 + [None] * 10,
+        'model_used': ['trained_model:v1'] * 20,
+        'prediction': [1, 1, 0, 0, 1, 1, 0, 1, 1, 0] * 2,
+        'feedback': [1, 0, 0, 1, 1, 1, 0, 0, 1, None] * 2,
+    })
+
+
+def test_daily_outcomes():
+    predictions = make_predictions()
+    days = pd.DataFrame({'model_used': ['trained_model:v1'] * 2, 'ticker': ['AAPL', 'MSFT'],
+                         'date': ['2024-01-02', '2024-01-02']})
+    outcomes = daily_outcomes(predictions, days=days)
+
+    # The changed days are counted, with zero counts for the days without scored predictions
+    assert outcomes[['ticker', 'tp', 'fp', 'tn', 'fn']].values.tolist() == [['AAPL', 0, 1, 0, 0], ['MSFT', 0, 0, 0, 0]]
+    all_days = daily_outcomes(predictions)
+    # Unscored predictions are not counted, predictions without a ticker are counted under an empty one
+    assert len(all_days) == 18
+    assert set(all_days['ticker']) == {'AAPL', ''}
+    assert all_days[['tp', 'fp', 'tn', 'fn']].sum().tolist() == [8, 4, 4, 2]
+    # The input is not modified
+    assert predictions['ticker'].isna().sum() == 10
+
+
+def test_rolling_performance():
+    predictions = make_predictions()
+    outcomes = daily_outcomes(predictions[predictions['ticker'] == 'AAPL'])
+    updated_at = pd.Timestamp('2024-02-01')
+    summary = rolling_performance(outcomes, windows=(3, 0), updated_at=updated_at)
+
+    assert summary.columns.tolist() == PERFORMANCE_COLUMNS
+    assert summary['window_days'].tolist() == [0, 3]
+    whole = summary.iloc[0]
+    scored = predictions.iloc[:9]
+    assert whole['predictions'] == 9
+    assert np.isclose(whole['accuracy'], (scored['prediction'] == scored['feedback']).mean())
+    assert np.isclose(whole['precision'], 4 / 6)
+    assert np.isclose(whole['hit_rate'], 4 / 5)
+    # The window ends at the last scored day
+    recent = summary.iloc[1]
+    assert (recent['start_date'], recent['end_date']) == (pd.Timestamp('2024-01-07').date(),
+                                                          pd.Timestamp('2024-01-09').date())
+    assert recent['predictions'] == 3
+    assert np.isclose(recent['accuracy'], 2 / 3)
+
+    # A model without scored predictions keeps its rows, with missing metrics
+    summary = rolling_performance(daily_outcomes(predictions.iloc[:1], days=predictions.iloc[:1].assign(ticker='MSFT')),
+                                  windows=(3,))
+    assert summary['predictions'].tolist() == [0]
+    assert summary[['accuracy', 'precision', 'hit_rate']].isna().all(axis=None)
+
+
+def make_database(**kwargs):
+    # Two queued changes of AAPL on 2024-01-02, the rows of the day and the counts stored for AAPL
+    day = datetime.date(2024, 1, 2)
+    responses = {
+        'FROM prediction_changes': [(7, 'trained_model:v1', 'AAPL', day), (9, 'trained_model:v1', 'AAPL', day)],
+        'FROM "stocks_predictions"': [(day, 'AAPL', 1, 1.0, 'trained_model:v1'),
+                                      (day, 'AAPL', 0, 1.0, 'trained_model:v1')],
+        'FROM prediction_outcomes': [('trained_model:v1', 'AAPL', datetime.date(2024, 1, 1), 1, 0, 0, 0),
+                                     ('trained_model:v1', 'AAPL', day, 1, 0, 0, 1)],
+    }
+    return FakeConnection(responses=responses, **kwargs)
+
+
+def test_refresh_performance():
+    connection = make_database()
+
+    assert refresh_performance(connection, windows=(0,)) == 2
+    statements = connection.statements
+    # The queued days are counted, written, then the summary, and the queue is emptied last
+    outcomes = pd.read_csv(io.StringIO(connection.copies[0]), header=None)
+    assert outcomes.values.tolist() == [['trained_model:v1', 'AAPL', '2024-01-02', 1, 0, 0, 1]]
+    summary = pd.read_csv(io.StringIO(connection.copies[1]), header=None, names=PERFORMANCE_COLUMNS)
+    assert summary[['ticker', 'window_days', 'predictions', 'accuracy']].values.tolist() == [['AAPL', 0, 3, 2 / 3]]
+    delete = next(i for i, statement in enumerate(statements) if statement.startswith('DELETE FROM prediction_changes'))
+    assert delete > max(i for i, statement in enumerate(statements) if 'INSERT INTO "prediction_performance"' in statement)
+    assert connection.params[delete] == (9,)
+    assert connection.committed
+    assert statements[-1] == 'SELECT pg_advisory_unlock(%s)'
+
+
+def test_refresh_performance_failed_write():
+    # The outcomes are not written: the queue is kept for the next refresh
+    connection = make_database(fail_on='INSERT INTO "prediction_outcomes"')
+
+    with pytest.raises(ValueError):
+        refresh_performance(connection)
+    assert connection.rolled_back
+    assert not any(statement.startswith('DELETE') for statement in connection.statements)
+    assert not any('"prediction_performance"' in statement for statement in connection.statements)
+    assert connection.statements[-1] == 'SELECT pg_advisory_unlock(%s)'
+
+
+def test_update_data_refreshes_performance():
+    connection = make_database()
+    update_data(connection, 'stocks_predictions', sql.SQL("feedback = 1"), sql.SQL("date = '2024-01-02'"))
+    assert any(statement.startswith('DELETE FROM prediction_changes') for statement in connection.statements)
+
+    # The other tables are not summarized
+    connection = make_database()
+    update_data(connection, 'other_table', sql.SQL("feedback = 1"))
+    assert not any('prediction_changes' in statement for statement in connection.statements)
+
+
+def test_select_performance_before_migrations():
+    # The summary table is created by a migration, a reader finds no data before it
+    connection = FakeConnection(fail_on='prediction_performance', error=psycopg2.errors.UndefinedTable)
+    assert select_performance(connection, tickers=['AAPL']) is None
+    assert connection.rolled_back
@@ -0,0 +1,38 @@
+import os
+import sys
+import pytest
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.utils.utils import save_data, load_data
+
+
+@pytest.fixture
+def stock_data():
+    index = pd.date_range(start='2024-01-01', periods=5, freq='D', name='Date')
+    return pd.DataFrame({'Open': [1.0, 2.0, 3.0, 4.0, 5.0],
+                         'Close': [1.5, 2.5, 3.5, 4.5, 5.5],
+                         'Volume': [10, 20, 30, 40, 50]}, index=index)
+
+
+def test_save_data_parquet(stock_data, tmp_path):
+    path = save_data(stock_data, str(tmp_path / 'stock.csv'), 'parquet')
+    assert path.endswith('stock.parquet')
+
+    # Typed columns are stored with a datetime index
+    stored = pd.read_parquet(path)
+    assert isinstance(stored.index, pd.DatetimeIndex)
+    assert stored['Open'].dtype == 'float32'
+    assert stored['Volume'].dtype == 'int64'
+
+    # The date is returned as a column, as when reading the CSV format
+    data = load_data(path)
+    assert data.columns.tolist() == load_data(save_data(stock_data, str(tmp_path / 'stock'), 'csv')).columns.tolist()
+    assert pd.api.types.is_datetime64_any_dtype(data['Date'])
+    assert data['Close'].tolist() == stock_data['Close'].tolist()
+
+
+def test_save_data_unsupported_format(stock_data, tmp_path):
+    with pytest.raises(ValueError):
+        save_data(stock_data, str(tmp_path / 'stock'), 'json')
@@ -0,0 +1,56 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.visualization.downsample import ChartDownsampler, lttb, minmax_indices
+
+
+def test_lttb():
+    rng = np.random.default_rng(0)
+    y = np.cumsum(rng.normal(0, 1, 10000))
+    y[4321] = 1000
+
+    indices = lttb(np.arange(10000), y, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 9999
+    assert np.all(np.diff(indices) > 0)
+    # A spike is kept
+    assert 4321 in indices
+    np.testing.assert_array_equal(lttb(np.arange(50), y[:50], 100), np.arange(50))
+
+
+def test_minmax_indices():
+    y = np.array([3, 1, 2, 5, np.nan, 4, 0, 6, 7])
+
+    np.testing.assert_array_equal(minmax_indices(y, 3), [0, 1, 3, 5, 6, 8])
+
+
+def test_chart_downsampler():
+    rng = np.random.default_rng(1)
+    index = pd.date_range('2000-01-01', periods=200000, freq='min')
+    y = np.cumsum(rng.normal(0, 1, len(index)))
+    downsampler = ChartDownsampler(index, y)
+
+    # The whole series is drawn from a precomputed level
+    indices = downsampler.window_indices(width=400)
+    assert len(downsampler.levels) > 2
+    assert len(indices) == 400
+    assert indices[0] == 0 and indices[-1] == len(index) - 1
+
+    # A window is drawn with its bounds, and is cached
+    start, end = pd.Timestamp('2000-02-01'), pd.Timestamp('2000-02-10')
+    indices = downsampler.window_indices(start, end, width=400)
+    window = np.flatnonzero((index >= start) & (index <= end))
+    assert len(indices) == 400
+    assert (indices[0], indices[-1]) == (window[0], window[-1])
+    # Close to the shape of the window: its range is drawn
+    assert y[indices].max() - y[indices].min() > 0.95 * (y[window].max() - y[window].min())
+    assert downsampler.window_indices(start, end, width=400) is indices
+
+    # A window smaller than the chart is drawn entirely
+    indices = downsampler.window_indices(index[10], index[109], width=400)
+    np.testing.assert_array_equal(indices, np.arange(10, 110))
@@ -0,0 +1,75 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, parent_dir)
+from src.data_ingestion.price_sources import LocalPriceSource
+from src.visualization.market_data import MarketData
+
+
+class RecordingSource(LocalPriceSource):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.requests = []
+
+    def fetch(self, stock_name, start_date, end_date):
+        self.requests.append(start_date)
+        return super().fetch(stock_name, start_date, end_date)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_bars(days):
+    # Daily bars up to the last business day before today
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize() - pd.Timedelta(days=1), periods=days, name='Date')
+    close = 100 + np.arange(days, dtype=float)
+    return pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close,
+                         'Volume': np.arange(days) + 1000}, index=index)
+
+
+def test_market_data(tmp_path):
+    bars = make_bars(30)
+    os.makedirs(tmp_path / 'source')
+    os.makedirs(tmp_path / 'store')
+    bars.to_csv(tmp_path / 'source' / 'AAPL.csv')
+    bars.iloc[:20].to_csv(tmp_path / 'store' / 'AAPL.csv')
+    source, clock = RecordingSource(str(tmp_path / 'source')), Clock()
+    market_data = MarketData(source, store=LocalPriceSource(str(tmp_path / 'store')),
+                             start_date=str(bars.index[0].date()), ttl=60, clock=clock)
+
+    # The history is read from the store, only the bars from its last day are fetched
+    history = market_data.history('AAPL')
+    pd.testing.assert_frame_equal(history, bars, check_freq=False)
+    assert source.requests == [str(bars.index[19].date())]
+
+    # Cached until the TTL expires
+    clock.now = 59
+    assert market_data.latest('AAPL')['Close'] == bars['Close'].iloc[-1]
+    assert (market_data.fetches, market_data.hits) == (1, 1)
+
+    # The last bar changed and a new one is available: only the last cached day onwards is fetched
+    updated = pd.concat([bars, make_bars(1).set_axis([bars.index[-1] + pd.Timedelta(days=1)], axis=0)])
+    updated.iloc[-2, updated.columns.get_loc('Close')] = 500
+    updated.index.name = 'Date'
+    updated.to_csv(tmp_path / 'source' / 'AAPL.csv')
+    clock.now = 61
+    history = market_data.history('AAPL')
+    assert source.requests[-1] == str(bars.index[-1].date())
+    assert len(history) == 31
+    assert history['Close'].iloc[-2] == 500
+    assert history.index.is_monotonic_increasing and history.index.is_unique
+
+    # Without a store, the whole history is fetched once
+    market_data = MarketData(source, start_date=str(bars.index[0].date()), ttl=60, clock=clock)
+    assert len(market_data.history('AAPL')) == 31
+    market_data.invalidate()
+    market_data.history('AAPL')
+    assert market_data.fetches == 2